@@ -0,0 +1,93 @@
+"""
+Alert matching benchmark - messages/sec for the substring scan vs the compiled AlertMatcher
+
+Usage: python benchmarks/alert_matching.py [--messages 100000] [--extra-keywords 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared.alerts import AlertMatcher, DEFAULT_KEYWORDS
+
+FILLER = (
+    "I took my medication this morning and had breakfast . the walk was helpful and my "
+    "daughter visited yesterday afternoon spain painting helpless emergencies today I slept "
+    "well my appetite is fine the weather is nice thank you for checking in"
+).split()
+
+SYMPTOMS = ['chest pain', 'dizzy', 'nausea', 'pain', 'help', 'severe pain', 'vomiting', 'hurts']
+NEGATIONS = ['no', 'not', "don't have", 'without']
+
+
+def legacy_classify(message, keywords):
+    """The original check: lowercase, then a substring scan per keyword"""
+    message_lower = message.lower()
+    if any(keyword in message_lower for keyword in keywords['high']):
+        return 'high'
+    if any(keyword in message_lower for keyword in keywords['medium']):
+        return 'medium'
+    return None
+
+
+def make_corpus(count, seed=7):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(FILLER, k=rng.randint(8, 40))
+        roll = rng.random()
+        if roll < 0.10:
+            words.insert(rng.randrange(len(words)), rng.choice(SYMPTOMS))
+        elif roll < 0.15:
+            words.insert(rng.randrange(len(words)), f"{rng.choice(NEGATIONS)} {rng.choice(SYMPTOMS)}")
+        elif roll < 0.17:
+            words.insert(rng.randrange(len(words)), 'please tell the nurse')
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def synthetic_keywords(extra, seed=11):
+    rng = random.Random(seed)
+    keywords = {priority: list(words) for priority, words in DEFAULT_KEYWORDS.items()}
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    keywords.setdefault('low', [])
+    for _ in range(extra):
+        keywords['low'].append(''.join(rng.choices(letters, k=rng.randint(5, 10))) + ' ' +
+                               ''.join(rng.choices(letters, k=rng.randint(4, 8))))
+    return keywords
+
+
+def timed(label, fn, corpus):
+    start = time.perf_counter()
+    flagged = sum(1 for message in corpus if fn(message))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {len(corpus) / elapsed:>12,.0f} msgs/sec  {flagged:>7} flagged")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--extra-keywords', type=int, default=500, help='synthetic keywords for the scaling run')
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages)
+    print(f"{len(corpus)} synthetic messages\n")
+
+    print(f"Default keyword set ({sum(len(v) for v in DEFAULT_KEYWORDS.values())} keywords)")
+    timed('substring scan', lambda m: legacy_classify(m, DEFAULT_KEYWORDS), corpus)
+    matcher = AlertMatcher()
+    timed('compiled matcher', matcher.classify, corpus)
+
+    keywords = synthetic_keywords(args.extra_keywords)
+    all_keywords = {'high': keywords['high'], 'medium': keywords['medium'] + keywords['low']}
+    print(f"\nLarge keyword set ({sum(len(v) for v in keywords.values())} keywords)")
+    timed('substring scan', lambda m: legacy_classify(m, all_keywords), corpus)
+    timed('compiled matcher', AlertMatcher(keywords).classify, corpus)
+
+
+if __name__ == '__main__':
+    main()
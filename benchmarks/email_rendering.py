@@ -0,0 +1,97 @@
+"""
+Email rendering benchmark - welcome emails/sec at bulk discharge batch sizes
+
+Usage: python benchmarks/email_rendering.py [--sizes 1000,10000,100000] [--per-send-max 10000]
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared import email_templates
+from shared.email_templates import format_medications, inline_css
+
+CONDITIONS = ['Type 2 diabetes', 'Hypertension', 'Asthma', 'COPD', 'Heart failure', 'Post-op knee replacement']
+MEDICATIONS = [('Metformin', '500mg', 'twice daily'), ('Lisinopril', '10mg', 'once daily'),
+               ('Salbutamol', '100mcg', 'as needed'), ('Furosemide', '40mg', 'every morning'),
+               ('Paracetamol', '1g', 'four times daily')]
+SUMMARY = ("Dear patient, welcome to your post-hospital care system. Your care team has set up Prof.Dux "
+           "to help with your medications and recovery. ") * 4
+
+with open(os.path.join(email_templates.EMAIL_TEMPLATE_DIR, 'welcome.html'), encoding='utf-8') as f:
+    WELCOME_SOURCE = f.read()
+
+
+def make_batch(count, seed=5):
+    rng = random.Random(seed)
+    batch = []
+    for i in range(count):
+        medications = [{'name': n, 'dosage': d, 'frequency': f}
+                       for n, d, f in rng.sample(MEDICATIONS, rng.randint(0, 4))]
+        batch.append({
+            'hospital_name': 'General Hospital',
+            'medical_summary': SUMMARY,
+            'patient_id': f"P{i:06d}",
+            'password': ''.join(rng.choices(string.ascii_letters + string.digits, k=12)),
+            'magic_link': f"https://care.example.com/magic-login?token={rng.getrandbits(128):032x}",
+            'magic_token': f"{rng.getrandbits(128):032x}",
+            'conditions': ', '.join(rng.sample(CONDITIONS, rng.randint(1, 3))),
+            'medications': medications,
+            'allergies': rng.choice(['None known', 'Penicillin', 'Latex, Peanuts']),
+            'discharge_plan': 'Follow-up with your GP in 2 weeks; keep the wound dry.'
+        })
+    return batch
+
+
+def per_send_inlining(values):
+    """Inline the CSS and parse the template for every email, as a send-time inliner would"""
+    values = dict(values, medication_list=format_medications(values.pop('medications')))
+    return email_templates.EmailTemplate('welcome', WELCOME_SOURCE).render(**values)
+
+
+INLINED = string.Template(inline_css(WELCOME_SOURCE))
+
+
+def template_substitute(values):
+    """CSS inlined once, but the template text re-scanned for placeholders per email"""
+    values = dict(values, medication_list=format_medications(values.pop('medications')))
+    return INLINED.substitute(values)
+
+
+def precompiled(values):
+    values = dict(values, medication_list=format_medications(values.pop('medications')))
+    return email_templates.render('welcome', **values)
+
+
+def timed(label, fn, batch):
+    start = time.perf_counter()
+    size = sum(len(fn(dict(values))) for values in batch)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {len(batch) / elapsed:>10,.0f} emails/sec  {elapsed / len(batch) * 1e6:>8.1f} us/email  "
+          f"{size / len(batch) / 1024:.1f} KiB/email")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated batch sizes')
+    parser.add_argument('--per-send-max', type=int, default=10000,
+                        help='largest batch to run with per-send inlining (it is slow)')
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        batch = make_batch(size)
+        print(f"{size} welcome emails")
+        if size <= args.per_send_max:
+            timed('per-send CSS inlining', per_send_inlining, batch)
+        timed('string.Template substitute', template_substitute, batch)
+        timed('precompiled template', precompiled, batch)
+        print()
+
+
+if __name__ == '__main__':
+    main()
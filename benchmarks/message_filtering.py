@@ -0,0 +1,152 @@
+"""
+Message filtering benchmark - transcript messages/sec for the legacy display filters vs the compiled MessageFilter
+
+Usage: python benchmarks/message_filtering.py [--messages 200000] [--transcript recorded.jsonl]
+
+A recorded transcript is a JSONL file of serialized Letta messages
+({"id": ..., "message_type": ..., "content": ...}), for example a dump of
+LettaClient.get_agent_messages; without one a synthetic transcript is used.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared.message_filter import MessageFilter
+
+REPLIES = [
+    "Hello Jane! I'm Prof.Dux. How are you feeling after your discharge today?",
+    "Remember to take your Metformin 500mg twice daily with meals, and keep an eye on your blood sugar.",
+    "That sounds like normal tiredness after a hospital stay, but please tell your nurse if it gets worse.",
+    "**Assistant:** Gentle walks are a good idea; start with ten minutes and build up slowly.",
+    "Great question! Your discharge plan says to follow up with your GP in two weeks.",
+]
+INTERNAL = [
+    "I should update my core memory with the patient's new symptom.",
+    "No need to search archival memory, I can answer using the discharge plan.",
+    "Saving this to archival memory for later.",
+    '{"type": "function_call", "name": "core_memory_append"}',
+    "Done.",
+]
+PATIENT = [
+    "Patient Jane Doe says: I feel a bit dizzy this morning",
+    "Patient Jane Doe says: should I take my tablets before or after breakfast?",
+    "**You:** thank you, that helps",
+    "Patient Jane Doe says: I should probably rest more, right?",
+]
+REASONING = [
+    "The patient is asking about medication timing. I should check the discharge plan.",
+    "User seems anxious; respond warmly and mention the nurse.",
+]
+NURSE = "📋 **CARE INSTRUCTION FROM NURSE:** Please remind Jane to drink plenty of water."
+
+
+def legacy_display(raw_messages):
+    """The original _format_messages_for_display"""
+    formatted_messages = []
+    for msg in raw_messages:
+        msg_type = msg.get('message_type', '')
+        content = msg.get('content', '')
+        if (msg_type == 'reasoning_message' or
+            not content or
+            content.strip() == '' or
+            'More human than human is our motto' in content or
+            content.strip().startswith('{') and 'type' in content):
+            continue
+        if content.startswith('📋 **CARE INSTRUCTION FROM NURSE:**'):
+            formatted_messages.append({
+                'role': 'system',
+                'text': content.replace('📋 **CARE INSTRUCTION FROM NURSE:** ', 'Nurse: ')
+            })
+        elif msg_type == 'user_message':
+            clean_text = content.replace('**You:**', '').strip()
+            if not clean_text.startswith('{'):
+                formatted_messages.append({'role': 'user', 'text': clean_text})
+        elif (msg_type == 'assistant_message' and
+              not any(skip_phrase in content.lower() for skip_phrase in [
+                  'core memory', 'archival memory', 'system_alert', 'i should'
+              ])):
+            clean_text = content.replace('**Assistant:**', '').strip()
+            if clean_text and len(clean_text) > 10:
+                formatted_messages.append({'role': 'assistant', 'text': clean_text})
+    return formatted_messages
+
+
+def legacy_response(messages):
+    """The original _filter_agent_response, minus the response wrapper"""
+    kept = []
+    for msg in messages:
+        msg_type = msg.get('message_type', '')
+        content = msg.get('content', '')
+        if (msg_type == 'assistant_message' and
+            content and
+            not any(skip_phrase in content.lower() for skip_phrase in [
+                'core memory', 'archival memory', 'system_alert', 'no need to',
+                'i can answer using', 'i should'
+            ]) and
+            not content.strip().startswith('{')):
+            kept.append(msg)
+    return kept
+
+
+def make_transcript(count, seed=3):
+    rng = random.Random(seed)
+    transcript = []
+    while len(transcript) < count:
+        transcript.append({'message_type': 'user_message', 'content': rng.choice(PATIENT)})
+        transcript.append({'message_type': 'reasoning_message', 'content': rng.choice(REASONING)})
+        if rng.random() < 0.3:
+            transcript.append({'message_type': 'assistant_message', 'content': rng.choice(INTERNAL)})
+        transcript.append({'message_type': 'assistant_message', 'content': rng.choice(REPLIES)})
+        if rng.random() < 0.02:
+            transcript.append({'message_type': 'system_message', 'content': NURSE})
+    for i, msg in enumerate(transcript):
+        msg['id'] = f"message-{i}"
+    return transcript[:count]
+
+
+def load_transcript(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def timed(label, fn, transcript):
+    start = time.perf_counter()
+    shown = len(fn(transcript))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<30} {len(transcript) / elapsed:>12,.0f} msgs/sec  {shown:>8} shown")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--transcript', help='recorded transcript (JSONL) to use instead of a synthetic one')
+    args = parser.parse_args()
+
+    transcript = load_transcript(args.transcript) if args.transcript else make_transcript(args.messages)
+    print(f"{len(transcript)} transcript messages\n")
+    message_filter = MessageFilter()
+
+    print("History display")
+    timed('legacy display filter', legacy_display, transcript)
+    timed('MessageFilter', message_filter.for_display, transcript)
+
+    print("\nLive agent reply")
+    timed('legacy response filter', legacy_response, transcript)
+    timed('MessageFilter', message_filter.agent_replies, transcript)
+
+    # Replies the old live filter showed but a reload of the history hid (or the other way round)
+    display_ids = {id(m) for m in transcript if legacy_display([m])}
+    response_ids = {id(m) for m in legacy_response(transcript)}
+    assistant_ids = {id(m) for m in transcript if m.get('message_type') == 'assistant_message'}
+    disagreements = len((display_ids ^ response_ids) & assistant_ids)
+    print(f"\nAgent replies the two legacy filters disagree on: {disagreements}; MessageFilter: 0 by construction")
+
+
+if __name__ == '__main__':
+    main()
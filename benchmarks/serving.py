@@ -0,0 +1,213 @@
+"""
+Serving benchmark - chat and health requests/sec under concurrent load, Flask dev server vs gunicorn
+
+Usage: python benchmarks/serving.py [--requests 400] [--concurrency 32] [--letta-latency 0.5] [--workers 2] [--threads 32]
+
+Each server runs the real app against a fake Letta server that answers every
+message after --letta-latency seconds, standing in for the agent's LLM step.
+Patients are seeded into /app/data (and removed afterwards), so run this in a
+scratch container, not next to real data. Finally each server is sent SIGTERM
+with chats in flight, to count how many of them still get their reply.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from shared.models import Patient, SimpleStorage
+
+DATA_FILE = '/app/data/data.json'
+SECRET_KEY = 'serving-benchmark'
+MESSAGE_PATH = re.compile(r'^/v1/agents/([^/]+)/messages/?$')
+
+
+def fake_letta(latency):
+    """A Letta server whose agents reply to every message after ``latency`` seconds"""
+    count = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if not MESSAGE_PATH.match(self.path):
+                return self._reply(404, {'detail': 'Not found'})
+            time.sleep(latency)
+            with lock:
+                count[0] += 1
+                message_id = f"message-{count[0]}"
+            self._reply(200, {
+                'messages': [{'id': message_id, 'date': '2026-01-01T00:00:00Z', 'message_type': 'assistant_message',
+                              'content': 'Please keep taking your tablets with food and rest today.'}],
+                'usage': {'message_type': 'usage_statistics', 'completion_tokens': 12, 'prompt_tokens': 900,
+                          'total_tokens': 912, 'step_count': 1}
+            })
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.handle_error = lambda request, client_address: None  # Clients hung up on by a stopped server
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed_patients(count):
+    storage = SimpleStorage(DATA_FILE, shared=True)
+    patients = []
+    for i in range(count):
+        patient = Patient(name=f"Load Test Patient {i}", email=f"loadtest{i}@example.com", conditions=[],
+                          medications=[], allergies=[], discharge_plan='Rest', patient_id=f"loadtest-{i}",
+                          agent_id=f"agent-loadtest-{i}", context_primed=True)
+        storage.add_patient(patient)
+        patients.append(patient)
+    return patients
+
+
+def remove_patients(patients):
+    storage = SimpleStorage(DATA_FILE, shared=True)
+    for patient in patients:
+        storage.delete_patient(patient.name)
+
+
+def session_cookie(patient_id):
+    signer = Flask(__name__)
+    signer.secret_key = SECRET_KEY
+    return SecureCookieSessionInterface().get_signing_serializer(signer).dumps(
+        {'role': 'patient', 'patient_id': patient_id})
+
+
+def start_server(mode, port, letta_url, args):
+    env = dict(os.environ, FLASK_ENV='production', SECRET_KEY=SECRET_KEY, LETTA_SERVER_URL=letta_url,
+               EMAIL_TRANSPORT='fake', AGENT_POOL_SIZE='0', RETENTION_INTERVAL='0', STORAGE_SHARED='true',
+               ACCESS_LOG='/dev/null', LETTA_MAX_CONNECTIONS='128', LETTA_MAX_KEEPALIVE='64')
+    if mode == 'dev':
+        # What `python src/app.py` ran with FLASK_ENV=production before gunicorn
+        command = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, debug=False)"]
+    else:
+        command = ['gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'), '--bind', f"127.0.0.1:{port}",
+                   '--workers', str(args.workers), '--threads', str(args.threads)]
+    process = subprocess.Popen(command, cwd=os.path.join(ROOT, 'src'), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not come up on port {port}")
+
+
+def run_load(base_url, sessions, total, concurrency, kind):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'http'):
+            local.http = requests.Session()
+        start = time.perf_counter()
+        try:
+            if kind == 'chat':
+                response = local.http.post(f"{base_url}/api/send_message", json={'message': 'Can I eat before my tablets?'},
+                                           cookies={'session': sessions[i % len(sessions)]}, timeout=120)
+            else:
+                response = local.http.get(f"{base_url}/health", timeout=120)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for ok, latency in results if ok)
+    failed = sum(1 for ok, _ in results if not ok)
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"    {kind:<8} {total / elapsed:>9,.1f} req/sec  p50 {p50:>7.0f} ms  p95 {p95:>7.0f} ms  {failed} failed")
+
+
+def drain_on_sigterm(process, base_url, sessions, concurrency):
+    """Send SIGTERM with chats in flight; return how many still got their reply"""
+    with ThreadPoolExecutor(concurrency) as pool:
+        futures = [pool.submit(requests.post, f"{base_url}/api/send_message",
+                               json={'message': 'Is it normal to feel tired?'},
+                               cookies={'session': sessions[i % len(sessions)]},
+                               timeout=120)
+                   for i in range(concurrency)]
+        time.sleep(0.2)
+        process.send_signal(signal.SIGTERM)
+        completed = 0
+        for future in futures:
+            try:
+                completed += future.result().status_code == 200
+            except requests.RequestException:
+                pass
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--letta-latency', type=float, default=0.5, help='seconds the fake agent takes per reply')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--port', type=int, default=5111)
+    args = parser.parse_args()
+
+    letta = fake_letta(args.letta_latency)
+    letta_url = f"http://127.0.0.1:{letta.server_address[1]}"
+    patients = seed_patients(args.concurrency)
+    sessions = [session_cookie(patient.patient_id) for patient in patients]
+    print(f"{args.requests} requests, {args.concurrency} concurrent clients, "
+          f"{args.letta_latency:g}s agent latency\n")
+    try:
+        for mode, label in (('dev', 'Flask dev server'),
+                            ('gunicorn', f"gunicorn, {args.workers} workers x {args.threads} threads")):
+            base_url = f"http://127.0.0.1:{args.port}"
+            process = start_server(mode, args.port, letta_url, args)
+            try:
+                print(f"  {label}")
+                run_load(base_url, sessions, args.requests, args.concurrency, 'chat')
+                run_load(base_url, sessions, args.requests * 10, args.concurrency, 'health')
+                completed = drain_on_sigterm(process, base_url, sessions, args.concurrency)
+                print(f"    SIGTERM with {args.concurrency} chats in flight: {completed} got their reply\n")
+                process.wait(timeout=120)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+    finally:
+        remove_patients(patients)
+        letta.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Storage write benchmark - alert writes/sec for each SimpleStorage persistence mode
+
+Usage: python benchmarks/storage_writes.py [--patients 2000] [--alerts 500] [--window 0.05]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared.models import Patient, Medication, SimpleStorage
+
+
+class LegacyStorage(SimpleStorage):
+    """The original in-place rewrite: no temp file, no fsync"""
+    
+    def _save_data(self):
+        with open(self.filename, 'w') as f:
+            json.dump(self.data, f, indent=2)
+
+
+MODES = [
+    ('legacy in-place rewrite', LegacyStorage, {}),
+    ('atomic rewrite, fsync per write', SimpleStorage, {}),
+    ('atomic rewrite, batched', SimpleStorage, {'flush_interval': None}),
+    ('journal, fsync per write', SimpleStorage, {'journal': True}),
+    ('journal, batched fsync', SimpleStorage, {'journal': True, 'flush_interval': None}),
+]
+
+
+def seed(filename: str, patients: int):
+    storage = SimpleStorage(filename)
+    for i in range(patients):
+        storage.data['patients'].append(Patient(
+            name=f"Patient {i}",
+            email=f"patient{i}@example.com",
+            patient_id=f"P{i:06d}",
+            conditions=['Hypertension'],
+            medications=[Medication('Lisinopril', '10mg', 'daily')],
+            allergies=['Penicillin'],
+            discharge_plan='Follow up in two weeks'
+        ).to_dict())
+    storage._save_data()
+
+
+def run(label, cls, kwargs, patients, alerts, window):
+    workdir = tempfile.mkdtemp()
+    filename = os.path.join(workdir, 'data.json')
+    seed(filename, patients)
+    kwargs = {k: (window if v is None else v) for k, v in kwargs.items()}
+    storage = cls(filename, compact_threshold=1 << 40, **kwargs)
+    
+    start = time.perf_counter()
+    for i in range(alerts):
+        storage.add_alert(f"Patient {i % patients}", f"Concerning symptoms reported: pain #{i}", 'medium')
+    storage.flush()
+    elapsed = time.perf_counter() - start
+    
+    reloaded = SimpleStorage(filename, journal=kwargs.get('journal', False))
+    assert len(reloaded.get_alerts()) == alerts
+    print(f"{label:<34} {alerts / elapsed:>10.1f} writes/sec  ({elapsed * 1000 / alerts:.3f} ms/write)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--alerts', type=int, default=500)
+    parser.add_argument('--window', type=float, default=0.05, help='durability window in seconds')
+    args = parser.parse_args()
+    
+    print(f"{args.patients} patients, {args.alerts} alerts, {args.window * 1000:.0f} ms durability window\n")
+    for label, cls, kwargs in MODES:
+        run(label, cls, kwargs, args.patients, args.alerts, args.window)
+
+
+if __name__ == '__main__':
+    main()
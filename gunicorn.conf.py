@@ -0,0 +1,66 @@
+"""
+Gunicorn configuration - the production server for the care system
+
+Usage: gunicorn --config gunicorn.conf.py
+
+Chats spend seconds waiting on the agent, so each worker process serves
+WEB_THREADS requests at once (gthread). Every open nurse alert stream and
+streaming chat holds a thread while it lasts.
+"""
+
+import os
+import signal
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+wsgi_app = 'app:app'
+bind = os.getenv('BIND', '0.0.0.0:5011')
+
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_WORKERS', '2'))
+threads = int(os.getenv('WEB_THREADS', '32'))
+keepalive = 5
+# Seconds a stopping worker gets to finish in-flight chats before it is killed
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '90'))
+# Each worker imports the app itself, after the fork, so it builds its own Letta
+# connection pool, Brevo client thread pool and SQLite connections
+preload_app = False
+
+accesslog = os.getenv('ACCESS_LOG', '-')
+errorlog = '-'
+
+# The app starts its background threads from post_worker_init instead of on import
+os.environ['START_BACKGROUND_SERVICES'] = 'false'
+
+
+def on_starting(server):
+    # data.json is only safe to share between processes in shared mode, and the journal
+    # lets each chat turn's last_message_id reach the other workers without a full rewrite
+    if server.cfg.workers > 1 and os.getenv('STORAGE_ENGINE', 'json').lower() == 'json':
+        os.environ.setdefault('STORAGE_SHARED', 'true')
+        os.environ.setdefault('STORAGE_JOURNAL', 'true')
+        if os.environ['STORAGE_SHARED'].lower() != 'true':
+            server.log.warning(f"⚠️ {server.cfg.workers} workers share data.json without STORAGE_SHARED=true; "
+                               "they will overwrite each other's changes")
+
+
+def post_worker_init(worker):
+    import app
+
+    app.start_background_services()
+
+    # SIGTERM stops the worker accepting requests; also tell the app, so alert
+    # streams end and /health reports draining while in-flight chats finish
+    stop_worker = signal.getsignal(signal.SIGTERM)
+
+    def begin_shutdown(signum, frame):
+        app.shutting_down.set()
+        stop_worker(signum, frame)
+
+    signal.signal(signal.SIGTERM, begin_shutdown)
+
+
+def worker_exit(server, worker):
+    # In-flight requests have finished (or graceful_timeout ran out); stop the background threads
+    import app
+
+    app.shutdown(timeout=10)
@@ -1,6 +1,14 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
 import os
+import datetime
+import fcntl
+import json
 import logging
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,6 +29,19 @@ else:
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 
+# Pagination for the nurse dashboard and JSON list APIs
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '50'))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+PATIENT_PRIVATE_FIELDS = ('password', 'magic_token', 'token_expires')
+# Letta messages per page of patient chat history (hidden reasoning messages count too)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '20'))
+
+# Set once this process starts shutting down: long-lived streams end and /health reports draining
+shutting_down = threading.Event()
+_chats_in_flight = 0  # Patient messages waiting on their agent's reply in this process
+_chats_changed = threading.Condition()
+
 # Production security settings
 if os.getenv('FLASK_ENV') == 'production':
     app.config.update(
@@ -30,15 +51,34 @@ if os.getenv('FLASK_ENV') == 'production':
         PERMANENT_SESSION_LIFETIME=3600,  # 1 hour
     )
 
+# Create data directory if it doesn't exist
+os.makedirs('/app/data', exist_ok=True)
+os.makedirs('/app/logs', exist_ok=True)
+os.makedirs('/app/data/imports', exist_ok=True)
+
 # Initialize clients
 try:
     from shared.letta_client import LettaClient
-    from shared.models import Patient, Medication, SimpleStorage
+    from shared.models import Patient, Medication, create_storage
     from shared.email_service import EmailService
+    from shared.jobs import JobQueue
+    from shared.bulk_import import BulkImporter, iter_rows, detect_format
+    from shared.alerts import AlertMatcher
+    from shared.archive import Archive, ARCHIVE_KINDS
+    from shared.resilience import CircuitOpenError
+    from shared.agent_pool import AgentPool
+    from shared.outbox import EmailOutbox
+    from shared.message_filter import MessageFilter
     
     letta_client = LettaClient()
-    storage = SimpleStorage(filename='/app/data/data.json')  # Persistent storage location
+    storage = create_storage('/app/data')  # Persistent storage location
     email_service = EmailService()
+    # Alert keywords per priority; edits to this file are picked up without a restart
+    alert_matcher = AlertMatcher(keywords_file=os.getenv('ALERT_KEYWORDS_FILE', '/app/data/alert_keywords.json'))
+    # Which chat messages patients see; the same rules for live replies and history
+    message_filter = MessageFilter(rules_file=os.getenv('MESSAGE_FILTER_FILE', '/app/data/message_filter.json'))
+    # Expired alerts and nurse instructions, kept compressed for audits
+    archive = Archive(os.getenv('ARCHIVE_DIR', '/app/data/archive'))
     
     app.logger.info("✅ System initialized successfully")
 except Exception as e:
@@ -48,10 +88,9 @@ except Exception as e:
     letta_client = None
     storage = None
     email_service = None
-
-# Create data directory if it doesn't exist
-os.makedirs('/app/data', exist_ok=True)
-os.makedirs('/app/logs', exist_ok=True)
+    alert_matcher = None
+    message_filter = None
+    archive = None
 
 @app.route('/health')
 def health_check():
@@ -59,14 +98,22 @@ def health_check():
     try:
         # Check if core services are available
         health_status = {
-            'status': 'healthy',
+            'status': 'draining' if shutting_down.is_set() else 'healthy',
             'letta_client': bool(letta_client),
             'storage': bool(storage),
             'email_service': bool(email_service and email_service.api_instance),
+            'letta_circuit': letta_client.breaker.state if letta_client else None,
+            'agent_pool_ready': agent_pool.size() if agent_pool else None,
+            'email_outbox_depth': email_outbox.depth() if email_outbox else None,
+            'chats_in_flight': _chats_in_flight,
+            'pid': os.getpid(),
             'timestamp': str(datetime.datetime.now())
         }
         
-        if all([letta_client, storage, email_service]):
+        if shutting_down.is_set():
+            # Tell the load balancer to stop routing here while in-flight chats finish
+            return jsonify(health_status), 503
+        if all([letta_client, storage, email_service]) and health_status['letta_circuit'] == 'closed':
             return jsonify(health_status), 200
         else:
             health_status['status'] = 'degraded'
@@ -191,22 +238,54 @@ def nurse_dashboard():
     if not storage:
         return jsonify({"error": "Storage not initialized"}), 500
         
-    patients = storage.get_patients()
-    alerts = storage.get_alerts()
+    # Read the sequence first: anything that changes after it is replayed by the alert feed
+    alert_seq = storage.get_alert_seq()
+    # Only the first page of patients is rendered; the page fetches the rest as it scrolls
+    page = storage.query_patients(limit=DASHBOARD_PAGE_SIZE)
+    alerts = storage.get_alerts()  # Bounded by MAX_ALERTS
     stats = storage.get_statistics()
     
     return render_template('nurse.html', 
-                         patients=patients, 
+                         patients=page['items'], 
+                         next_cursor=page['next_cursor'],
                          alerts=alerts,
+                         alert_seq=alert_seq,
                          stats=stats)
 
+@app.route('/nurse/patient_cards')
+def nurse_patient_cards():
+    """Render the next page of patient cards; the following cursor is in X-Next-Cursor"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'Storage not initialized'}), 500
+    
+    page = storage.query_patients(cursor=request.args.get('cursor'), limit=DASHBOARD_PAGE_SIZE)
+    html = ''.join(render_template('_patient_card.html', patient=p_data) for p_data in page['items'])
+    return Response(html, mimetype='text/html', headers={'X-Next-Cursor': page['next_cursor'] or ''})
+
+@app.route('/nurse/patient_card')
+def nurse_patient_card():
+    """Render one patient's dashboard card so the page can add it without a reload"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'Storage not initialized'}), 500
+    
+    patient = storage.get_patient_by_name(request.args.get('name'))
+    if not patient:
+        return jsonify({'error': 'Patient not found'}), 404
+    return render_template('_patient_card.html', patient=patient)
+
 @app.route('/api/create_patient', methods=['POST'])
 def create_patient():
-    """Create a new patient with AI agent and send credentials"""
+    """Create a new patient and queue AI agent setup and credentials email"""
     if session.get('role') != 'nurse':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if not letta_client or not storage or not email_service:
+    if not letta_client or not storage or not email_service or not onboarding_queue:
         return jsonify({'error': 'System not initialized'}), 500
     
     data = request.json
@@ -249,43 +328,21 @@ def create_patient():
         password = patient.generate_password()
         magic_token = patient.generate_magic_token()
         
-        # Create Letta agent
-        try:
-            agent_id = letta_client.create_patient_agent(patient.to_dict())
-            patient.agent_id = agent_id
-            app.logger.info(f"✅ Created Letta agent {agent_id} for {patient.name}")
-        except Exception as letta_error:
-            app.logger.warning(f"⚠️ Warning: Could not create Letta agent: {letta_error}")
-            # Continue without Letta agent for now
-            patient.agent_id = None
-        
-        # Store patient (even if Letta agent creation failed)
+        # Store the patient now; agent, summary and email follow in the background
         storage.add_patient(patient)
+        job_id = onboarding_queue.submit('onboard_patient', {
+            'patient_name': patient.name,
+            'host_url': request.host_url
+        })
         
-        # Send credentials email using email service
-        email_sent = False
-        try:
-            email_sent = email_service.send_patient_credentials_email(
-                patient.to_dict(), 
-                password, 
-                magic_token, 
-                request.host_url
-            )
-        except Exception as email_error:
-            app.logger.warning(f"⚠️ Warning: Could not send email: {email_error}")
-        
-        app.logger.info(f"✅ Created patient {patient.name} (Agent: {'✅' if patient.agent_id else '❌'}, Email: {'✅' if email_sent else '❌'})")
+        app.logger.info(f"✅ Created patient {patient.name}, onboarding job {job_id} queued")
         
         return jsonify({
-            'success': True, 
-            'agent_id': patient.agent_id,
-            'email_sent': email_sent,
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('get_job', job_id=job_id),
             'password': password,
-            'magic_token': magic_token,
-            'warnings': {
-                'letta_agent': not bool(patient.agent_id),
-                'email_delivery': not email_sent
-            }
+            'magic_token': magic_token
         })
         
     except ValueError as e:
@@ -300,6 +357,86 @@ def create_patient():
             'error_type': type(e).__name__
         }), 500
 
+@app.route('/api/patients/import', methods=['POST'])
+def import_patients():
+    """Queue a bulk import of patients from an uploaded CSV or JSONL file"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not letta_client or not storage or not email_service or not onboarding_queue:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    # Accept a multipart upload or a raw body; either way stream it to disk
+    upload = request.files.get('file')
+    if upload:
+        source, fmt = upload.stream, request.args.get('format') or detect_format(upload.filename or '')
+    else:
+        source = request.stream
+        fmt = request.args.get('format') or ('csv' if 'csv' in (request.content_type or '') else 'jsonl')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Format must be csv or jsonl'}), 400
+    
+    path = os.path.join('/app/data/imports', f"{uuid.uuid4().hex}.{fmt}")
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(source, f)
+    
+    job_id = _queue_bulk_import(path, fmt, request.host_url)
+    app.logger.info(f"✅ Bulk import {path} queued as job {job_id}")
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('get_job', job_id=job_id)
+    })
+
+@app.route('/api/patients/import/<job_id>/resume', methods=['POST'])
+def resume_patient_import(job_id):
+    """Re-run a finished bulk import, retrying only the rows that did not complete"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not onboarding_queue:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    job = onboarding_queue.get(job_id)
+    if not job or job['kind'] != 'bulk_import':
+        return jsonify({'error': 'Import job not found'}), 404
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'error': 'Import is still running'}), 409
+    
+    payload = job['payload']
+    new_job_id = _queue_bulk_import(payload['path'], payload['format'], payload['host_url'])
+    return jsonify({
+        'success': True,
+        'job_id': new_job_id,
+        'status_url': url_for('get_job', job_id=new_job_id)
+    })
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """List recent background jobs (active ones only with ?active=1)"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not onboarding_queue:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    active_only = request.args.get('active', '0') == '1'
+    return jsonify({'jobs': onboarding_queue.list_jobs(active_only=active_only)})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll the status of a background job"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not onboarding_queue:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    job = onboarding_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @app.route('/api/delete_patient', methods=['DELETE'])
 def delete_patient():
     """Delete a patient and their AI agent"""
@@ -328,6 +465,7 @@ def delete_patient():
                 # This depends on the Letta API - you may need to implement this
                 # For now, we'll just remove from our storage
                 app.logger.info(f"🗑️ Would delete Letta agent {patient.agent_id} for {patient_name}")
+                letta_client.invalidate_agent_cache(patient.agent_id)
             except Exception as e:
                 app.logger.warning(f"⚠️ Warning: Could not delete Letta agent {patient.agent_id}: {e}")
         
@@ -368,6 +506,8 @@ def send_instruction():
         # Send instruction to the agent as a system message
         nurse_message = f"📋 **CARE INSTRUCTION FROM NURSE:** {instruction}"
         response = letta_client.send_message(patient.agent_id, nurse_message)
+        # Every worker's cached chat history for this patient is now stale
+        _record_last_message(patient, response.get('messages', []), changed=True)
         
         # Store the instruction
         storage.add_nurse_instruction(patient_name, instruction)
@@ -375,10 +515,76 @@ def send_instruction():
         app.logger.info(f"✅ Sent instruction to {patient_name}: {instruction}")
         return jsonify({'success': True, 'response': response})
         
+    except CircuitOpenError as e:
+        return _letta_unavailable(e)
     except Exception as e:
         app.logger.error(f"❌ Error sending instruction: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Paginated nurse APIs: ?cursor= takes the next_cursor of the previous page
+@app.route('/api/patients', methods=['GET'])
+def list_patients():
+    """Page through patients by name (filter: has_agent=1|0)"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    try:
+        page = storage.query_patients(
+            cursor=request.args.get('cursor'),
+            limit=_page_limit(),
+            has_agent=_bool_arg('has_agent')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page['items'] = [_public_patient(p_data) for p_data in page['items']]
+    return jsonify(page)
+
+@app.route('/api/alerts', methods=['GET'])
+def list_alerts():
+    """Page through alerts, newest first (filters: priority, patient, since, until)"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    try:
+        page = storage.query_alerts(
+            cursor=_int_cursor(),
+            limit=_page_limit(),
+            priority=request.args.get('priority'),
+            patient_name=request.args.get('patient'),
+            since=_time_arg('since'),
+            until=_time_arg('until')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@app.route('/api/nurse_instructions', methods=['GET'])
+def list_nurse_instructions():
+    """Page through nurse instructions, newest first (filters: patient, since, until)"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    try:
+        page = storage.query_nurse_instructions(
+            cursor=_int_cursor(),
+            limit=_page_limit(),
+            patient_name=request.args.get('patient'),
+            since=_time_arg('since'),
+            until=_time_arg('until')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
 # PATIENT ROUTES
 @app.route('/patient/<patient_id>')
 def patient_dashboard(patient_id):
@@ -394,10 +600,13 @@ def patient_dashboard(patient_id):
         return redirect(url_for('index'))
     
     messages = []
+    older_cursor = None
     if patient.agent_id and letta_client:
         try:
-            raw_messages = letta_client.get_agent_messages(patient.agent_id, limit=20)
-            messages = _format_messages_for_display(raw_messages)
+            history = letta_client.get_message_history(patient.agent_id, limit=CHAT_HISTORY_PAGE_SIZE,
+                                                       latest=patient.last_message_id)
+            messages = _format_messages_for_display(history['messages'])
+            older_cursor = history['next_cursor']
         except Exception as e:
             app.logger.error(f"❌ Error loading messages for {patient.name}: {e}")
     
@@ -405,8 +614,37 @@ def patient_dashboard(patient_id):
                          patient=patient, 
                          patient_name=patient.name,
                          messages=messages,
+                         older_cursor=older_cursor,
                          patient_id=patient_id)
 
+@app.route('/api/messages', methods=['GET'])
+def get_chat_history():
+    """Page back through the patient's chat history (?before= takes the next_cursor of the previous page)"""
+    if session.get('role') != 'patient':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not letta_client or not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    patient = storage.get_patient_by_id(session.get('patient_id'))
+    if not patient or not patient.agent_id:
+        return jsonify({'error': 'Patient agent not found'}), 404
+    
+    try:
+        history = letta_client.get_message_history(
+            patient.agent_id, limit=CHAT_HISTORY_PAGE_SIZE, before=request.args.get('before'),
+            latest=patient.last_message_id
+        )
+    except CircuitOpenError as e:
+        return _letta_unavailable(e)
+    except Exception as e:
+        app.logger.error(f"❌ Error loading messages for {patient.name}: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'messages': _format_messages_for_display(history['messages']),
+        'next_cursor': history['next_cursor']
+    })
+
 @app.route('/api/send_message', methods=['POST'])
 def send_message():
     """Send message from patient to their AI agent"""
@@ -431,16 +669,11 @@ def send_message():
     try:
         app.logger.info(f"🔍 Sending message from {patient.name}: {message}")
         
-        # Check if this is the first message - if so, refresh context
-        try:
-            recent_messages = letta_client.get_agent_messages(patient.agent_id, limit=5)
-            if len(recent_messages) < 2:  # Only system messages exist
-                app.logger.info(f"🔄 Refreshing patient context for {patient.name}")
-                letta_client.refresh_patient_context(patient.agent_id, patient.to_dict())
-        except Exception as e:
-            app.logger.warning(f"⚠️ Could not check/refresh context: {e}")
+        _refresh_context_if_first_message(patient)
         
-        response = letta_client.send_message(patient.agent_id, message)
+        with _chat_in_flight():
+            response = letta_client.send_message(patient.agent_id, message, patient_name=patient.name)
+        _record_last_message(patient, response.get('messages', []))
         
         # Enhanced alert detection
         _check_for_alerts(patient.name, message, storage)
@@ -451,12 +684,72 @@ def send_message():
         app.logger.info(f"✅ Response sent to {patient.name}")
         return jsonify({'success': True, 'response': clean_response})
         
+    except CircuitOpenError as e:
+        return _letta_unavailable(e)
     except Exception as e:
         app.logger.error(f"❌ Error in send_message for {patient.name}: {e}")
         import traceback
         app.logger.error(f"❌ Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/send_message/stream', methods=['POST'])
+def send_message_stream():
+    """Send message from patient to their AI agent, streaming the reply as SSE"""
+    if session.get('role') != 'patient':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not letta_client or not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    data = request.json
+    message = data.get('message')
+    
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+    
+    patient_id = session.get('patient_id')
+    patient = storage.get_patient_by_id(patient_id)
+    
+    if not patient or not patient.agent_id:
+        return jsonify({'error': 'Patient agent not found'}), 404
+    
+    app.logger.info(f"🔍 Streaming message from {patient.name}: {message}")
+    
+    _refresh_context_if_first_message(patient)
+    
+    # Alerts only depend on the patient's message, so raise them before the reply
+    _check_for_alerts(patient.name, message, storage)
+    
+    def generate():
+        # Assistant tokens share a message id; accumulate them for the final filter
+        assistant_messages = {}
+        try:
+            with _chat_in_flight():
+                for chunk in letta_client.stream_message(patient.agent_id, message, patient_name=patient.name):
+                    if chunk['message_type'] != 'assistant_message' or not chunk['content']:
+                        continue
+                    if chunk['id'] in assistant_messages:
+                        assistant_messages[chunk['id']]['content'] += chunk['content']
+                    else:
+                        assistant_messages[chunk['id']] = dict(chunk)
+                    yield _sse_event({'type': 'token', 'id': chunk['id'], 'content': chunk['content']})
+            
+            _record_last_message(patient, list(assistant_messages.values()))
+            
+            # Tokens are relayed unfiltered; the final event carries the clean reply
+            clean_response = _filter_agent_response({'messages': list(assistant_messages.values())})
+            yield _sse_event({'type': 'done', 'response': clean_response})
+            app.logger.info(f"✅ Streamed response to {patient.name}")
+        except Exception as e:
+            app.logger.error(f"❌ Error in send_message_stream for {patient.name}: {e}")
+            yield _sse_event({'type': 'error', 'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # Add debugging endpoints for development
 @app.route('/api/debug/agent_memory/<patient_name>', methods=['GET'])
 def debug_agent_memory(patient_name):
@@ -498,6 +791,7 @@ def refresh_patient_context(patient_name):
     try:
         success = letta_client.refresh_patient_context(patient.agent_id, patient.to_dict())
         if success:
+            storage.update_conversation_state(patient_name, context_primed=True)
             return jsonify({'success': True, 'message': f'Context refreshed for {patient_name}'})
         else:
             return jsonify({'error': 'Failed to refresh context'}), 500
@@ -505,85 +799,309 @@ def refresh_patient_context(patient_name):
         return jsonify({'error': str(e)}), 500
 
 # UTILITY FUNCTIONS
+@contextmanager
+def _chat_in_flight():
+    """Count a patient message as in flight until its reply is back, so shutdown can wait for it"""
+    global _chats_in_flight
+    with _chats_changed:
+        _chats_in_flight += 1
+    try:
+        yield
+    finally:
+        with _chats_changed:
+            _chats_in_flight -= 1
+            _chats_changed.notify_all()
+
+def _refresh_context_if_first_message(patient):
+    """Refresh the agent's patient context before the first chat message
+    
+    The outcome is stored on the patient record, so Letta is only asked for
+    recent messages until the context has been primed once.
+    """
+    if patient.context_primed:
+        return
+    try:
+        recent_messages = letta_client.get_agent_messages(patient.agent_id, limit=5)
+        primed = True
+        if len(recent_messages) < 2:  # Only system messages exist
+            app.logger.info(f"🔄 Refreshing patient context for {patient.name}")
+            primed = letta_client.refresh_patient_context(patient.agent_id, patient.to_dict())
+        if primed:
+            storage.update_conversation_state(patient.name, context_primed=True)
+            patient.context_primed = True
+    except Exception as e:
+        app.logger.warning(f"⚠️ Could not check/refresh context: {e}")
+
+def _record_last_message(patient, messages, changed=False):
+    """Remember the newest Letta message id seen in this patient's chat
+    
+    Workers compare it with their cached history before serving it, so it is
+    how one worker's exchange reaches the others. ``changed`` records a new
+    marker even when the reply carried no message id (a nurse instruction).
+    """
+    message_ids = [msg.get('id') for msg in messages if msg.get('id')]
+    last_message_id = message_ids[-1] if message_ids else (f"changed-{uuid.uuid4().hex}" if changed else None)
+    if last_message_id and last_message_id != patient.last_message_id:
+        storage.update_conversation_state(patient.name, last_message_id=last_message_id)
+        patient.last_message_id = last_message_id
+
+def _page_limit():
+    """?limit= clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def _int_cursor():
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise ValueError('Invalid cursor')
+
+def _bool_arg(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+def _time_arg(name):
+    """An ISO 8601 time filter, normalised to the stored timestamp format"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+
+def _public_patient(p_data):
+    """Patient record without login secrets"""
+    return {key: value for key, value in p_data.items() if key not in PATIENT_PRIVATE_FIELDS}
+
+def _letta_unavailable(error):
+    """503 returned straight away while the Letta circuit breaker is open"""
+    app.logger.warning(f"⚠️ {error}")
+    response = jsonify({'error': 'The care assistant is temporarily unavailable, please try again shortly'})
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response, 503
+
+def _sse_event(payload):
+    """Format a payload as a server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
 def _format_messages_for_display(raw_messages):
     """Format messages for clean display in patient chat"""
-    formatted_messages = []
-    
-    for msg in raw_messages:
-        msg_type = msg.get('message_type', '')
-        content = msg.get('content', '')
-        
-        # Skip internal messages
-        if (msg_type == 'reasoning_message' or 
-            not content or 
-            content.strip() == '' or
-            'More human than human is our motto' in content or
-            content.strip().startswith('{') and 'type' in content):
-            continue
-        
-        # Handle nurse instructions
-        if content.startswith('📋 **CARE INSTRUCTION FROM NURSE:**'):
-            formatted_messages.append({
-                'role': 'system',
-                'text': content.replace('📋 **CARE INSTRUCTION FROM NURSE:** ', 'Nurse: ')
-            })
-        # Handle user messages
-        elif msg_type == 'user_message':
-            clean_text = content.replace('**You:**', '').strip()
-            if not clean_text.startswith('{'):  # Skip JSON messages
-                formatted_messages.append({'role': 'user', 'text': clean_text})
-        # Handle assistant messages
-        elif (msg_type == 'assistant_message' and 
-              not any(skip_phrase in content.lower() for skip_phrase in [
-                  'core memory', 'archival memory', 'system_alert', 'i should'
-              ])):
-            clean_text = content.replace('**Assistant:**', '').strip()
-            if clean_text and len(clean_text) > 10:
-                formatted_messages.append({'role': 'assistant', 'text': clean_text})
-    
-    return formatted_messages
+    return message_filter.for_display(raw_messages)
 
 def _filter_agent_response(response):
     """Filter agent response for clean display"""
-    clean_response = {"messages": [], "success": True, "message_count": 0}
-    
-    if response.get('messages'):
-        for msg in response['messages']:
-            msg_type = msg.get('message_type', '')
-            content = msg.get('content', '')
-            
-            # Only include clean assistant messages
-            if (msg_type == 'assistant_message' and 
-                content and 
-                not any(skip_phrase in content.lower() for skip_phrase in [
-                    'core memory', 'archival memory', 'system_alert', 'no need to',
-                    'i can answer using', 'i should'
-                ]) and
-                not content.strip().startswith('{')):
-                clean_response['messages'].append(msg)
-                clean_response['message_count'] += 1
-    
-    return clean_response
+    messages = message_filter.agent_replies(response.get('messages') or [])
+    return {"messages": messages, "success": True, "message_count": len(messages)}
 
 def _check_for_alerts(patient_name, message, storage):
     """Check message for alert conditions and create alerts if needed"""
-    alert_keywords = [
-        'inform the nurse', 'tell the nurse', 'contact the nurse', 
-        'notify the nurse', 'alert the nurse', 'let the nurse know'
-    ]
+    match = alert_matcher.classify(message)
+    if match:
+        storage.add_alert(patient_name, f"{match.reason}: {message}", match.priority)
+
+# BACKGROUND ONBOARDING
+def _onboard_create_agent(payload, results):
+    """Onboarding step: create the patient's Letta agent"""
+    patient = storage.get_patient_by_name(payload['patient_name'])
+    if not patient:
+        raise ValueError(f"Patient {payload['patient_name']} no longer exists")
+    if patient.agent_id:
+        return patient.agent_id  # Finished on an earlier attempt
     
-    urgent_keywords = [
-        'chest pain', 'can\'t breathe', 'difficulty breathing', 'severe pain', 
-        'emergency', 'help', 'dizzy', 'lightheaded', 'nausea', 'vomiting',
-        'feel bad', 'feel terrible', 'feel awful', 'pain', 'hurt'
-    ]
+    agent_id = letta_client.create_patient_agent(patient.to_dict())
+    storage.update_patient_agent_id(patient.name, agent_id)
+    app.logger.info(f"✅ Created Letta agent {agent_id} for {patient.name}")
+    return agent_id
+
+def _onboard_generate_summary(payload, results):
+    """Onboarding step: generate the medical summary for the welcome email"""
+    patient = storage.get_patient_by_name(payload['patient_name'])
+    if not patient:
+        raise ValueError(f"Patient {payload['patient_name']} no longer exists")
+    return email_service.generate_medical_summary(patient.to_dict())
+
+def _onboard_send_email(payload, results):
+    """Onboarding step: send the credentials email"""
+    patient = storage.get_patient_by_name(payload['patient_name'])
+    if not patient:
+        raise ValueError(f"Patient {payload['patient_name']} no longer exists")
     
-    message_lower = message.lower()
+    email_sent = email_service.send_patient_credentials_email(
+        patient.to_dict(),
+        patient.password,
+        patient.magic_token,
+        payload['host_url'],
+        medical_summary=results.get('summary')
+    )
+    if not email_sent:
+        raise RuntimeError(f"Could not send credentials email to {patient.email}")
+    return True
+
+# BULK IMPORT
+def _queue_bulk_import(path, fmt, host_url):
+    return onboarding_queue.submit('bulk_import', {'path': path, 'format': fmt, 'host_url': host_url})
+
+def _bulk_import_run(payload, results):
+    """Bulk import step: store, provision and email every row of an uploaded file
     
-    if any(keyword in message_lower for keyword in alert_keywords):
-        storage.add_alert(patient_name, f"Patient requested nurse contact: {message}", 'high')
-    elif any(keyword in message_lower for keyword in urgent_keywords):
-        storage.add_alert(patient_name, f"Concerning symptoms reported: {message}", 'medium')
+    Progress is checkpointed next to the upload, so a retried or resumed job
+    only redoes the rows that did not finish.
+    """
+    importer = BulkImporter(
+        storage, letta_client, email_service,
+        workers=int(os.getenv('IMPORT_AGENT_WORKERS', '8')),
+        email_batch_size=int(os.getenv('IMPORT_EMAIL_BATCH_SIZE', '50')),
+        checkpoint_file=payload['path'] + '.checkpoint'
+    )
+    with open(payload['path'], newline='') as f:
+        report = importer.run(iter_rows(f, payload['format']), payload['host_url'])
+    app.logger.info(f"✅ Bulk import {payload['path']}: {report['imported']} imported, "
+                    f"{report['failed']} failed, {report['rows_per_second']} rows/sec")
+    return report
+
+onboarding_queue = None
+if storage and letta_client and email_service:
+    try:
+        onboarding_queue = JobQueue(
+            filename='/app/data/jobs.db',
+            workers=int(os.getenv('ONBOARDING_WORKERS', '2')),
+            max_attempts=int(os.getenv('ONBOARDING_MAX_ATTEMPTS', '3'))
+        )
+        onboarding_queue.register('onboard_patient', [
+            ('agent', _onboard_create_agent),
+            ('summary', _onboard_generate_summary),
+            ('email', _onboard_send_email)
+        ])
+        onboarding_queue.register('bulk_import', [
+            ('import', _bulk_import_run)
+        ], lease_seconds=float(os.getenv('IMPORT_LEASE_SECONDS', '3600')))
+    except Exception as e:
+        app.logger.error(f"❌ Error starting onboarding queue: {e}")
+        onboarding_queue = None
+
+# AGENT POOL
+# Pre-created agents that onboarding claims instead of creating one (0 disables the pool)
+AGENT_POOL_SIZE = int(os.getenv('AGENT_POOL_SIZE', '5'))
+
+agent_pool = None
+if letta_client and AGENT_POOL_SIZE > 0:
+    try:
+        agent_pool = AgentPool(letta_client, filename='/app/data/agent_pool.db', target_size=AGENT_POOL_SIZE)
+        letta_client.agent_pool = agent_pool
+    except Exception as e:
+        app.logger.error(f"❌ Error starting agent pool: {e}")
+        agent_pool = None
+
+# EMAIL OUTBOX
+# Emails are queued durably and sent to Brevo in batches, at most EMAIL_RATE_LIMIT recipients per second
+email_outbox = None
+if email_service and email_service.api_instance:
+    try:
+        email_outbox = EmailOutbox(
+            email_service.api_instance,
+            filename='/app/data/outbox.db',
+            batch_size=int(os.getenv('EMAIL_BATCH_SIZE', '50')),
+            rate=float(os.getenv('EMAIL_RATE_LIMIT', '10')),
+            max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', '10'))
+        )
+        email_service.outbox = email_outbox
+    except Exception as e:
+        app.logger.error(f"❌ Error starting email outbox: {e}")
+        email_outbox = None
+
+# RETENTION
+# Days alerts and nurse instructions stay in live storage before moving to the archive (0 keeps them)
+ALERT_RETENTION_DAYS = float(os.getenv('ALERT_RETENTION_DAYS', '30'))
+INSTRUCTION_RETENTION_DAYS = float(os.getenv('INSTRUCTION_RETENTION_DAYS', '90'))
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))  # Seconds between sweeps
+
+def _retention_cutoff(days):
+    if days <= 0:
+        return None
+    return (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+
+def run_retention():
+    """Move expired alerts and nurse instructions from live storage to the archive"""
+    moved = storage.archive_expired(
+        archive,
+        alerts_before=_retention_cutoff(ALERT_RETENTION_DAYS),
+        instructions_before=_retention_cutoff(INSTRUCTION_RETENTION_DAYS)
+    )
+    if any(moved.values()):
+        app.logger.info(f"✅ Archived {moved['alerts']} alerts and {moved['nurse_instructions']} nurse instructions")
+    return moved
+
+def _retention_loop():
+    while not shutting_down.is_set():
+        try:
+            run_retention()
+        except Exception as e:
+            app.logger.error(f"❌ Retention sweep failed: {e}")
+        shutting_down.wait(RETENTION_INTERVAL)
+
+# BACKGROUND SERVICES
+# Each process runs onboarding workers (jobs are claimed through SQLite, so any number can).
+# The agent pool filler, email sender and retention sweep run in one process at a time, the
+# one holding BACKGROUND_LOCK_FILE: two fillers would overfill the pool and two senders would
+# double the Brevo rate. When that worker exits the OS drops its lock and another takes over.
+BACKGROUND_LOCK_FILE = '/app/data/background.lock'
+_background_lock = None
+
+def start_background_services():
+    """Start this process's background threads; under gunicorn each worker calls this after the fork"""
+    if onboarding_queue:
+        onboarding_queue.start()
+    threading.Thread(target=_run_singleton_services, name='background-leader', daemon=True).start()
+
+def _run_singleton_services():
+    """Wait for the background lock, then start the services only one process may run"""
+    global _background_lock
+    lock = open(BACKGROUND_LOCK_FILE, 'a')
+    fcntl.flock(lock, fcntl.LOCK_EX)  # Blocks while another worker holds it
+    if shutting_down.is_set():
+        lock.close()
+        return
+    _background_lock = lock
+    app.logger.info(f"✅ Process {os.getpid()} runs the agent pool, email outbox and retention sweep")
+    if agent_pool:
+        agent_pool.start()
+    if email_outbox:
+        email_outbox.start()
+    if storage and archive and RETENTION_INTERVAL > 0:
+        threading.Thread(target=_retention_loop, name='retention', daemon=True).start()
+
+def shutdown(timeout: float = 30):
+    """Stop taking background work, let in-flight chats finish, then stop the background threads"""
+    global _background_lock
+    shutting_down.set()
+    deadline = time.monotonic() + timeout
+    with _chats_changed:
+        while _chats_in_flight and time.monotonic() < deadline:
+            _chats_changed.wait(deadline - time.monotonic())
+        if _chats_in_flight:
+            app.logger.warning(f"⚠️ Shutting down with {_chats_in_flight} chats still in flight")
+    for service in (onboarding_queue, agent_pool, email_outbox):
+        if service:
+            service.stop(max(0.0, deadline - time.monotonic()))
+    if storage and hasattr(storage, 'flush'):
+        storage.flush()
+    if _background_lock:
+        _background_lock.close()  # Hands the singleton services to another worker
+        _background_lock = None
+    app.logger.info(f"✅ Process {os.getpid()} shut down cleanly")
+
+# Not started on import by the dev server (see __main__) or gunicorn (see gunicorn.conf.py)
+if __name__ != '__main__' and os.getenv('START_BACKGROUND_SERVICES', 'true').lower() == 'true':
+    start_background_services()
 
 # API Routes for system management
 @app.route('/api/system/stats', methods=['GET'])
@@ -597,6 +1115,84 @@ def get_system_stats():
     
     return jsonify(storage.get_statistics())
 
+@app.route('/api/system/stats/hourly', methods=['GET'])
+def get_hourly_stats():
+    """Alerts per priority and nurse instructions per hour, oldest first"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    if not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+
+    try:
+        rollups = storage.get_hourly_rollups(since=_time_arg('since'), until=_time_arg('until'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'hours': rollups})
+
+@app.route('/api/system/email-outbox', methods=['GET'])
+def get_email_outbox():
+    """Outbox depth per status and the emails that could not be delivered"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not email_outbox:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    return jsonify({'counts': email_outbox.stats(), 'failed': email_outbox.failed()})
+
+@app.route('/api/system/email-outbox/retry', methods=['POST'])
+def retry_email_outbox():
+    """Queue every failed email for another delivery attempt"""
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not email_outbox:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    return jsonify({'success': True, 'requeued': email_outbox.retry_failed()})
+
+@app.route('/api/alerts/stream', methods=['GET'])
+def alert_stream():
+    """Push alert changes to the nurse dashboard as server-sent events
+    
+    Each event carries the alerts created or updated since the client's last
+    sequence number and the ids still present, so the page can patch its list.
+    Reconnecting browsers resume from the Last-Event-ID header.
+    """
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not storage:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        since = 0
+    if since > storage.get_alert_seq():
+        since = 0  # Storage was reset; resend everything
+    heartbeat = float(os.getenv('ALERT_STREAM_HEARTBEAT', '15'))
+    
+    def generate():
+        nonlocal since
+        yield 'retry: 3000\n\n'
+        # Ends on shutdown so the worker can exit; the browser reconnects to another one
+        while not shutting_down.is_set():
+            seq = storage.wait_for_alerts(since, timeout=heartbeat)
+            if seq == since:
+                yield ': keepalive\n\n'  # Also lets the server notice closed connections
+                continue
+            updates = storage.get_alert_updates(since)
+            since = updates['seq']
+            yield f"id: {since}\nevent: alerts\n{_sse_event(updates)}"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/alerts/clear', methods=['POST'])
 def clear_alerts():
     """Clear all alerts"""
@@ -606,9 +1202,43 @@ def clear_alerts():
     if not storage:
         return jsonify({'error': 'System not initialized'}), 500
     
-    storage.clear_alerts()
+    if archive:
+        # Cleared alerts stay available for audits
+        storage.archive_expired(archive, alerts_before=datetime.datetime.max.isoformat())
+    else:
+        storage.clear_alerts()
     return jsonify({'success': True})
 
+@app.route('/api/archive/<kind>', methods=['GET'])
+def query_archive(kind):
+    """Page through archived alerts or nurse_instructions, newest first
+    
+    Filters: since/until (ISO timestamps), patient, and priority for alerts.
+    Keep since/until tight: every day segment in range may be read.
+    """
+    if session.get('role') != 'nurse':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not archive:
+        return jsonify({'error': 'System not initialized'}), 500
+    
+    if kind not in ARCHIVE_KINDS:
+        return jsonify({'error': f"Unknown archive '{kind}'"}), 404
+    
+    try:
+        page = archive.query(
+            kind,
+            cursor=request.args.get('cursor'),
+            limit=_page_limit(),
+            since=_time_arg('since'),
+            until=_time_arg('until'),
+            patient_name=request.args.get('patient'),
+            priority=request.args.get('priority') if kind == 'alerts' else None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -620,7 +1250,6 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    import datetime
     app.logger.info("🏥 Starting Enhanced Post-Hospital Care System...")
     app.logger.info(f"🔧 Letta client: {'✅ Ready' if letta_client else '❌ Not available'}")
     app.logger.info(f"💾 Storage: {'✅ Ready' if storage else '❌ Not available'}")
@@ -632,6 +1261,13 @@ if __name__ == '__main__':
     
     # Production vs Development
     if os.getenv('FLASK_ENV') == 'production':
-        app.run(host='0.0.0.0', port=5011, debug=False)
+        # The dev server is not for production; hand over to gunicorn before anything starts
+        config = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gunicorn.conf.py')
+        app.logger.info("🚀 Starting gunicorn (FLASK_ENV=production)")
+        os.execvp('gunicorn', ['gunicorn', '--config', config])
     else:
+        # The reloader runs this file twice: a watcher process and the child that
+        # serves requests (WERKZEUG_RUN_MAIN=true). Only the child starts the services.
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_services()
         app.run(host='0.0.0.0', port=5011, debug=True)
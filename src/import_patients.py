@@ -0,0 +1,87 @@
+"""
+Bulk patient import - onboard a discharge-day batch from a CSV or JSONL file
+
+Usage: python src/import_patients.py patients.csv --host-url https://care.example.com/
+
+Run it again with the same file to resume: finished rows are skipped using the
+checkpoint written next to the input. When the app is running against the same
+data directory, use STORAGE_ENGINE=sqlite or STORAGE_SHARED=true so both
+processes see each other's writes.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from shared.agent_pool import AgentPool
+from shared.bulk_import import BulkImporter, iter_rows, detect_format
+from shared.email_service import EmailService
+from shared.letta_client import LettaClient
+from shared.models import create_storage
+from shared.outbox import EmailOutbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', help="CSV or JSONL file, or '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='defaults to the file extension')
+    parser.add_argument('--host-url', required=True, help='base URL used in magic login links')
+    parser.add_argument('--data-dir', default='/app/data')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent agent creations')
+    parser.add_argument('--email-batch-size', type=int, default=50)
+    parser.add_argument('--checkpoint', help='defaults to <file>.checkpoint')
+    parser.add_argument('--no-email', action='store_true', help='skip credential emails')
+    parser.add_argument('--no-pool', action='store_true', help="don't claim pre-created agents from the app's pool")
+    parser.add_argument('--email-wait', type=float, default=600,
+                        help="seconds to wait for queued emails to go out before leaving them to the app's sender")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.file)
+    checkpoint = args.checkpoint or (None if args.file == '-' else args.file + '.checkpoint')
+    host_url = args.host_url if args.host_url.endswith('/') else args.host_url + '/'
+
+    letta_client = LettaClient()
+    if not args.no_pool:
+        # Claim only: the running app's filler keeps the pool topped up
+        letta_client.agent_pool = AgentPool(letta_client, filename=os.path.join(args.data_dir, 'agent_pool.db'),
+                                            target_size=0)
+
+    email_service = None if args.no_email else EmailService()
+    outbox = None
+    if email_service and email_service.api_instance:
+        # Shares the app's outbox; either process's sender may deliver what the other queued
+        outbox = EmailOutbox(email_service.api_instance, filename=os.path.join(args.data_dir, 'outbox.db'),
+                             batch_size=int(os.getenv('EMAIL_BATCH_SIZE', '50')),
+                             rate=float(os.getenv('EMAIL_RATE_LIMIT', '10')))
+        email_service.outbox = outbox
+        outbox.start()
+
+    importer = BulkImporter(
+        create_storage(args.data_dir),
+        letta_client,
+        email_service,
+        workers=args.workers,
+        email_batch_size=args.email_batch_size,
+        checkpoint_file=checkpoint
+    )
+    stream = sys.stdin if args.file == '-' else open(args.file, newline='')
+    with stream:
+        report = importer.run(iter_rows(stream, fmt), host_url)
+    if outbox:
+        if not outbox.drain(timeout=args.email_wait):
+            print(f"⚠️ {outbox.depth()} emails still queued in {outbox.filename}")
+        outbox.stop()
+
+    print(json.dumps(report, indent=2))
+    print(f"\n{report['imported']} imported, {report['resumed']} resumed, {report['failed']} failed "
+          f"of {report['total_rows']} rows in {report['elapsed_seconds']}s ({report['rows_per_second']} rows/sec)")
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Agent Pool Module - Generic Letta agents created ahead of time so onboarding only has to fill them in
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pool_agents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agent_id TEXT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pool_agents_status ON pool_agents (status);
+"""
+
+
+class AgentPool:
+    """A SQLite-backed pool of unassigned agents kept at ``target_size``
+
+    A background filler tops the pool up whenever it drops below target. It
+    reserves a row before creating each agent, so fillers in several worker
+    processes never overshoot together; a reservation whose creation died
+    is dropped after ``reservation_timeout``. ``claim`` hands each pooled
+    agent to exactly one caller across all processes.
+    """
+
+    def __init__(self, letta_client, filename: str = 'agent_pool.db', target_size: int = 5,
+                 refill_interval: float = 30.0, reservation_timeout: float = 600.0):
+        self.letta_client = letta_client
+        self.filename = filename
+        self.target_size = target_size
+        self.refill_interval = refill_interval
+        self.reservation_timeout = reservation_timeout
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def start(self):
+        """Start the background filler"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._fill_loop, name='agent-pool-filler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def size(self) -> int:
+        """Agents ready to be claimed"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM pool_agents WHERE status = 'ready'"
+        ).fetchone()[0]
+
+    def claim(self) -> Optional[str]:
+        """Take a ready agent out of the pool, or None when it is empty"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, agent_id FROM pool_agents WHERE status = 'ready' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute('DELETE FROM pool_agents WHERE id = ?', (row[0],))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._wakeup.set()  # Refill now rather than at the next interval
+        return row[1] if row else None
+
+    def _reserve(self) -> Optional[int]:
+        """Reserve a slot for one new agent if the pool is below target"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute("DELETE FROM pool_agents WHERE status = 'creating' AND created_at < ?",
+                         (time.time() - self.reservation_timeout,))
+            filled = conn.execute('SELECT COUNT(*) FROM pool_agents').fetchone()[0]
+            slot = None
+            if filled < self.target_size:
+                slot = conn.execute(
+                    "INSERT INTO pool_agents (status, created_at) VALUES ('creating', ?)", (time.time(),)
+                ).lastrowid
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return slot
+
+    def fill(self) -> int:
+        """Create agents until the pool reaches its target; return how many were added"""
+        added = 0
+        while not self._stopping.is_set():
+            slot = self._reserve()
+            if slot is None:
+                break
+            try:
+                agent_id = self.letta_client.create_pool_agent()
+            except Exception:
+                self._connect().execute('DELETE FROM pool_agents WHERE id = ?', (slot,))
+                raise
+            self._connect().execute(
+                "UPDATE pool_agents SET agent_id = ?, status = 'ready' WHERE id = ?", (agent_id, slot)
+            )
+            added += 1
+        return added
+
+    def _fill_loop(self):
+        while not self._stopping.is_set():
+            try:
+                added = self.fill()
+                if added:
+                    print(f"✅ Agent pool topped up with {added} agents ({self.size()} ready)")
+            except Exception as e:
+                print(f"⚠️ Warning: Could not fill agent pool: {e}")
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
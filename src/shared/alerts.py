@@ -0,0 +1,196 @@
+"""
+Alert Matching Module - Classifies patient messages into nurse alerts
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Keywords per alert priority; a keywords file with the same shape replaces them
+DEFAULT_KEYWORDS = {
+    'high': [
+        'inform the nurse', 'tell the nurse', 'contact the nurse',
+        'notify the nurse', 'alert the nurse', 'let the nurse know'
+    ],
+    'medium': [
+        'chest pain', 'can\'t breathe', 'cannot breathe', 'difficulty breathing', 'severe pain',
+        'emergency', 'help', 'dizzy', 'lightheaded', 'nausea', 'vomiting',
+        'feel bad', 'feel terrible', 'feel awful', 'pain', 'painful', 'hurt', 'hurts', 'hurting'
+    ]
+}
+
+ALERT_REASONS = {
+    'high': 'Patient requested nurse contact',
+    'medium': 'Concerning symptoms reported'
+}
+
+PRIORITY_ORDER = ['high', 'medium', 'low']
+
+# Words that negate a keyword when they appear shortly before it in the same clause
+NEGATION_CUES = {
+    'no', 'not', 'never', 'without', 'denies', 'deny', 'nor',
+    'don\'t', 'dont', 'didn\'t', 'didnt', 'doesn\'t', 'doesnt', 'isn\'t', 'wasn\'t',
+    'haven\'t', 'havent', 'hasn\'t', 'hadn\'t', 'aren\'t', 'weren\'t', 'won\'t'
+}
+NEGATION_WINDOW = 3  # Words looked at before a keyword
+CLAUSE_BREAK = re.compile(r'[.;:!?,]|\bbut\b|\bhowever\b')
+WORD = re.compile(r"[\w'’‘`]+")
+APOSTROPHE_CLASS = "['’‘`]"  # Curly and straight apostrophes match alike
+
+
+def _normalise(text: str) -> str:
+    """Collapse whitespace and straighten apostrophes"""
+    return ' '.join(text.split()).replace('’', "'").replace('‘', "'").replace('`', "'")
+
+
+def _priority_rank(priority: str) -> int:
+    return PRIORITY_ORDER.index(priority) if priority in PRIORITY_ORDER else len(PRIORITY_ORDER)
+
+
+@dataclass
+class AlertMatch:
+    priority: str
+    keywords: List[str]
+
+    @property
+    def reason(self) -> str:
+        return ALERT_REASONS.get(self.priority, 'Alert keywords detected')
+
+
+def _trie_pattern(node: Dict) -> str:
+    """Render a character trie as a regex so shared prefixes are only tried once"""
+    alternatives = []
+    can_end = False
+    for char, child in sorted(node.items()):
+        if char == '':
+            can_end = True
+            continue
+        if char == ' ':
+            token = r'\s+'
+        elif char == "'":
+            token = APOSTROPHE_CLASS
+        else:
+            token = re.escape(char)
+        alternatives.append(token + _trie_pattern(child))
+    if not alternatives:
+        return ''
+    if len(alternatives) == 1 and not can_end:
+        return alternatives[0]
+    pattern = '(?:' + '|'.join(alternatives) + ')'
+    return pattern + '?' if can_end else pattern
+
+
+def compile_keywords(keywords: Dict[str, List[str]]):
+    """Compile every keyword of every priority into one word-bounded regex
+
+    Returns the regex and a map from normalised keyword to its priority. A
+    keyword listed under several priorities keeps the most urgent one. The
+    regex is case-sensitive and expects lowercased text, which is much faster
+    than re.IGNORECASE.
+    """
+    priorities = {}
+    for priority in sorted(keywords, key=_priority_rank):
+        for keyword in keywords[priority]:
+            normalised = _normalise(keyword.lower())
+            if normalised:
+                priorities.setdefault(normalised, priority)
+
+    trie: Dict = {}
+    for keyword in priorities:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    body = _trie_pattern(trie) or '(?!)'  # An empty keyword set never matches
+    boundary = r'\w' + APOSTROPHE_CLASS[1:-1]
+    return re.compile(rf'(?<![{boundary}]){body}(?![{boundary}])'), priorities
+
+
+class AlertMatcher:
+    """Finds alert keywords in a message with a single regex pass
+
+    Keywords only match as whole words or phrases ("help" does not match
+    "helpful") and a keyword is ignored when a negation such as "no" or
+    "don't" appears within a few words before it in the same clause ("no
+    chest pain"). When ``keywords_file`` exists its contents replace the
+    defaults, and edits to it are picked up without a restart.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]] = None, keywords_file: str = None,
+                 reload_interval: float = 5.0):
+        self.keywords_file = keywords_file
+        self.reload_interval = reload_interval
+        self._default_keywords = keywords or DEFAULT_KEYWORDS
+        self._lock = threading.Lock()
+        self._file_mtime = None
+        self._next_check = 0.0
+        self._compiled = compile_keywords(self._default_keywords)
+        self._maybe_reload()
+
+    def reload(self):
+        """Re-read the keywords file now"""
+        self._next_check = 0.0
+        self._file_mtime = None
+        self._maybe_reload()
+
+    def _maybe_reload(self):
+        """Recompile if the keywords file changed since it was last read"""
+        if not self.keywords_file or time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.stat(self.keywords_file).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._file_mtime:
+                return
+            try:
+                if mtime is None:
+                    keywords = self._default_keywords
+                else:
+                    with open(self.keywords_file) as f:
+                        keywords = json.load(f)
+                compiled = compile_keywords(keywords)
+            except (OSError, ValueError, AttributeError, TypeError) as e:
+                print(f"⚠️ Warning: Could not load alert keywords from {self.keywords_file}: {e}")
+                return
+            self._compiled = compiled  # Swapped whole, so readers never see half an update
+            self._file_mtime = mtime
+            if mtime is not None:
+                print(f"✅ Loaded alert keywords from {self.keywords_file}")
+
+    def find(self, message: str) -> Dict[str, List[str]]:
+        """Return the non-negated keywords found in a message, grouped by priority"""
+        self._maybe_reload()
+        pattern, priorities = self._compiled
+        text = message.lower()
+        found: Dict[str, List[str]] = {}
+        first = pattern.search(text)  # Most messages have no keyword at all
+        if first is None:
+            return found
+        for match in pattern.finditer(text, first.start()):
+            if self._negated(text, match.start()):
+                continue
+            keyword = _normalise(match.group())
+            found.setdefault(priorities[keyword], []).append(keyword)
+        return found
+
+    def classify(self, message: str) -> Optional[AlertMatch]:
+        """Return the most urgent alert a message warrants, or None"""
+        found = self.find(message)
+        if not found:
+            return None
+        priority = min(found, key=_priority_rank)
+        return AlertMatch(priority=priority, keywords=found[priority])
+
+    @staticmethod
+    def _negated(text: str, start: int) -> bool:
+        """Whether a negation cue sits just before position ``start`` in the same clause"""
+        clause = CLAUSE_BREAK.split(text[max(0, start - 80):start])[-1]
+        words = WORD.findall(clause)[-NEGATION_WINDOW:]
+        return any(_normalise(word) in NEGATION_CUES for word in words)
@@ -0,0 +1,123 @@
+"""
+Archive Module - Compressed, time-partitioned history of expired alerts and nurse instructions
+"""
+
+import gzip
+import json
+import os
+import re
+import zlib
+from typing import Dict, List, Optional
+
+ARCHIVE_KINDS = ('alerts', 'nurse_instructions')
+SEGMENT_SUFFIX = '.jsonl.gz'
+UNDATED = '0001-01-01'  # Segment for records without a timestamp
+SEGMENT_NAME = re.compile(r'^(\d{4}-\d{2}-\d{2})' + re.escape(SEGMENT_SUFFIX) + '$')
+
+
+class Archive:
+    """Append-only gzip JSONL segments, one per kind and day
+
+    A record goes to ``<directory>/<kind>/<YYYY-MM-DD>.jsonl.gz`` by the date
+    of its timestamp. Each write appends a new gzip member and gzip readers
+    treat consecutive members as one stream, so a segment is never rewritten.
+    Callers write a batch before deleting it from storage; if a crash repeats
+    a batch the copies share a storage id and are collapsed when read.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        for kind in ARCHIVE_KINDS:
+            os.makedirs(os.path.join(directory, kind), exist_ok=True)
+
+    def _segment_path(self, kind: str, day: str) -> str:
+        return os.path.join(self.directory, kind, day + SEGMENT_SUFFIX)
+
+    def write(self, kind: str, records: List[Dict]) -> int:
+        """Append records to their day segments and fsync them; return how many were written"""
+        if kind not in ARCHIVE_KINDS:
+            raise ValueError(f"Unknown archive kind '{kind}'")
+        by_day: Dict[str, List[Dict]] = {}
+        for record in records:
+            day = (record.get('timestamp') or '')[:10] or UNDATED
+            by_day.setdefault(day, []).append(record)
+        for day, batch in by_day.items():
+            payload = ''.join(json.dumps(record) + '\n' for record in batch).encode('utf-8')
+            with open(self._segment_path(kind, day), 'ab') as f:
+                f.write(gzip.compress(payload))
+                f.flush()
+                os.fsync(f.fileno())
+        return len(records)
+
+    def days(self, kind: str, since: str = None, until: str = None) -> List[str]:
+        """Days with a segment, newest first, limited to the since/until range"""
+        try:
+            names = os.listdir(os.path.join(self.directory, kind))
+        except FileNotFoundError:
+            return []
+        days = [m.group(1) for m in map(SEGMENT_NAME.match, names) if m]
+        return sorted((day for day in days
+                       if (not since or day >= since[:10]) and (not until or day <= until[:10])),
+                      reverse=True)
+
+    def read_segment(self, kind: str, day: str) -> List[Dict]:
+        """All records in one day segment, newest id first, duplicates collapsed
+
+        A member cut short by a crash mid-write ends the segment; the records
+        before it are still returned.
+        """
+        records: Dict = {}
+        try:
+            with gzip.open(self._segment_path(kind, day), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    records[record.get('id', len(records))] = record
+        except FileNotFoundError:
+            return []
+        except (EOFError, OSError, zlib.error) as e:
+            print(f"⚠️ Warning: Archive segment {kind}/{day} is truncated: {e}")
+        return sorted(records.values(), key=lambda r: r.get('id') or 0, reverse=True)
+
+    def query(self, kind: str, cursor: str = None, limit: int = 50, since: str = None,
+              until: str = None, **equals) -> Dict:
+        """One page of archived records, newest day first and newest id first within a day
+
+        Only the segments inside the since/until range are opened. Keyword
+        arguments filter on equal field values (None means no filter).
+        ``cursor`` is the ``next_cursor`` of the previous page.
+        """
+        if kind not in ARCHIVE_KINDS:
+            raise ValueError(f"Unknown archive kind '{kind}'")
+        cursor_day, cursor_id = self._parse_cursor(cursor)
+        filters = {field: value for field, value in equals.items() if value is not None}
+        items: List[Dict] = []
+        last_day = None
+        for day in self.days(kind, since, until):
+            if cursor_day and day > cursor_day:
+                continue
+            for record in self.read_segment(kind, day):
+                if day == cursor_day and cursor_id is not None and (record.get('id') or 0) >= cursor_id:
+                    continue
+                timestamp = record.get('timestamp') or ''
+                if (since and timestamp < since) or (until and timestamp >= until):
+                    continue
+                if any(record.get(field) != value for field, value in filters.items()):
+                    continue
+                if len(items) == limit:
+                    last = items[-1]
+                    return {'items': items, 'next_cursor': f"{last_day}/{last.get('id') or 0}"}
+                items.append(record)
+                last_day = day
+        return {'items': items, 'next_cursor': None}
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]):
+        if not cursor:
+            return None, None
+        day, _, record_id = cursor.partition('/')
+        if not SEGMENT_NAME.match(day + SEGMENT_SUFFIX) or not record_id.isdigit():
+            raise ValueError('cursor must be a next_cursor value from an earlier page')
+        return day, int(record_id)
@@ -0,0 +1,305 @@
+"""
+Bulk Import Module - Imports a discharge-day batch of patients from CSV or JSONL
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, TextIO, Tuple
+
+from .models import Patient, Medication
+
+LIST_SEPARATOR = ';'
+MEDICATION_SEPARATOR = '|'
+
+
+def iter_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, raw row) pairs from a CSV or JSONL stream without reading it all
+
+    CSV columns: name, email, patient_id, conditions, medications, allergies,
+    discharge_plan. List columns are ``;``-separated and each medication is
+    ``name|dosage|frequency``. JSONL rows use the /api/create_patient body.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {'_error': f"Invalid JSON: {e}"}
+            if not isinstance(row, dict):
+                row = {'_error': f"Expected a JSON object, got {type(row).__name__}"}
+            yield line_number, row
+    else:
+        raise ValueError(f"Unsupported import format '{fmt}' (expected csv or jsonl)")
+
+
+def detect_format(filename: str) -> str:
+    """Guess the import format from a file name"""
+    return 'csv' if filename.lower().endswith('.csv') else 'jsonl'
+
+
+def _text(value, field: str) -> str:
+    """A field as stripped text; numbers are accepted, other types raise ValueError"""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be text, not {type(value).__name__}")
+    return value.strip()
+
+
+def _split_list(value, field: str) -> List[str]:
+    if isinstance(value, list):
+        items = [_text(v, field) for v in value]
+    else:
+        items = _text(value, field).split(LIST_SEPARATOR)
+    return [item.strip() for item in items if item.strip()]
+
+
+def _parse_medications(value) -> List[Medication]:
+    medications = []
+    if isinstance(value, list):
+        entries = []
+        for m in value:
+            if not isinstance(m, dict):
+                raise ValueError(f"Medication {m!r} must be an object with a name, dosage and frequency")
+            entries.append(tuple(_text(m.get(key), f"Medication {key}")
+                                 for key in ('name', 'dosage', 'frequency')))
+    else:
+        entries = [tuple(part.strip() for part in item.split(MEDICATION_SEPARATOR))
+                   for item in _split_list(value, 'medications')]
+    for entry in entries:
+        if len(entry) != 3 or not all(entry):
+            raise ValueError(f"Medication {entry!r} needs a name, dosage and frequency")
+        medications.append(Medication(name=entry[0], dosage=entry[1], frequency=entry[2]))
+    return medications
+
+
+def build_patient(row: Dict) -> Patient:
+    """Turn a raw import row into a Patient, raising ValueError for bad rows"""
+    if not isinstance(row, dict):
+        raise ValueError(f"Expected a row of fields, got {type(row).__name__}")
+    if row.get('_error'):
+        raise ValueError(row['_error'])
+    name = _text(row.get('name'), 'name')
+    email = _text(row.get('email'), 'email')
+    patient_id = _text(row.get('patient_id'), 'patient_id')
+    if not name or not patient_id or not email:
+        raise ValueError('Patient name, ID, and email are required')
+    return Patient(
+        name=name,
+        email=email,
+        patient_id=patient_id,
+        conditions=_split_list(row.get('conditions'), 'conditions'),
+        medications=_parse_medications(row.get('medications')),
+        allergies=_split_list(row.get('allergies'), 'allergies'),
+        discharge_plan=_text(row.get('discharge_plan'), 'discharge_plan')
+    )
+
+
+class BulkImporter:
+    """Validates, stores and onboards a stream of patients
+
+    Rows are validated against storage and against each other in a single
+    pass as they are read. Valid patients are stored straight away and their
+    Letta agents are created on a bounded thread pool, so at most
+    ``workers * 2`` agent requests are outstanding however large the file is.
+    Credential emails are sent ``email_batch_size`` at a time once the agent
+    exists. Progress is appended to ``checkpoint_file``; running the same file
+    again skips finished work and retries the rest.
+    """
+
+    def __init__(self, storage, letta_client, email_service, workers: int = 8,
+                 email_batch_size: int = 50, email_workers: int = 4,
+                 checkpoint_file: str = None, send_emails: bool = True):
+        self.storage = storage
+        self.letta_client = letta_client
+        self.email_service = email_service
+        self.workers = workers
+        self.email_batch_size = email_batch_size
+        self.email_workers = email_workers
+        self.checkpoint_file = checkpoint_file
+        self.send_emails = send_emails and email_service is not None
+        self._checkpoint = self._load_checkpoint()
+        self._checkpoint_lock = threading.Lock()
+
+    def _load_checkpoint(self) -> Dict[str, set]:
+        """Read patient_id -> finished stages from an earlier run"""
+        checkpoint = {}
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn final line from a crash
+                    checkpoint.setdefault(entry['patient_id'], set()).add(entry['stage'])
+        return checkpoint
+
+    def _mark(self, patient_id: str, stage: str):
+        """Record a finished stage for a patient"""
+        with self._checkpoint_lock:
+            self._checkpoint.setdefault(patient_id, set()).add(stage)
+            if self.checkpoint_file:
+                with open(self.checkpoint_file, 'a') as f:
+                    f.write(json.dumps({'patient_id': patient_id, 'stage': stage}) + '\n')
+
+    def _done(self, patient_id: str, stage: str) -> bool:
+        return stage in self._checkpoint.get(patient_id, ())
+
+    def run(self, rows: Iterable[Tuple[int, Dict]], host_url: str) -> Dict:
+        """Import all rows and return a report of throughput and per-row failures"""
+        report = {
+            'total_rows': 0,
+            'imported': 0,
+            'resumed': 0,
+            'agents_created': 0,
+            'emails_sent': 0,
+            'failed': 0,
+            'failures': []
+        }
+        seen = {'patient_id': set(), 'email': set(), 'name': set()}
+        pending_emails: List[Tuple[int, Patient]] = []
+        started = time.perf_counter()
+
+        def fail(line_number, patient_id, stage, error):
+            report['failed'] += 1
+            report['failures'].append({'line': line_number, 'patient_id': patient_id,
+                                       'stage': stage, 'error': str(error)})
+
+        def collect(done):
+            for future in done:
+                line_number, patient = in_flight.pop(future)
+                try:
+                    patient.agent_id = future.result()
+                except Exception as e:
+                    fail(line_number, patient.patient_id, 'agent', e)
+                    continue
+                report['agents_created'] += 1
+                queue_email(line_number, patient)
+
+        def queue_email(line_number, patient):
+            if not self.send_emails or self._done(patient.patient_id, 'email'):
+                return
+            pending_emails.append((line_number, patient))
+            if len(pending_emails) >= self.email_batch_size:
+                self._send_email_batch(pending_emails, host_url, report, fail, email_pool)
+                pending_emails.clear()
+
+        in_flight = {}
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='import-agent') as agent_pool, \
+                ThreadPoolExecutor(self.email_workers, thread_name_prefix='import-email') as email_pool:
+            for line_number, row in rows:
+                report['total_rows'] += 1
+                try:
+                    patient, resumed = self._validate(build_patient(row), seen)
+                except ValueError as e:
+                    fail(line_number, row.get('patient_id') if isinstance(row, dict) else None, 'validate', e)
+                    continue
+
+                if resumed:
+                    report['resumed'] += 1
+                    if patient.agent_id:
+                        self._prefetch_summary(patient)
+                        queue_email(line_number, patient)
+                        continue
+                else:
+                    patient.generate_password()
+                    patient.generate_magic_token()
+                    try:
+                        self.storage.add_patient(patient)
+                    except ValueError as e:  # Created elsewhere since validation
+                        fail(line_number, patient.patient_id, 'store', e)
+                        continue
+                    self._mark(patient.patient_id, 'stored')
+                    report['imported'] += 1
+
+                self._prefetch_summary(patient)
+                in_flight[agent_pool.submit(self._provision_agent, patient)] = (line_number, patient)
+                if len(in_flight) >= self.workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            if pending_emails:
+                self._send_email_batch(pending_emails, host_url, report, fail, email_pool)
+
+        elapsed = time.perf_counter() - started
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['rows_per_second'] = round(report['total_rows'] / elapsed, 2) if elapsed else 0.0
+        return report
+
+    def _validate(self, patient: Patient, seen: Dict[str, set]) -> Tuple[Patient, bool]:
+        """Check a row against storage and earlier rows; return (patient, resumed)
+
+        A patient stored by an earlier run of this import is returned as
+        stored (with its credentials and any agent id) so the run can resume.
+        """
+        for field in ('patient_id', 'email', 'name'):
+            value = getattr(patient, field)
+            if value in seen[field]:
+                raise ValueError(f"Duplicate {field} '{value}' earlier in this file")
+        for field in seen:
+            seen[field].add(getattr(patient, field))
+
+        if self._done(patient.patient_id, 'stored'):
+            existing = self.storage.get_patient_by_id(patient.patient_id)
+            if existing:
+                return existing, True
+
+        if not self.storage.validate_patient_id(patient.patient_id):
+            raise ValueError(f"Patient ID '{patient.patient_id}' already exists")
+        if not self.storage.validate_email(patient.email):
+            raise ValueError(f"Email address '{patient.email}' already exists")
+        if self.storage.get_patient_by_name(patient.name):
+            raise ValueError(f"Patient name '{patient.name}' already exists")
+        return patient, False
+
+    def _provision_agent(self, patient: Patient) -> str:
+        """Create the patient's Letta agent (runs on the agent pool)"""
+        agent_id = self.letta_client.create_patient_agent(patient.to_dict())
+        self.storage.update_patient_agent_id(patient.name, agent_id)
+        self._mark(patient.patient_id, 'agent')
+        return agent_id
+
+    def _prefetch_summary(self, patient: Patient):
+        """Start the patient's medical summary now so it is ready by the time their email goes out"""
+        if not self.send_emails or self._done(patient.patient_id, 'email'):
+            return
+        self.email_service.prefetch_medical_summary(patient.to_dict())
+
+    def _send_email(self, patient: Patient, host_url: str) -> bool:
+        patient_data = patient.to_dict()
+        summary = self.email_service.generate_medical_summary(patient_data)
+        return self.email_service.send_patient_credentials_email(
+            patient_data, patient.password, patient.magic_token, host_url, medical_summary=summary
+        )
+
+    def _send_email_batch(self, batch: List[Tuple[int, Patient]], host_url: str, report: Dict,
+                          fail, email_pool: ThreadPoolExecutor):
+        """Send one batch of credential emails and wait for all of them"""
+        futures = {email_pool.submit(self._send_email, patient, host_url): (line_number, patient)
+                   for line_number, patient in batch}
+        for future, (line_number, patient) in futures.items():
+            try:
+                sent = future.result()
+            except Exception as e:
+                fail(line_number, patient.patient_id, 'email', e)
+                continue
+            if not sent:
+                fail(line_number, patient.patient_id, 'email', f"Could not send credentials email to {patient.email}")
+                continue
+            self._mark(patient.patient_id, 'email')
+            report['emails_sent'] += 1
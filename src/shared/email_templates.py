@@ -0,0 +1,94 @@
+"""
+Email Templates Module - HTML email templates with their CSS inlined and placeholders parsed once at startup
+"""
+
+import html
+import os
+import re
+from typing import Dict, List
+
+from .prompts import CompiledTemplate
+
+EMAIL_TEMPLATE_DIR = os.getenv(
+    'EMAIL_TEMPLATE_DIR', os.path.join(os.path.dirname(__file__), '..', '..', 'templates', 'email')
+)
+
+STYLE_BLOCK = re.compile(r'<head>\s*<style>(.*?)</style>\s*</head>\s*', re.S)
+CSS_RULE = re.compile(r'\.([\w-]+)\s*\{([^}]*)\}')
+CLASS_ATTRIBUTE = re.compile(r'\sclass="([^"]*)"')
+HTML_COMMENT = re.compile(r'\s*<!--.*?-->', re.S)
+
+
+class SafeHTML(str):
+    """Markup a template value is allowed to insert without escaping"""
+
+
+def inline_css(source: str) -> str:
+    """Move the rules of the template's <style> block onto the elements that use them
+
+    Mail clients ignore or strip <style>, so each ``class="..."`` becomes the
+    ``style="..."`` of its classes' declarations in order. Only single-class
+    selectors are supported; comments and line indentation are dropped.
+    """
+    match = STYLE_BLOCK.search(source)
+    if not match:
+        raise ValueError('Email template has no <head><style> block')
+    styles = {}
+    for name, body in CSS_RULE.findall(match.group(1)):
+        declarations = [declaration.strip() for declaration in body.split(';') if declaration.strip()]
+        styles[name] = '; '.join(declarations) + ';'
+    leftover = CSS_RULE.sub('', match.group(1)).strip()
+    if leftover:
+        raise ValueError(f"Unsupported CSS in email template: {leftover[:40]}")
+
+    def style_attribute(class_match):
+        try:
+            return ' style="%s"' % ' '.join(styles[name] for name in class_match.group(1).split())
+        except KeyError as e:
+            raise ValueError(f"Email template uses undefined class {e}") from None
+
+    body = CLASS_ATTRIBUTE.sub(style_attribute, source[:match.start()] + source[match.end():])
+    body = HTML_COMMENT.sub('', body)
+    return '\n'.join(line.strip() for line in body.splitlines() if line.strip())
+
+
+class EmailTemplate:
+    """An inlined, pre-parsed HTML email; values are HTML-escaped unless they are SafeHTML"""
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.html = inline_css(source)
+        self._compiled = CompiledTemplate(name, self.html)
+        self.fields = self._compiled.fields
+
+    def render(self, **values) -> str:
+        return self._compiled.render({
+            field: value if isinstance(value, SafeHTML) else html.escape(str(value))
+            for field, value in values.items()
+        })
+
+
+def load_templates(directory: str = EMAIL_TEMPLATE_DIR) -> Dict[str, EmailTemplate]:
+    """Compile every ``<name>.html`` in the directory"""
+    templates = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension == '.html':
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                templates[name] = EmailTemplate(name, f.read())
+    return templates
+
+
+def format_medications(medications: List[Dict]) -> SafeHTML:
+    """One escaped line per medication, separated by <br>"""
+    if not medications:
+        return SafeHTML('None prescribed')
+    return SafeHTML('<br>'.join([html.escape(f"• {med['name']}: {med['dosage']} {med['frequency']}")
+                                 for med in medications]))
+
+
+TEMPLATES = load_templates()
+
+
+def render(template: str, **values) -> str:
+    return TEMPLATES[template].render(**values)
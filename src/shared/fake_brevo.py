@@ -0,0 +1,55 @@
+"""
+Fake Brevo Module - Local stand-in for the Brevo transactional email API, for development and tests
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, List
+
+import sib_api_v3_sdk
+from sib_api_v3_sdk.rest import ApiException
+
+
+class FakeTransactionalEmailsApi:
+    """Records emails instead of sending them; use in place of sib_api_v3_sdk.TransactionalEmailsApi
+
+    ``fail_next(status)`` makes the next calls raise the ApiException Brevo
+    would (429 for rate limiting, 5xx for an outage, 400 for a bad address),
+    and ``latency`` adds a delay to every call.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.sent: List[Dict] = []
+        self._failures = deque()
+        self._lock = threading.Lock()
+
+    def fail_next(self, status: int, times: int = 1):
+        with self._lock:
+            self._failures.extend([status] * times)
+
+    def send_transac_email(self, send_smtp_email):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self._failures:
+                status = self._failures.popleft()
+                raise ApiException(status=status, reason=f"Fake Brevo error {status}")
+            if send_smtp_email.message_versions:
+                versions = [(v.to, v.subject or send_smtp_email.subject) for v in send_smtp_email.message_versions]
+            else:
+                versions = [(send_smtp_email.to, send_smtp_email.subject)]
+            message_ids = []
+            for recipients, subject in versions:
+                message_id = f"<{uuid.uuid4().hex}@fake-brevo>"
+                message_ids.append(message_id)
+                for recipient in recipients:
+                    self.sent.append({'message_id': message_id, 'email': recipient.email, 'name': recipient.name,
+                                      'subject': subject, 'html_content': send_smtp_email.html_content})
+        if len(message_ids) == 1:
+            return sib_api_v3_sdk.CreateSmtpEmail(message_id=message_ids[0])
+        return sib_api_v3_sdk.CreateSmtpEmail(message_ids=message_ids)
@@ -0,0 +1,161 @@
+"""
+History Module - Per-agent cache of recent Letta messages for the patient chat
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# fetch(agent_id, limit, before) returns up to ``limit`` messages older than ``before``
+# (or the newest ones when before is None), oldest first, and raises on failure
+FetchMessages = Callable[[str, int, Optional[str]], List[Dict]]
+
+
+class _Entry:
+    __slots__ = ('messages', 'complete', 'fetched_at', 'synced_with')
+
+    def __init__(self, messages: List[Dict], complete: bool, synced_with: str = None):
+        self.messages = messages
+        self.complete = complete  # True once the agent's first message is cached
+        self.fetched_at = time.monotonic()
+        self.synced_with = synced_with  # The ``latest`` marker this entry was fetched for
+
+
+class MessageHistory:
+    """Recent messages per agent, oldest first, kept current by the messages this process sends
+
+    The first load for an agent fetches from Letta; after that, sent messages
+    and their replies are appended as they come back, so a page load needs no
+    Letta call. Entries older than ``ttl`` (a chat continued in another
+    worker process, say) are still served at once while a background fetch
+    replaces them. ``older`` pages back from a message id, reusing what is
+    cached and fetching only the rest.
+
+    Other processes append to the same chats, so ``recent`` takes the newest
+    message id recorded in shared storage: an entry that neither contains it
+    nor was fetched for it is stale and is fetched again before serving.
+    """
+
+    def __init__(self, fetch: FetchMessages, ttl: float = 600.0, max_agents: int = 1000,
+                 max_messages: int = 200):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_agents = max_agents
+        self.max_messages = max_messages
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def recent(self, agent_id: str, limit: int = 20, latest: str = None) -> Dict:
+        """The newest ``limit`` messages and whether older ones exist
+
+        ``latest`` is the newest message id any process has recorded for the
+        chat (or another marker that changes with it).
+        """
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is not None and latest and latest != entry.synced_with \
+                    and not any(m.get('id') == latest for m in entry.messages):
+                entry = None  # Another process added messages this one has not seen
+            if entry is not None:
+                self._entries.move_to_end(agent_id)
+                if len(entry.messages) >= limit or entry.complete:
+                    if time.monotonic() - entry.fetched_at > self.ttl:
+                        self._refresh_in_background(agent_id, max(limit, len(entry.messages)), entry.synced_with)
+                    return self._page(entry.messages, limit, entry.complete)
+        messages = self.fetch(agent_id, limit, None)
+        self._store(agent_id, _Entry(list(messages), len(messages) < limit, latest))
+        return self._page(messages, limit, len(messages) < limit)
+
+    def older(self, agent_id: str, before: str, limit: int = 20) -> Dict:
+        """Up to ``limit`` messages before the message with id ``before``"""
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            index = self._index(entry, before)
+            if index is not None:
+                cached = entry.messages[:index]
+                if len(cached) >= limit or entry.complete:
+                    return self._page(cached, limit, entry.complete)
+                anchor = next((m['id'] for m in cached if m.get('id')), before)
+                first_id = entry.messages[0].get('id') if entry.messages else None
+        if index is None:
+            messages = self.fetch(agent_id, limit, before)
+            return self._page(messages, limit, len(messages) < limit)
+
+        wanted = limit - len(cached)
+        fetched = self.fetch(agent_id, wanted, anchor)
+        complete = len(fetched) < wanted
+        with self._lock:
+            # Extend the entry unless it was replaced or appended to at the front meanwhile
+            entry = self._entries.get(agent_id)
+            if entry is not None and entry.messages and entry.messages[0].get('id') == first_id:
+                entry.messages[:0] = fetched
+                entry.complete = complete
+                self._trim(entry)
+        return self._page(list(fetched) + cached, limit, complete)
+
+    def append(self, agent_id: str, messages: List[Dict]):
+        """Add messages just exchanged with the agent; ignored until the agent's history is loaded"""
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is None:
+                return
+            known = {m.get('id') for m in entry.messages if m.get('id')}
+            entry.messages.extend(m for m in messages if not m.get('id') or m['id'] not in known)
+            self._trim(entry)
+
+    def invalidate(self, agent_id: str = None):
+        """Drop one agent's cached history, or everyone's"""
+        with self._lock:
+            if agent_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(agent_id, None)
+
+    @staticmethod
+    def _index(entry: Optional[_Entry], message_id: str) -> Optional[int]:
+        if entry is None:
+            return None
+        for i, message in enumerate(entry.messages):
+            if message.get('id') == message_id:
+                return i
+        return None
+
+    @staticmethod
+    def _page(messages: List[Dict], limit: int, complete: bool) -> Dict:
+        page = list(messages[-limit:])
+        has_older = len(messages) > limit or not complete
+        cursor = next((m['id'] for m in page if m.get('id')), None)
+        return {'messages': page, 'next_cursor': cursor if has_older and page else None}
+
+    def _trim(self, entry: _Entry):
+        if len(entry.messages) > self.max_messages:
+            del entry.messages[:len(entry.messages) - self.max_messages]
+            entry.complete = False
+
+    def _store(self, agent_id: str, entry: _Entry):
+        with self._lock:
+            self._trim(entry)
+            self._entries[agent_id] = entry
+            self._entries.move_to_end(agent_id)
+            while len(self._entries) > self.max_agents:
+                self._entries.popitem(last=False)
+
+    def _refresh_in_background(self, agent_id: str, limit: int, synced_with: str = None):
+        """Refetch an expired entry without holding up the caller (lock held)"""
+        if agent_id in self._refreshing:
+            return
+        self._refreshing.add(agent_id)
+
+        def refresh():
+            try:
+                messages = self.fetch(agent_id, limit, None)
+                self._store(agent_id, _Entry(list(messages), len(messages) < limit, synced_with))
+            except Exception as e:
+                print(f"⚠️ Warning: Could not refresh message history for agent {agent_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(agent_id)
+
+        threading.Thread(target=refresh, name='history-refresh', daemon=True).start()
@@ -0,0 +1,228 @@
+"""
+Job Queue Module - Durable background jobs for slow multi-step work like onboarding
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    steps TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    run_after REAL NOT NULL,
+    lease_expires REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after);
+"""
+
+# A step function receives the job payload and the results of earlier steps
+StepFunction = Callable[[Dict, Dict], object]
+
+
+class JobQueue:
+    """SQLite-backed job queue worked by a pool of background threads
+    
+    Each job runs a registered list of named steps in order. A step's result
+    is persisted as soon as it succeeds, so a retried or resumed job picks up
+    at the first unfinished step. A failed step is retried with exponential
+    backoff until ``max_attempts``; after that it is marked failed, later steps
+    still run, and the job ends as failed. Claimed jobs hold a lease, so a job
+    whose worker died is picked up again once the lease runs out.
+    """
+    
+    def __init__(self, filename: str = 'jobs.db', workers: int = 2, max_attempts: int = 3,
+                 retry_delay: float = 5.0, lease_seconds: float = 300.0, poll_interval: float = 1.0):
+        self.filename = filename
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, List[Tuple[str, StepFunction]]] = {}
+        self._leases: Dict[str, float] = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def register(self, kind: str, steps: List[Tuple[str, StepFunction]], lease_seconds: float = None):
+        """Register the ordered steps run for jobs of this kind
+        
+        ``lease_seconds`` overrides the queue's lease for kinds whose single
+        step can outlast it (a long step must not be claimed a second time).
+        """
+        self._handlers[kind] = steps
+        if lease_seconds is not None:
+            self._leases[kind] = lease_seconds
+    
+    def start(self):
+        """Start the worker threads"""
+        self._stopping.clear()
+        self._threads = [t for t in self._threads if t.is_alive()]
+        for i in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self, timeout: float = None):
+        """Stop the workers once their current step finishes"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def submit(self, kind: str, payload: Dict) -> str:
+        """Queue a new job and return its id"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = uuid.uuid4().hex
+        now = datetime.datetime.now().isoformat()
+        steps = [{'name': name, 'status': 'pending', 'attempts': 0, 'error': None, 'result': None}
+                 for name, _ in self._handlers[kind]]
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, status, payload, steps, created_at, updated_at, run_after) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, 'queued', json.dumps(payload), json.dumps(steps), now, now, time.time())
+        )
+        self._wakeup.set()
+        return job_id
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Get a job's status and per-step progress"""
+        row = self._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def list_jobs(self, active_only: bool = False, limit: int = 50) -> List[Dict]:
+        """List recent jobs, newest first"""
+        query = 'SELECT * FROM jobs'
+        if active_only:
+            query += " WHERE status IN ('queued', 'running')"
+        rows = self._connect().execute(query + ' ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+    
+    def queue_depth(self) -> int:
+        """Number of jobs waiting or running"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+    
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'payload': json.loads(row['payload']),
+            'steps': json.loads(row['steps']),
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+    
+    def _claim(self) -> Optional[Dict]:
+        """Atomically take the next runnable job (or one with an expired lease)"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_expires < ?) ORDER BY run_after LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (now + self._lease(row['kind']), datetime.datetime.now().isoformat(), row['id'])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self._row_to_job(row) if row else None
+    
+    def _lease(self, kind: str) -> float:
+        return self._leases.get(kind, self.lease_seconds)
+    
+    def _save(self, job: Dict, status: str, run_after: float = 0.0):
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, steps = ?, error = ?, updated_at = ?, run_after = ?, lease_expires = ? '
+            'WHERE id = ?',
+            (status, json.dumps(job['steps']), job['error'], datetime.datetime.now().isoformat(),
+             run_after, time.time() + self._lease(job['kind']), job['id'])
+        )
+    
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"⚠️ Warning: Could not claim job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+    
+    def _run(self, job: Dict):
+        """Run a job's remaining steps, persisting progress after each one"""
+        handlers = dict(self._handlers.get(job['kind'], []))
+        results = {step['name']: step['result'] for step in job['steps'] if step['status'] == 'succeeded'}
+        
+        for step in job['steps']:
+            if step['status'] in ('succeeded', 'failed'):
+                continue
+            step['status'] = 'running'
+            step['attempts'] += 1
+            self._save(job, 'running')
+            try:
+                result = handlers[step['name']](job['payload'], results)
+            except Exception as e:
+                step['error'] = str(e)
+                if step['attempts'] < self.max_attempts:
+                    step['status'] = 'retrying'
+                    delay = self.retry_delay * (2 ** (step['attempts'] - 1))
+                    print(f"⚠️ Job {job['id']} step '{step['name']}' failed (attempt {step['attempts']}), "
+                          f"retrying in {delay:.0f}s: {e}")
+                    self._save(job, 'queued', run_after=time.time() + delay)
+                    return
+                step['status'] = 'failed'
+                job['error'] = f"Step '{step['name']}' failed: {e}"
+                print(f"❌ Job {job['id']} step '{step['name']}' failed: {traceback.format_exc()}")
+                self._save(job, 'running')
+                continue
+            step['status'] = 'succeeded'
+            step['error'] = None
+            step['result'] = result
+            results[step['name']] = result
+        
+        failed = any(step['status'] == 'failed' for step in job['steps'])
+        self._save(job, 'failed' if failed else 'succeeded')
@@ -1,148 +1,240 @@
+import datetime
 import os
-from typing import Dict, List, Optional
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+import httpx
 from letta_client import Letta, CreateBlock, MessageCreate
+from letta_client.core.api_error import ApiError
 
-class LettaClient:
-    def __init__(self, server_url: str = None):
-        self.server_url = server_url or os.getenv('LETTA_SERVER_URL', 'http://localhost:8283')
-        # Initialize the new Letta client
-        self.client = Letta(base_url=self.server_url)
-    
-    def create_patient_agent(self, patient_data: Dict) -> str:
-        """Create a patient agent with medical history using the new Letta API with OpenAI"""
-        
-        # Create enhanced memory blocks with patient information
-        persona_block = CreateBlock(
-            label="persona",
-            value=f"""You are Prof.Dux, a caring and knowledgeable post-discharge healthcare assistant specifically assigned to {patient_data['name']}.
+from . import prompts
+from .history import MessageHistory
+from .resilience import CircuitBreaker, CircuitOpenError, call_with_retries
 
-🩺 **Your Identity**: You are Prof.Dux, a dedicated healthcare AI assistant with extensive medical knowledge and a compassionate bedside manner, personally caring for {patient_data['name']}.
+# Pulls the patient name out of the "human" memory block
+PATIENT_NAME_PATTERN = re.compile(r'Name: ([^\n]+)')
 
-📋 **Your Patient**: {patient_data['name']} (Patient ID: {patient_data.get('patient_id', 'Not Set')})
+# Default timeout (seconds) per kind of operation; LETTA_TIMEOUT_<KIND> overrides each
+OPERATION_TIMEOUTS = {
+    'create': 60.0,   # Agent creation
+    'message': 90.0,  # A message runs a full agent step
+    'read': 10.0,     # Retrieving agents and listing messages
+    'update': 15.0    # Rewriting memory blocks and agent settings (safe to repeat)
+}
 
-📋 **Your Responsibilities**:
-1. Support {patient_data['name']}'s recovery and wellness with personalized guidance
-2. Monitor conversations for concerning symptoms and alert nurses when needed
-3. Provide clear medication guidance specific to {patient_data['name']}'s prescriptions
-4. Answer health questions with evidence-based information relevant to their conditions
-5. Offer emotional support and encouragement during {patient_data['name']}'s recovery
-6. Alert the nursing staff immediately if you detect urgent medical issues
+# Every patient agent, pooled or not, runs with these settings
+AGENT_SETTINGS = {
+    'model': "openai/gpt-4o-mini",
+    'embedding': "openai/text-embedding-3-small",
+    'context_window_limit': 16000
+}
 
-💡 **Your Communication Style**:
-- Always address {patient_data['name']} by name and introduce yourself as "Prof.Dux"
-- Be warm, professional, and empathetic
-- Reference their specific medical conditions and medications when relevant
-- Provide specific, actionable advice based on their discharge plan
-- Show genuine concern for {patient_data['name']}'s wellbeing
+# Placeholder memory for pooled agents until a patient claims one
+POOL_TAG = 'agent-pool'
+POOL_PERSONA = "You are Prof.Dux, a post-discharge healthcare assistant waiting to be assigned a patient."
+POOL_HUMAN = "No patient has been assigned yet."
 
-⚠️ **Important Guidelines**:
-- If {patient_data['name']} reports severe symptoms, immediately recommend they contact their nurse
-- Never provide emergency medical advice - direct them to call emergency services
-- Always encourage {patient_data['name']} to follow their prescribed treatment plans
-- Be encouraging but realistic about recovery expectations
-- Remember their allergies when discussing any treatments or medications
 
-Remember: You are {patient_data['name']}'s personal healthcare assistant, here to support, guide, and care for them during their recovery journey."""
-        )
-        
-        # Create detailed patient information block
-        medical_info = self._format_medications(patient_data.get('medications', []))
-        patient_block = CreateBlock(
-            label="human",  
-            value=f"""PATIENT INFORMATION - ALWAYS REMEMBER THIS:
+# Responses that say the server is unhealthy rather than that the request was wrong
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
 
-👤 **Patient Details**:
-• Name: {patient_data['name']}
-• Patient ID: {patient_data.get('patient_id', 'Not Set')}
-• Email: {patient_data.get('email', 'Not provided')}
+def _is_transient(error: Exception) -> bool:
+    """Whether an error says Letta is down or overloaded (counts against the breaker)"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, ApiError) and error.status_code in TRANSIENT_STATUSES
 
-🏥 **Medical History**:
-• Current Medical Conditions: {', '.join(patient_data.get('conditions', [])) or 'None listed'}
-• Known Allergies: {', '.join(patient_data.get('allergies', [])) or 'None known'}
 
-💊 **Current Medications**:
-{medical_info}
+def _not_delivered(error: Exception) -> bool:
+    """Whether a request certainly never ran, so even a non-idempotent one can be retried"""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    return isinstance(error, ApiError) and error.status_code in (429, 502, 503)
 
-📋 **Discharge Plan**:
-{patient_data.get('discharge_plan', 'Standard follow-up care')}
 
-🎯 **Care Instructions**: 
-Always reference this patient information when providing care. Address {patient_data['name']} by name, consider their specific conditions and medications, and be aware of their allergies. This is {patient_data['name']}'s personalized healthcare assistant session."""
+class LettaClient:
+    def __init__(self, server_url: str = None, agent_cache_ttl: float = None):
+        self.server_url = server_url or os.getenv('LETTA_SERVER_URL', 'http://localhost:8283')
+        
+        # Connecting gives up quickly whatever the operation, so a dead server fails fast
+        connect_timeout = float(os.getenv('LETTA_CONNECT_TIMEOUT', '5'))
+        self.timeouts = {
+            operation: httpx.Timeout(float(os.getenv(f"LETTA_TIMEOUT_{operation.upper()}", default)),
+                                     connect=connect_timeout)
+            for operation, default in OPERATION_TIMEOUTS.items()
+        }
+        # One keep-alive pool shared by every request thread; waiting for a free
+        # connection counts as connecting
+        self.http = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv('LETTA_MAX_CONNECTIONS', '32')),
+                max_keepalive_connections=int(os.getenv('LETTA_MAX_KEEPALIVE', '16')),
+                keepalive_expiry=30.0
+            ),
+            timeout=self.timeouts['read'],
+            follow_redirects=True
+        )
+        self.client = Letta(base_url=self.server_url, httpx_client=self.http,
+                            timeout=OPERATION_TIMEOUTS['read'])
+        
+        self.retry_attempts = int(os.getenv('LETTA_RETRY_ATTEMPTS', '3'))
+        self.retry_base_delay = float(os.getenv('LETTA_RETRY_BASE_DELAY', '0.5'))
+        self.retry_max_delay = float(os.getenv('LETTA_RETRY_MAX_DELAY', '8'))
+        self.breaker = CircuitBreaker(
+            'Letta',
+            failure_threshold=int(os.getenv('LETTA_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('LETTA_BREAKER_RESET', '30'))
+        )
+        
+        # Agent metadata cache: agent_id -> (expires_at, metadata)
+        self.agent_cache_ttl = agent_cache_ttl if agent_cache_ttl is not None else float(
+            os.getenv('LETTA_AGENT_CACHE_TTL', '300'))
+        self._agent_cache: Dict[str, tuple] = {}
+        self._agent_cache_lock = threading.Lock()
+        
+        # Optional AgentPool of pre-created agents that create_patient_agent claims from
+        self.agent_pool = None
+        
+        # Recent messages per agent for the patient chat, kept current by send_message
+        self.history = MessageHistory(
+            self._list_messages,
+            ttl=float(os.getenv('LETTA_HISTORY_TTL', '600')),
+            max_agents=int(os.getenv('LETTA_HISTORY_AGENTS', '1000'))
         )
+    
+    def _call(self, operation: str, fn, *args, **kwargs):
+        """Make one SDK call with the operation's timeout, retries and the circuit breaker
+        
+        Reads and updates are retried on any transient error. Creates and messages are
+        only retried when the request never reached Letta, so a slow reply is
+        never sent twice. Raises CircuitOpenError at once while Letta is down.
+        """
+        # The SDK passes this straight to httpx, so the short connect timeout is kept
+        kwargs['request_options'] = {'timeout_in_seconds': self.timeouts[operation]}
+        return call_with_retries(
+            lambda: fn(*args, **kwargs),
+            attempts=self.retry_attempts,
+            base_delay=self.retry_base_delay,
+            max_delay=self.retry_max_delay,
+            is_failure=_is_transient,
+            is_retryable=_is_transient if operation in ('read', 'update') else _not_delivered,
+            breaker=self.breaker
+        )
+    
+    def create_patient_agent(self, patient_data: Dict) -> str:
+        """Create a patient agent with medical history using the new Letta API with OpenAI
+        
+        With an agent pool attached, a pre-created agent is claimed instead and
+        only its memory is written; the initial context message then goes out
+        in the background. An empty pool falls back to creating an agent.
+        """
+        if self.agent_pool:
+            agent_id = self.agent_pool.claim()
+            if agent_id:
+                try:
+                    self._assign_pool_agent(agent_id, patient_data)
+                except Exception as e:
+                    print(f"⚠️ Warning: Could not assign pooled agent {agent_id}, creating a new one: {e}")
+                    # Its memory may already hold part of this patient's details; never leave it behind
+                    try:
+                        self._call('update', self.client.agents.delete, agent_id)
+                    except Exception as delete_error:
+                        print(f"❌ Could not delete half-assigned pooled agent {agent_id}: {delete_error}")
+                else:
+                    threading.Thread(target=self._send_initial_context, args=(agent_id, patient_data),
+                                     name='agent-context', daemon=True).start()
+                    self._cache_agent_metadata(agent_id, {'patient_name': patient_data['name']})
+                    return agent_id
+        
+        # Create enhanced memory blocks with patient information
+        persona_block = CreateBlock(label="persona", value=self._persona_text(patient_data))
+        
+        # Create detailed patient information block
+        patient_block = CreateBlock(label="human", value=self._human_text(patient_data))
         
         # Create agent using OpenAI models
-        agent = self.client.agents.create(
-            name=f"prof-dux-{patient_data['name'].lower().replace(' ', '-')}",
+        agent = self._call(
+            'create',
+            self.client.agents.create,
+            name=self._agent_name(patient_data),
             memory_blocks=[persona_block, patient_block],
-            model="openai/gpt-4o-mini",
-            embedding="openai/text-embedding-3-small",
-            context_window_limit=16000
+            metadata={'prompt_version': prompts.PROMPT_VERSION},
+            **AGENT_SETTINGS
         )
         
         # Send an initial system message to reinforce patient context
+        self._send_initial_context(agent.id, patient_data)
+        
+        self._cache_agent_metadata(agent.id, {'patient_name': patient_data['name']})
+        return agent.id
+    
+    def create_pool_agent(self) -> str:
+        """Create a generic agent for the agent pool; create_patient_agent fills it in on claim"""
+        agent = self._call(
+            'create',
+            self.client.agents.create,
+            name=f"prof-dux-pool-{uuid.uuid4().hex[:12]}",
+            memory_blocks=[CreateBlock(label="persona", value=POOL_PERSONA),
+                           CreateBlock(label="human", value=POOL_HUMAN)],
+            tags=[POOL_TAG],
+            **AGENT_SETTINGS
+        )
+        return agent.id
+    
+    def _assign_pool_agent(self, agent_id: str, patient_data: Dict):
+        """Turn a pooled agent into this patient's agent by rewriting its memory"""
+        self._call('update', self.client.agents.blocks.modify, agent_id, 'persona',
+                   value=self._persona_text(patient_data))
+        self._call('update', self.client.agents.blocks.modify, agent_id, 'human',
+                   value=self._human_text(patient_data))
+        self._call('update', self.client.agents.modify, agent_id, name=self._agent_name(patient_data), tags=[],
+                   metadata={'prompt_version': prompts.PROMPT_VERSION})
+    
+    def _send_initial_context(self, agent_id: str, patient_data: Dict):
         try:
-            initial_context = f"""SYSTEM CONTEXT: You are now active as Prof.Dux, the personal healthcare assistant for {patient_data['name']} (ID: {patient_data.get('patient_id', 'Not Set')}). 
-
-Key patient information:
-- Conditions: {', '.join(patient_data.get('conditions', [])) or 'None'}
-- Medications: {len(patient_data.get('medications', []))} prescribed medications
-- Allergies: {', '.join(patient_data.get('allergies', [])) or 'None known'}
-
-When {patient_data['name']} messages you, greet them warmly by name and let them know you're here to help with their recovery. Always remember their specific medical information when providing guidance."""
-            
-            self.client.agents.messages.create(
-                agent_id=agent.id,
-                messages=[MessageCreate(role="system", content=initial_context)]
+            self._call(
+                'message',
+                self.client.agents.messages.create,
+                agent_id=agent_id,
+                messages=[MessageCreate(role="system", content=self._initial_context_text(patient_data))]
             )
             print(f"✅ Successfully initialized agent context for {patient_data['name']}")
             
         except Exception as e:
             print(f"⚠️ Warning: Could not send initial context message: {e}")
-        
-        return agent.id
     
-    def send_message(self, agent_id: str, message: str) -> Dict:
-        """Send message to agent and get response using new API"""
+    @staticmethod
+    def _agent_name(patient_data: Dict) -> str:
+        return f"prof-dux-{patient_data['name'].lower().replace(' ', '-')}"
+    
+    @staticmethod
+    def _persona_text(patient_data: Dict) -> str:
+        return prompts.render('persona', patient_data)
+    
+    @staticmethod
+    def _human_text(patient_data: Dict) -> str:
+        return prompts.render('patient_info', patient_data)
+    
+    @staticmethod
+    def _initial_context_text(patient_data: Dict) -> str:
+        return prompts.render('initial_context', patient_data)
+    
+    def send_message(self, agent_id: str, message: str, patient_name: str = None) -> Dict:
+        """Send message to agent and get response using new API
+        
+        Passing patient_name skips the agent metadata lookup entirely.
+        """
         try:
-            # Determine message role - if it's a nurse instruction, send as system message
-            if message.startswith('📋 **CARE INSTRUCTION FROM NURSE:**'):
-                role = "system"
-                content = message
-            else:
-                role = "user"
-                content = message
-            
-            # Get agent memory to check if patient context is available
-            try:
-                agent = self.client.agents.get(agent_id)
-                patient_name = "Unknown Patient"
-                
-                # Extract patient name from memory blocks
-                if hasattr(agent, 'memory_blocks') and agent.memory_blocks:
-                    for block in agent.memory_blocks:
-                        if hasattr(block, 'value') and 'Patient Details' in str(block.value):
-                            # Extract patient name from the memory block
-                            import re
-                            name_match = re.search(r'Name: ([^\n]+)', str(block.value))
-                            if name_match:
-                                patient_name = name_match.group(1).strip()
-                                break
-                
-                # If this is a user message, enhance it with patient context reminder
-                if role == "user" and patient_name != "Unknown Patient":
-                    content = f"Patient {patient_name} says: {message}"
-                    
-            except Exception as e:
-                print(f"⚠️ Warning: Could not retrieve agent memory: {e}")
-            
-            response = self.client.agents.messages.create(
+            prepared = self._prepare_message(agent_id, message, patient_name)
+            response = self._call(
+                'message',
+                self.client.agents.messages.create,
                 agent_id=agent_id,
-                messages=[
-                    MessageCreate(
-                        role=role,
-                        content=content
-                    )
-                ]
+                messages=[prepared]
             )
             
             # Convert response to JSON-serializable format
@@ -150,36 +242,145 @@ When {patient_data['name']} messages you, greet them warmly by name and let them
             if hasattr(response, 'messages') and response.messages:
                 for msg in response.messages:
                     try:
-                        # Extract message info based on the new API structure
-                        content_text = ''
-                        if hasattr(msg, 'content') and msg.content:
-                            content_text = str(msg.content)
-                        elif hasattr(msg, 'reasoning') and msg.reasoning:
-                            content_text = str(msg.reasoning)
-                        
-                        msg_data = {
-                            'id': getattr(msg, 'id', ''),
-                            'message_type': getattr(msg, 'message_type', 'unknown'),
-                            'content': content_text,
-                            'date': str(getattr(msg, 'created_at', ''))
-                        }
-                        serializable_messages.append(msg_data)
+                        serializable_messages.append(self._serialize_message(msg))
                     except Exception as e:
                         print(f"⚠️  Warning: Could not serialize message: {e}")
                         continue
+            self._record_exchange(agent_id, prepared, serializable_messages)
             
             return {
                 "messages": serializable_messages,
                 "success": True,
                 "message_count": len(serializable_messages)
             }
+        except CircuitOpenError:
+            raise
         except Exception as e:
             raise Exception(f"Failed to send message: {str(e)}")
     
+    def stream_message(self, agent_id: str, message: str, patient_name: str = None) -> Iterator[Dict]:
+        """Send message to agent and yield response chunks as they arrive
+        
+        Assistant messages arrive as token deltas that share the message id.
+        A stream is never retried, since part of the reply may already be out.
+        """
+        prepared = self._prepare_message(agent_id, message, patient_name)
+        self.breaker.before_call()
+        error = None
+        replies: Dict[str, Dict] = {}
+        try:
+            stream = self.client.agents.messages.create_stream(
+                agent_id=agent_id,
+                messages=[prepared],
+                stream_tokens=True,
+                request_options={'timeout_in_seconds': self.timeouts['message']}
+            )
+            for chunk in stream:
+                if not hasattr(chunk, 'message_type'):
+                    continue  # Usage statistics
+                serialized = self._serialize_message(chunk)
+                if serialized['id'] in replies:
+                    replies[serialized['id']]['content'] += serialized['content']
+                else:
+                    replies[serialized['id']] = dict(serialized)
+                yield serialized
+            self._record_exchange(agent_id, prepared, list(replies.values()))
+        except Exception as e:
+            error = e
+            raise Exception(f"Failed to stream message: {str(e)}")
+        finally:
+            # Also runs when the client disconnects mid-stream
+            if error is not None and _is_transient(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+    
+    def _record_exchange(self, agent_id: str, prepared: MessageCreate, replies: List[Dict]):
+        """Append a patient message and the agent's replies to the cached history
+        
+        A nurse instruction drops the history instead, so the next page load
+        shows it as Letta recorded it; other workers notice through the
+        patient's last_message_id, which the app updates for both.
+        """
+        if prepared.role == 'system':
+            self.history.invalidate(agent_id)
+            return
+        sent = {'id': None, 'message_type': 'user_message', 'content': prepared.content,
+                'date': str(datetime.datetime.now(datetime.timezone.utc))}
+        self.history.append(agent_id, [sent] + replies)
+    
+    def _prepare_message(self, agent_id: str, message: str, patient_name: str = None) -> MessageCreate:
+        """Build the MessageCreate for a patient message or nurse instruction"""
+        # Determine message role - if it's a nurse instruction, send as system message
+        if message.startswith('📋 **CARE INSTRUCTION FROM NURSE:**'):
+            return MessageCreate(role="system", content=message)
+        
+        # Enhance user messages with a patient context reminder
+        if patient_name is None:
+            patient_name = self.get_agent_metadata(agent_id).get('patient_name')
+        if patient_name:
+            return MessageCreate(role="user", content=f"Patient {patient_name} says: {message}")
+        return MessageCreate(role="user", content=message)
+    
+    def get_agent_metadata(self, agent_id: str) -> Dict:
+        """Get cached agent metadata, fetching it from Letta when missing or expired"""
+        with self._agent_cache_lock:
+            cached = self._agent_cache.get(agent_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        metadata = {}
+        try:
+            agent = self._call('read', self.client.agents.retrieve, agent_id)
+            memory = getattr(agent, 'memory', None)
+            blocks = getattr(memory, 'blocks', None) or getattr(agent, 'memory_blocks', None) or []
+            
+            # Extract patient name from memory blocks
+            for block in blocks:
+                value = str(getattr(block, 'value', ''))
+                if 'Patient Details' in value:
+                    name_match = PATIENT_NAME_PATTERN.search(value)
+                    if name_match:
+                        metadata['patient_name'] = name_match.group(1).strip()
+                        break
+        except Exception as e:
+            print(f"⚠️ Warning: Could not retrieve agent memory: {e}")
+            return metadata  # Don't cache failures
+        
+        self._cache_agent_metadata(agent_id, metadata)
+        return metadata
+    
+    def invalidate_agent_cache(self, agent_id: str = None):
+        """Drop cached metadata for one agent, or for all agents"""
+        with self._agent_cache_lock:
+            if agent_id is None:
+                self._agent_cache.clear()
+            else:
+                self._agent_cache.pop(agent_id, None)
+    
+    def _cache_agent_metadata(self, agent_id: str, metadata: Dict):
+        with self._agent_cache_lock:
+            self._agent_cache[agent_id] = (time.monotonic() + self.agent_cache_ttl, metadata)
+    
+    def _serialize_message(self, msg) -> Dict:
+        """Extract message info based on the new API structure"""
+        content_text = ''
+        if hasattr(msg, 'content') and msg.content:
+            content_text = str(msg.content)
+        elif hasattr(msg, 'reasoning') and msg.reasoning:
+            content_text = str(msg.reasoning)
+        
+        return {
+            'id': getattr(msg, 'id', ''),
+            'message_type': getattr(msg, 'message_type', 'unknown'),
+            'content': content_text,
+            'date': str(getattr(msg, 'created_at', ''))
+        }
+    
     def get_agent_memory(self, agent_id: str) -> Dict:
         """Get agent's memory blocks for debugging"""
         try:
-            agent = self.client.agents.get(agent_id)
+            agent = self._call('read', self.client.agents.retrieve, agent_id)
             memory_info = {
                 "agent_name": getattr(agent, 'name', 'Unknown'),
                 "memory_blocks": []
@@ -203,21 +404,17 @@ When {patient_data['name']} messages you, greet them warmly by name and let them
         """Refresh patient context in agent memory if needed"""
         try:
             # Send a context refresh message
-            context_refresh = f"""CONTEXT REFRESH: Remember, you are Prof.Dux caring for {patient_data['name']} (ID: {patient_data.get('patient_id', 'Not Set')}).
-
-Current patient details:
-• Medical Conditions: {', '.join(patient_data.get('conditions', [])) or 'None listed'}
-• Current Medications: {self._format_medications(patient_data.get('medications', []))}
-• Known Allergies: {', '.join(patient_data.get('allergies', [])) or 'None known'}
-• Discharge Plan: {patient_data.get('discharge_plan', 'Standard follow-up care')}
-
-Always address {patient_data['name']} by name and reference their specific medical information when providing guidance."""
+            context_refresh = prompts.render('context_refresh', patient_data)
             
-            self.client.agents.messages.create(
+            self._call(
+                'message',
+                self.client.agents.messages.create,
                 agent_id=agent_id,
                 messages=[MessageCreate(role="system", content=context_refresh)]
             )
+            self.history.invalidate(agent_id)
             
+            self._cache_agent_metadata(agent_id, {'patient_name': patient_data['name']})
             print(f"✅ Refreshed patient context for {patient_data['name']}")
             return True
             
@@ -228,7 +425,7 @@ Always address {patient_data['name']} by name and reference their specific medic
     def list_agents(self) -> List[Dict]:
         """List all agents"""
         try:
-            agents = self.client.agents.list()
+            agents = self._call('read', self.client.agents.list)
             # Handle both paginated and direct list responses
             agents_list = agents.data if hasattr(agents, 'data') else agents
             return [{"id": agent.id, "name": agent.name} for agent in agents_list]
@@ -238,29 +435,43 @@ Always address {patient_data['name']} by name and reference their specific medic
     def get_agent_messages(self, agent_id: str, limit: int = 10) -> List[Dict]:
         """Get recent messages for agent"""
         try:
-            messages = self.client.agents.messages.list(agent_id, limit=limit)
-            serializable_messages = []
-            
-            messages_list = messages.data if hasattr(messages, 'data') else messages
-            for msg in messages_list:
-                try:
-                    msg_data = {
-                        'message_type': getattr(msg, 'message_type', 'unknown'),
-                        'content': getattr(msg, 'content', '') or str(getattr(msg, 'reasoning', '')),
-                        'date': str(getattr(msg, 'created_at', ''))
-                    }
-                    serializable_messages.append(msg_data)
-                except Exception as e:
-                    print(f"⚠️  Warning: Could not serialize message: {e}")
-                    continue
-                    
-            return serializable_messages
+            return self._list_messages(agent_id, limit)
         except Exception as e:
             return []
     
-    def _format_medications(self, medications: List[Dict]) -> str:
-        """Format medications list for memory"""
-        if not medications:
-            return "None prescribed"
-        return '\n'.join([f"  • {med['name']}: {med['dosage']} {med['frequency']}" 
-                         for med in medications])
+    def get_message_history(self, agent_id: str, limit: int = 20, before: str = None,
+                            latest: str = None) -> Dict:
+        """A page of chat history, oldest first, served from the history cache when possible
+        
+        Pass the ``next_cursor`` of a page as ``before`` to load the messages
+        preceding it; ``next_cursor`` is None once the first message is reached.
+        ``latest`` is the patient's stored last_message_id: a cached page that
+        does not reach it was written before another worker's exchange.
+        """
+        if before:
+            return self.history.older(agent_id, before, limit)
+        return self.history.recent(agent_id, limit, latest)
+    
+    def _list_messages(self, agent_id: str, limit: int, before: str = None) -> List[Dict]:
+        """List an agent's messages (the newest, or those before a message id), oldest first"""
+        kwargs = {'limit': limit}
+        if before:
+            kwargs['before'] = before
+        messages = self._call('read', self.client.agents.messages.list, agent_id, **kwargs)
+        serializable_messages = []
+        
+        messages_list = messages.data if hasattr(messages, 'data') else messages
+        for msg in messages_list:
+            try:
+                msg_data = {
+                    'id': getattr(msg, 'id', ''),
+                    'message_type': getattr(msg, 'message_type', 'unknown'),
+                    'content': getattr(msg, 'content', '') or str(getattr(msg, 'reasoning', '')),
+                    'date': str(getattr(msg, 'created_at', ''))
+                }
+                serializable_messages.append(msg_data)
+            except Exception as e:
+                print(f"⚠️  Warning: Could not serialize message: {e}")
+                continue
+                
+        return serializable_messages
@@ -0,0 +1,126 @@
+"""
+Message Filter Module - Decides which agent and patient messages the chat shows, and how
+"""
+
+import json
+import os
+from typing import Dict, List, Tuple
+
+WORD_CHARS = "_'’‘`"  # Besides letters and digits, these continue a word
+
+# Visibility rules; a rules file with any of these keys overrides them
+DEFAULT_RULES = {
+    # Agent replies mentioning these are its own bookkeeping, not an answer to the patient
+    'internal_phrases': [
+        'core memory', 'archival memory', 'system_alert', 'no need to', 'i can answer using', 'i should'
+    ],
+    # Messages containing these are never shown, whoever sent them
+    'hidden_phrases': ['More human than human is our motto'],
+    # Labels some agents prefix their messages with
+    'speaker_labels': {'user_message': '**You:**', 'assistant_message': '**Assistant:**'},
+    'nurse_prefix': '📋 **CARE INSTRUCTION FROM NURSE:**',
+    'nurse_label': 'Nurse:'
+}
+
+
+def compile_phrases(phrases: List[str]) -> Tuple[str, ...]:
+    """Lowercase, whitespace-normalised, de-duplicated phrases, longest first"""
+    normalised = {' '.join(phrase.lower().split()) for phrase in phrases}
+    normalised.discard('')
+    return tuple(sorted(normalised, key=lambda phrase: (-len(phrase), phrase)))
+
+
+def contains_phrase(lowered: str, phrases: Tuple[str, ...]) -> bool:
+    """Whether any phrase occurs in the lowercased text as whole words"""
+    for phrase in phrases:
+        if phrase not in lowered:
+            continue
+        start = lowered.find(phrase)
+        while start >= 0:
+            end = start + len(phrase)
+            before = lowered[start - 1] if start else ' '
+            after = lowered[end] if end < len(lowered) else ' '
+            if not (before.isalnum() or before in WORD_CHARS) and not (after.isalnum() or after in WORD_CHARS):
+                return True
+            start = lowered.find(phrase, start + 1)
+    return False
+
+
+class MessageFilter:
+    """Selects the messages the patient chat shows, in one pass with precompiled rules
+
+    A message is shown when it is a patient message, an agent reply or a
+    nurse instruction, and it is not empty, JSON or a hidden phrase. Agent
+    replies are also hidden when they mention an internal phrase. There is
+    no length floor: tool calls arrive as their own message types, and a
+    short answer like "Yes, do." is still an answer. Phrases match whole
+    words in any case. Each message is stripped and lowercased once and each
+    rule checked at most once, with substring search rather than a regex
+    (CPython's regex engine is slower than a handful of str.find calls
+    here). The live reply and the history go through the same loop, so a
+    reply shown live is still shown after a reload.
+    """
+
+    def __init__(self, rules: Dict = None, rules_file: str = None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        if rules_file and os.path.exists(rules_file):
+            try:
+                with open(rules_file) as f:
+                    self.rules.update(json.load(f))
+                print(f"✅ Loaded message filter rules from {rules_file}")
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Warning: Could not load message filter rules from {rules_file}: {e}")
+        # Agent replies are checked against both phrase lists, everything else just the hidden one
+        self._assistant_phrases = compile_phrases(self.rules['hidden_phrases'] + self.rules['internal_phrases'])
+        self._hidden_phrases = compile_phrases(self.rules['hidden_phrases'])
+        self._assistant_label = self.rules['speaker_labels'].get('assistant_message')
+        self._user_label = self.rules['speaker_labels'].get('user_message')
+        self._nurse_prefix = self.rules['nurse_prefix']
+        self._nurse_label = self.rules['nurse_label']
+
+    def for_display(self, messages: List[Dict]) -> List[Dict]:
+        """The chat history as ``{'role', 'text'}`` entries"""
+        return self._select(messages, replies_only=False)
+
+    def agent_replies(self, messages: List[Dict]) -> List[Dict]:
+        """The agent replies among a response's messages that the chat shows, unchanged"""
+        return self._select(messages, replies_only=True)
+
+    def _select(self, messages: List[Dict], replies_only: bool) -> List[Dict]:
+        """Display entries for the shown messages, or the shown replies themselves when replies_only"""
+        assistant_phrases, hidden_phrases = self._assistant_phrases, self._hidden_phrases
+        assistant_label, user_label = self._assistant_label, self._user_label
+        nurse_prefix = self._nurse_prefix
+        shown = []
+        append = shown.append
+        for msg in messages:
+            msg_type = msg.get('message_type')
+            if msg_type == 'reasoning_message' or (replies_only and msg_type != 'assistant_message'):
+                continue
+            content = msg.get('content')
+            if not content:
+                continue
+            text = content.strip()
+            if not text or text[0] == '{':
+                continue
+
+            if msg_type == 'assistant_message':
+                if contains_phrase(text.lower(), assistant_phrases):
+                    continue
+                if assistant_label:
+                    text = text.replace(assistant_label, '').strip()
+                if text:
+                    append(msg if replies_only else {'role': 'assistant', 'text': text})
+                continue
+
+            if contains_phrase(text.lower(), hidden_phrases):
+                continue
+            if text.startswith(nurse_prefix):
+                append({'role': 'system', 'text': f"{self._nurse_label} {text[len(nurse_prefix):].strip()}"})
+            elif msg_type == 'user_message':
+                if user_label:
+                    text = text.replace(user_label, '').strip()
+                if text and text[0] != '{':
+                    append({'role': 'user', 'text': text})
+        return shown
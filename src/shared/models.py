@@ -1,10 +1,17 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import List, Dict, Optional
+import atexit
+import bisect
 import json
 import datetime
+import fcntl
 import os
 import secrets
 import string
+import tempfile
+import threading
+import time
 
 @dataclass
 class Medication:
@@ -25,6 +32,8 @@ class Patient:
     password: Optional[str] = None  # Generated password
     magic_token: Optional[str] = None  # Magic link token
     token_expires: Optional[str] = None  # Token expiration
+    context_primed: bool = False  # Agent has had the patient context refreshed
+    last_message_id: Optional[str] = None  # Last Letta message seen in chat
     
     def to_dict(self) -> Dict:
         return {
@@ -39,7 +48,9 @@ class Patient:
             'agent_id': self.agent_id,
             'password': self.password,
             'magic_token': self.magic_token,
-            'token_expires': self.token_expires
+            'token_expires': self.token_expires,
+            'context_primed': self.context_primed,
+            'last_message_id': self.last_message_id
         }
     
     @classmethod
@@ -56,7 +67,9 @@ class Patient:
             agent_id=data.get('agent_id'),
             password=data.get('password'),
             magic_token=data.get('magic_token'),
-            token_expires=data.get('token_expires')
+            token_expires=data.get('token_expires'),
+            context_primed=data.get('context_primed', False),
+            last_message_id=data.get('last_message_id')
         )
     
     def generate_password(self) -> str:
@@ -82,12 +95,122 @@ class Patient:
         expiry = datetime.datetime.fromisoformat(self.token_expires)
         return datetime.datetime.now() < expiry
 
+# Least urgent alerts are evicted first once the alerts list is full
+ALERT_PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+
+def _alert_eviction_index(alerts: List[Dict]) -> int:
+    """Index of the alert to drop when over the limit: the oldest of the least urgent"""
+    return max(range(len(alerts)),
+               key=lambda i: (ALERT_PRIORITY_RANK.get(alerts[i].get('priority'), 1), -i))
+
+
+def _alert_window_open(alert: Dict, timestamp: str, window: float) -> bool:
+    """Whether a new alert at ``timestamp`` still falls in ``alert``'s coalescing window"""
+    opened = datetime.datetime.fromisoformat(alert.get('first_timestamp') or alert['timestamp'])
+    return (datetime.datetime.fromisoformat(timestamp) - opened).total_seconds() < window
+
+
+def _page_newest_first(records: List[Dict], cursor: Optional[int], limit: int,
+                       since: str = None, until: str = None, **equals) -> Dict:
+    """Walk id-ordered records backwards from ``cursor`` collecting one filtered page"""
+    # Records are appended in id order, so the cursor can be found by bisection
+    position = len(records) if cursor is None else bisect.bisect_left(records, cursor, key=lambda r: r['id'])
+    items = []
+    while position > 0 and len(items) < limit:
+        position -= 1
+        record = records[position]
+        timestamp = record.get('timestamp') or ''
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue  # Coalesced alerts move their timestamp, so ids are not in time order
+        if any(value is not None and record.get(field) != value for field, value in equals.items()):
+            continue
+        items.append(dict(record))
+    more = position > 0 and len(items) == limit
+    return {'items': items, 'next_cursor': items[-1]['id'] if more else None}
+
+
 class SimpleStorage:
-    """Simple file-based storage for demo purposes"""
+    """Simple file-based storage for demo purposes
+    
+    By default every mutation rewrites the whole JSON file. In journal mode
+    mutations are appended as small records to ``<filename>.journal``, replayed
+    on startup, and folded into a fresh snapshot by a background compaction
+    once the journal grows past ``compact_threshold`` bytes.
+    
+    In shared mode several processes may use the same files: every mutation
+    runs under an exclusive ``flock`` on ``<filename>.lock``, and reads reload
+    from disk only when the data or journal file has changed.
     
-    def __init__(self, filename: str = 'data.json'):
+    Snapshots are written to a temp file, fsynced and atomically renamed into
+    place. With ``flush_interval`` > 0, mutations inside that window share a
+    single flush (snapshot rewrite, or journal fsync in journal mode) instead
+    of paying for one each. Shared mode still writes and renames the snapshot
+    before releasing the lock so other processes see the change; only its
+    fsyncs are batched there. Mutations committed with ``durable=False`` (the
+    chat's last seen message id, whose loss costs one history refetch) get
+    that treatment even without a window, deferred by up to
+    LAZY_FLUSH_INTERVAL seconds.
+    
+    Repeated alerts for the same patient and priority within
+    ``alert_window`` seconds of the first are coalesced into that alert (its
+    ``count`` goes up and it keeps the latest message). At most ``max_alerts``
+    are kept; beyond that the oldest of the least urgent alerts is dropped.
+    """
+    
+    # Patient fields that get a hash index for O(1) lookups
+    INDEXED_FIELDS = ('patient_id', 'name', 'email', 'magic_token')
+    
+    # Mutations that change the alerts list and advance ``alert_seq``
+    ALERT_OPS = ('add_alert', 'coalesce_alert', 'clear_alerts', 'remove_alert', 'delete_patient', 'expire_records')
+    
+    # How often alert waiters re-check the files in shared mode
+    ALERT_POLL_INTERVAL = 1.0
+    
+    # Hourly rollup buckets kept before the oldest are dropped
+    ROLLUP_RETENTION_HOURS = 24 * 90
+    
+    # Longest a non-durable mutation waits to be written or fsynced
+    LAZY_FLUSH_INTERVAL = 5.0
+    
+    def __init__(self, filename: str = 'data.json', journal: bool = False,
+                 compact_threshold: int = 1024 * 1024, shared: bool = False,
+                 flush_interval: float = 0.0, alert_window: float = 300.0, max_alerts: int = 500):
         self.filename = filename
-        self.data = self._load_data()
+        self.journal = journal
+        self.journal_filename = f"{filename}.journal"
+        self.compact_threshold = compact_threshold
+        self.shared = shared
+        self.lock_filename = f"{filename}.lock"
+        self.flush_interval = flush_interval
+        self.alert_window = alert_window
+        self.max_alerts = max_alerts
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._flush_timer = None
+        self._dirty = False
+        self._snapshot_unsynced = False
+        self._journal_unsynced = False
+        self._journal_file = None
+        self._compacting = False
+        self._lock_fd = None
+        self._lock_pid = None
+        self._lock_depth = 0
+        self._stamp = None
+        self._journal_offset = 0
+        self._indexes: Dict[str, Dict[str, Dict]] = {}
+        self._open_alerts: Dict[tuple, Dict] = {}
+        self._sorted_names: List[str] = []
+        self._patient_counts = {'patients': 0, 'active_agents': 0}
+        self._alert_counts: Dict[str, int] = {}
+        self._instructions_by_patient: Dict[str, List[Dict]] = {}
+        self._alerts_changed = threading.Condition()
+        with self._file_lock(fcntl.LOCK_SH):
+            self._reload()
+        if not self.journal and self._journal_exists():
+            # Journal mode was switched off; fold what is left into data.json
+            self.compact()
+        atexit.register(self.flush)  # Also writes out pending non-durable mutations
     
     def _load_data(self) -> Dict:
         try:
@@ -100,134 +223,604 @@ class SimpleStorage:
                 'nurse_instructions': []
             }
     
-    def _save_data(self):
-        with open(self.filename, 'w') as f:
-            json.dump(self.data, f, indent=2)
+    def _save_data(self, sync: bool = True):
+        self._write_snapshot(json.dumps(self.data, indent=2), sync)
     
-    def add_patient(self, patient: Patient):
-        """Add a new patient to storage"""
-        # Check if patient ID already exists
-        existing_ids = [p.get('patient_id') for p in self.data['patients']]
-        if patient.patient_id in existing_ids:
-            raise ValueError(f"Patient ID '{patient.patient_id}' already exists")
+    def _write_snapshot(self, snapshot: str, sync: bool = True):
+        """Atomically replace data.json so a crash never leaves it truncated
         
-        # Check if patient name already exists
-        existing_names = [p.get('name') for p in self.data['patients']]
-        if patient.name in existing_names:
-            raise ValueError(f"Patient name '{patient.name}' already exists")
+        Every write gets its own temp file, so a compaction and a commit never
+        write into the same one. Without ``sync`` the fsyncs are left to the
+        next flush.
+        """
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix=f"{os.path.basename(self.filename)}.", suffix='.tmp',
+                                            dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                os.fchmod(f.fileno(), 0o644)  # mkstemp creates it 0600
+                f.write(snapshot)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_filename, self.filename)
+        except BaseException:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            raise
+        if sync:
+            self._sync_snapshot(file=False)
+    
+    def _sync_snapshot(self, file: bool = True):
+        """fsync data.json (unless ``file`` is False) and its directory, making the last rename durable"""
+        if file:
+            with open(self.filename, 'rb') as f:
+                os.fsync(f.fileno())
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def _schedule_flush(self):
+        """Start the durability window timer unless one is already pending"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval or self.LAZY_FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def _cancel_flush(self):
+        """Drop the pending flush; the caller has just written everything it would"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+    
+    def flush(self):
+        """Write out everything still pending in the durability window
         
-        # Check if email already exists
-        existing_emails = [p.get('email') for p in self.data['patients']]
-        if patient.email in existing_emails:
-            raise ValueError(f"Email '{patient.email}' already exists")
+        The snapshot is written under ``_lock``, like every commit's, so an
+        older snapshot can never land on top of a newer one.
+        """
+        with self._lock:
+            self._flush_timer = None
+            if self._journal_unsynced:
+                self._journal_unsynced = False
+                if self._journal_file is not None:
+                    os.fsync(self._journal_file.fileno())
+                elif os.path.exists(self.journal_filename):
+                    with open(self.journal_filename, 'a') as f:
+                        os.fsync(f.fileno())
+            if self._dirty:
+                self._dirty = False
+                self._snapshot_unsynced = False
+                self._save_data()
+            elif self._snapshot_unsynced:
+                self._snapshot_unsynced = False
+                # Not while another process is renaming its snapshot into place
+                with self._file_lock(fcntl.LOCK_SH):
+                    self._sync_snapshot()
+    
+    def _reload(self):
+        """Load the snapshot, replay the journal and rebuild indexes"""
+        self.data = self._load_data()
+        self._rebuild_indexes()
+        self._replay_journal()
+        self._stamp = self._disk_stamp()
+        self._notify_alerts()
+    
+    # ---- Multi-process coordination ----
+    
+    def _disk_stamp(self) -> tuple:
+        """Cheap fingerprint of the files backing this store"""
+        stamp = []
+        for path in (self.filename, self.journal_filename):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+    
+    @contextmanager
+    def _file_lock(self, operation: int):
+        """Hold an advisory flock on the lock file (no-op unless shared)"""
+        if not self.shared:
+            yield
+            return
+        if self._lock_pid != os.getpid():
+            # Never reuse a descriptor inherited across fork: flock locks
+            # belong to the open file, so parent and child would share them.
+            self._lock_fd = os.open(self.lock_filename, os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        fcntl.flock(self._lock_fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+    
+    @contextmanager
+    def _mutating(self):
+        """Serialize a mutation across threads and, when shared, processes"""
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with self._file_lock(fcntl.LOCK_EX):
+                self._lock_depth = 1
+                try:
+                    self._sync_from_disk()
+                    yield
+                    if self.shared:
+                        self._stamp = self._disk_stamp()
+                finally:
+                    self._lock_depth = 0
+    
+    def _refresh(self):
+        """Pick up changes written by other processes before a read"""
+        if not self.shared or self._disk_stamp() == self._stamp:
+            return
+        with self._lock:
+            if self._lock_depth:
+                return  # This thread is mid-mutation and already synced
+            with self._file_lock(fcntl.LOCK_SH):
+                self._sync_from_disk()
+    
+    def _sync_from_disk(self):
+        """Reload only what changed on disk; caller holds the locks"""
+        if not self.shared:
+            return
+        stamp = self._disk_stamp()
+        if stamp == self._stamp:
+            return
+        old_snapshot, old_journal = self._stamp or (None, None)
+        new_snapshot, new_journal = stamp
+        if (self.journal and old_snapshot == new_snapshot and old_journal and new_journal
+                and old_journal[0] == new_journal[0] and new_journal[2] >= old_journal[2]):
+            # Same snapshot, same journal file that only grew: replay the tail
+            self._replay_file(self.journal_filename, self._journal_offset)
+            self._stamp = stamp
+        else:
+            self._reload()
+    
+    # ---- Journal ----
+    
+    def _replay_journal(self):
+        """Apply journal records newer than the snapshot, oldest file first"""
+        self._journal_offset = 0
+        self._replay_file(f"{self.journal_filename}.old")
+        self._replay_file(self.journal_filename)
+    
+    def _replay_file(self, path: str, offset: int = 0):
+        """Apply records from path starting at offset, skipping applied ones"""
+        try:
+            with open(path, 'r') as f:
+                f.seek(offset)
+                lines = f.readlines()
+                end = f.tell()
+        except FileNotFoundError:
+            return
+        applied_seq = self.data.get('journal_seq', 0)
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-append
+                print(f"⚠️ Warning: Skipping unreadable journal record in {path}")
+                continue
+            if record['seq'] > applied_seq:
+                self._apply(record)
+                applied_seq = record['seq']
+        self.data['journal_seq'] = applied_seq
+        if path == self.journal_filename:
+            self._journal_offset = end
+    
+    def _journal_exists(self) -> bool:
+        return (os.path.exists(self.journal_filename) or
+                os.path.exists(f"{self.journal_filename}.old"))
+    
+    def _append_journal(self, record: Dict, durable: bool = True):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        if self.shared:
+            # Another process may rotate the journal, so never hold it open
+            with open(self.journal_filename, 'a') as f:
+                f.write(line)
+                f.flush()
+                if durable and not self.flush_interval:
+                    os.fsync(f.fileno())
+                size = f.tell()
+        else:
+            if self._journal_file is None:
+                self._journal_file = open(self.journal_filename, 'a')
+            self._journal_file.write(line)
+            self._journal_file.flush()
+            if durable and not self.flush_interval:
+                os.fsync(self._journal_file.fileno())
+            size = self._journal_file.tell()
+        if self.flush_interval or not durable:
+            self._journal_unsynced = True
+            self._schedule_flush()
+        self._journal_offset = size
+        if not self._compacting and size >= self.compact_threshold:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+    
+    def compact(self):
+        """Fold the journal into a fresh snapshot of data.json"""
+        with self._compact_lock:
+            if self.shared:
+                # Other processes append to the journal, so hold the file
+                # lock for the whole rotate-and-snapshot sequence.
+                with self._mutating():
+                    self._compact()
+            else:
+                self._compact()
+    
+    def _compact(self):
+        with self._lock:
+            self._compacting = True
+            snapshot = json.dumps(self.data, indent=2)
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+            # Records written from here on go to a new journal; the rotated
+            # one is only replayed if we crash before the snapshot lands.
+            if os.path.exists(self.journal_filename):
+                os.replace(self.journal_filename, f"{self.journal_filename}.old")
+            self._journal_offset = 0
+        try:
+            self._write_snapshot(snapshot)
+            if os.path.exists(f"{self.journal_filename}.old"):
+                os.remove(f"{self.journal_filename}.old")
+        except OSError as e:
+            print(f"❌ Error compacting journal: {e}")
+        finally:
+            self._compacting = False
+    
+    # ---- Mutations ----
+    
+    def _commit(self, op: str, durable: bool = True, **fields):
+        """Apply a mutation record and persist it"""
+        with self._mutating():
+            record = {'op': op, **fields}
+            if self.journal:
+                record['seq'] = self.data.get('journal_seq', 0) + 1
+            result = self._apply(record)
+            lazy = bool(self.flush_interval) or not durable
+            if self.journal:
+                self._append_journal(record, durable)
+            elif lazy and not self.shared:
+                self._dirty = True
+                self._schedule_flush()
+            else:
+                # Other processes only see what is in data.json, so shared mode always
+                # rewrites it; inside the window only its fsyncs wait for the flush
+                self._dirty = False
+                self._save_data(sync=not lazy)
+                if lazy:
+                    self._snapshot_unsynced = True
+                    self._schedule_flush()
+                else:
+                    self._snapshot_unsynced = False
+                    self._cancel_flush()
+            return result
+    
+    def _apply(self, record: Dict):
+        """Apply a mutation record to the in-memory data"""
+        if record['op'] in self.ALERT_OPS:
+            self.data['alert_seq'] = self.data.get('alert_seq', 0) + 1
+        result = getattr(self, f"_apply_{record['op']}")(record)
+        if 'seq' in record:
+            self.data['journal_seq'] = record['seq']
+        if record['op'] in self.ALERT_OPS:
+            self._notify_alerts()
+        return result
+    
+    def _apply_add_patient(self, record: Dict):
+        p_data = dict(record['patient'])
+        self.data['patients'].append(p_data)
+        self._index_patient(p_data)
+        bisect.insort(self._sorted_names, p_data['name'])
+    
+    def _apply_update_patient(self, record: Dict):
+        # Not _lookup: its refresh, mid journal replay, would reload and replay the journal again
+        p_data = self._indexes['name'].get(record['patient']['name'])
+        if p_data:
+            # Replace the record in place so the patients list needs no scan
+            self._unindex_patient(p_data)
+            p_data.clear()
+            p_data.update(record['patient'])
+            self._index_patient(p_data)
+    
+    def _apply_update_patient_fields(self, record: Dict):
+        p_data = self._indexes['name'].get(record['name'])
+        if p_data:
+            self._update_patient_fields(p_data, record['fields'])
+    
+    def _apply_delete_patient(self, record: Dict):
+        patient_name = record['name']
+        self.data['patients'] = [p for p in self.data['patients'] if p['name'] != patient_name]
+        self._rebuild_indexes()
+        
+        # Remove associated alerts
+        self.data['alerts'] = [a for a in self.data['alerts'] if a.get('patient_name') != patient_name]
+        self._rebuild_alert_index()
         
-        self.data['patients'].append(patient.to_dict())
-        self._save_data()
+        # Remove associated nurse instructions
+        if 'nurse_instructions' in self.data:
+            self.data['nurse_instructions'] = [
+                inst for inst in self.data['nurse_instructions'] 
+                if inst.get('patient_name') != patient_name
+            ]
+            self._rebuild_instruction_index()
+    
+    def _apply_add_alert(self, record: Dict):
+        alert = dict(record['alert'])
+        alert['id'] = alert['seq'] = self.data['alert_seq']
+        self._add_to_rollup(alert['timestamp'], f"alerts_{alert['priority']}")
+        alerts = self.data['alerts']
+        alerts.append(alert)
+        self._open_alerts[(alert['patient_name'], alert['priority'])] = alert
+        self._alert_counts[alert['priority']] = self._alert_counts.get(alert['priority'], 0) + 1
+        if self.max_alerts and len(alerts) > self.max_alerts:
+            del alerts[_alert_eviction_index(alerts)]
+            self._rebuild_alert_index()
+    
+    def _apply_coalesce_alert(self, record: Dict):
+        alert = self._open_alerts.get((record['patient_name'], record['priority']))
+        if alert:
+            self._add_to_rollup(record['timestamp'], f"alerts_{record['priority']}")
+            alert.setdefault('first_timestamp', alert['timestamp'])
+            alert['count'] = alert.get('count', 1) + 1
+            alert['message'] = record['message']
+            alert['timestamp'] = record['timestamp']
+            alert['seq'] = self.data['alert_seq']
+    
+    def _apply_clear_alerts(self, record: Dict):
+        self.data['alerts'] = []
+        self._open_alerts = {}
+        self._alert_counts = {}
+    
+    def _apply_remove_alert(self, record: Dict):
+        index = record['index']
+        if 0 <= index < len(self.data['alerts']):
+            del self.data['alerts'][index]
+            self._rebuild_alert_index()
+    
+    def _apply_expire_records(self, record: Dict):
+        alerts_before = record.get('alerts_before')
+        if alerts_before:
+            self.data['alerts'] = [a for a in self.data.get('alerts', []) if a.get('timestamp', '') >= alerts_before]
+            self._rebuild_alert_index()
+        instructions_before = record.get('instructions_before')
+        if instructions_before:
+            self.data['nurse_instructions'] = [
+                inst for inst in self.data.get('nurse_instructions', [])
+                if inst.get('timestamp', '') >= instructions_before
+            ]
+            self._rebuild_instruction_index()
+    
+    def _apply_add_nurse_instruction(self, record: Dict):
+        if 'nurse_instructions' not in self.data:
+            self.data['nurse_instructions'] = []
+        instruction = dict(record['instruction'])
+        self._add_to_rollup(instruction['timestamp'], 'instructions')
+        self.data['instruction_seq'] = self.data.get('instruction_seq', 0) + 1
+        instruction['id'] = self.data['instruction_seq']
+        self.data['nurse_instructions'].append(instruction)
+        self._instructions_by_patient.setdefault(instruction['patient_name'], []).append(instruction)
+    
+    # ---- Rollups ----
+    
+    def _add_to_rollup(self, timestamp: str, series: str, amount: int = 1):
+        """Count an event in its hourly bucket (part of the data, so replay rebuilds it)"""
+        rollups = self.data.get('hourly_rollups')
+        if rollups is None:
+            rollups = self.data['hourly_rollups'] = self._backfill_rollups()
+        hour = timestamp[:13]
+        bucket = rollups.get(hour)
+        if bucket is None:
+            bucket = rollups[hour] = {}
+            while len(rollups) > self.ROLLUP_RETENTION_HOURS:
+                del rollups[min(rollups)]
+        bucket[series] = bucket.get(series, 0) + amount
+    
+    def _backfill_rollups(self) -> Dict[str, Dict[str, int]]:
+        """Seed hourly rollups from the alerts and instructions already stored"""
+        rollups: Dict[str, Dict[str, int]] = {}
+        events = [(a.get('timestamp') or '', f"alerts_{a.get('priority')}", a.get('count', 1))
+                  for a in self.data.get('alerts', [])]
+        events += [(i.get('timestamp') or '', 'instructions', 1) for i in self.data.get('nurse_instructions', [])]
+        for timestamp, series, amount in events:
+            if timestamp:
+                bucket = rollups.setdefault(timestamp[:13], {})
+                bucket[series] = bucket.get(series, 0) + amount
+        return dict(sorted(rollups.items())[-self.ROLLUP_RETENTION_HOURS:])
+    
+    # ---- Indexes ----
+    
+    def _rebuild_indexes(self):
+        """Rebuild all patient indexes from self.data"""
+        self._indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self._patient_counts = {'patients': 0, 'active_agents': 0}
+        for p_data in self.data['patients']:
+            self._index_patient(p_data)
+        self._sorted_names = sorted(self._indexes['name'])
+        self._rebuild_alert_index()
+        self._rebuild_instruction_index()
+    
+    def _rebuild_instruction_index(self):
+        """Group nurse instructions by patient, oldest first, numbering any without an id"""
+        self._instructions_by_patient = {}
+        for instruction in self.data.get('nurse_instructions', []):
+            if instruction.get('id') is None:
+                self.data['instruction_seq'] = self.data.get('instruction_seq', 0) + 1
+                instruction['id'] = self.data['instruction_seq']
+            self._instructions_by_patient.setdefault(instruction.get('patient_name'), []).append(instruction)
+    
+    def _rebuild_alert_index(self):
+        """Map (patient, priority) to the newest alert, which repeats coalesce into"""
+        alerts = self.data.get('alerts', [])
+        self._alert_counts = {}
+        for alert in alerts:
+            if alert.get('id') is None:
+                # Alerts stored before ids existed; numbered in file order so every process agrees
+                self.data['alert_seq'] = self.data.get('alert_seq', 0) + 1
+                alert['id'] = alert['seq'] = self.data['alert_seq']
+            self._alert_counts[alert.get('priority')] = self._alert_counts.get(alert.get('priority'), 0) + 1
+        self._open_alerts = {(a.get('patient_name'), a.get('priority')): a for a in alerts}
+    
+    def _notify_alerts(self):
+        """Wake threads blocked in wait_for_alerts"""
+        with self._alerts_changed:
+            self._alerts_changed.notify_all()
+    
+    def _index_patient(self, p_data: Dict):
+        """Add a patient record to every index (first record wins on duplicates) and the counts"""
+        for field in self.INDEXED_FIELDS:
+            value = p_data.get(field)
+            if value is not None:
+                self._indexes[field].setdefault(value, p_data)
+        self._patient_counts['patients'] += 1
+        self._patient_counts['active_agents'] += bool(p_data.get('agent_id'))
+    
+    def _unindex_patient(self, p_data: Dict):
+        """Remove a patient record from every index it owns and from the counts"""
+        for field in self.INDEXED_FIELDS:
+            index = self._indexes[field]
+            value = p_data.get(field)
+            if value is not None and index.get(value) is p_data:
+                del index[value]
+        self._patient_counts['patients'] -= 1
+        self._patient_counts['active_agents'] -= bool(p_data.get('agent_id'))
+    
+    def _lookup(self, field: str, value) -> Optional[Dict]:
+        """Return the raw patient record indexed under field=value"""
+        if value is None:
+            return None
+        self._refresh()
+        return self._indexes[field].get(value)
+    
+    def _update_patient_fields(self, p_data: Dict, fields: Dict):
+        """Update fields on a stored patient record, keeping indexes in sync"""
+        self._unindex_patient(p_data)
+        p_data.update(fields)
+        self._index_patient(p_data)
+    
+    # ---- Public API ----
+    
+    def add_patient(self, patient: Patient):
+        """Add a new patient to storage"""
+        with self._mutating():
+            # Check if patient ID already exists
+            if self._lookup('patient_id', patient.patient_id):
+                raise ValueError(f"Patient ID '{patient.patient_id}' already exists")
+            
+            # Check if patient name already exists
+            if self._lookup('name', patient.name):
+                raise ValueError(f"Patient name '{patient.name}' already exists")
+            
+            # Check if email already exists
+            if self._lookup('email', patient.email):
+                raise ValueError(f"Email '{patient.email}' already exists")
+            
+            self._commit('add_patient', patient=patient.to_dict())
     
     def get_patients(self) -> List[Patient]:
         """Get all patients"""
+        self._refresh()
         return [Patient.from_dict(p) for p in self.data['patients']]
     
     def get_patient_by_name(self, name: str) -> Optional[Patient]:
         """Get patient by name"""
-        for p_data in self.data['patients']:
-            if p_data['name'] == name:
-                return Patient.from_dict(p_data)
-        return None
+        p_data = self._lookup('name', name)
+        return Patient.from_dict(p_data) if p_data else None
     
     def get_patient_by_id(self, patient_id: str) -> Optional[Patient]:
         """Get patient by patient ID"""
-        for p_data in self.data['patients']:
-            if p_data.get('patient_id') == patient_id:
-                return Patient.from_dict(p_data)
-        return None
+        p_data = self._lookup('patient_id', patient_id)
+        return Patient.from_dict(p_data) if p_data else None
     
     def get_patient_by_token(self, token: str) -> Optional[Patient]:
         """Get patient by magic token"""
-        for p_data in self.data['patients']:
-            if p_data.get('magic_token') == token:
-                patient = Patient.from_dict(p_data)
-                if patient.is_token_valid():
-                    return patient
+        p_data = self._lookup('magic_token', token)
+        if p_data:
+            patient = Patient.from_dict(p_data)
+            if patient.is_token_valid():
+                return patient
         return None
     
     def authenticate_patient(self, patient_id: str, password: str) -> Optional[Patient]:
         """Authenticate patient with Patient ID and password"""
-        for p_data in self.data['patients']:
-            if (p_data.get('patient_id') == patient_id and 
-                p_data.get('password') == password):
-                return Patient.from_dict(p_data)
+        p_data = self._lookup('patient_id', patient_id)
+        if p_data and p_data.get('password') == password:
+            return Patient.from_dict(p_data)
         return None
     
     def get_patient_credentials(self, patient_name: str) -> Optional[Dict[str, str]]:
         """Get patient credentials by name"""
-        for p_data in self.data['patients']:
-            if p_data['name'] == patient_name:
-                return {
-                    'patient_id': p_data.get('patient_id'),
-                    'password': p_data.get('password'),
-                    'magic_token': p_data.get('magic_token')
-                }
+        p_data = self._lookup('name', patient_name)
+        if p_data:
+            return {
+                'patient_id': p_data.get('patient_id'),
+                'password': p_data.get('password'),
+                'magic_token': p_data.get('magic_token')
+            }
         return None
     
     def update_patient_credentials(self, patient_name: str, password: str = None, magic_token: str = None):
         """Update patient credentials"""
-        for p_data in self.data['patients']:
-            if p_data['name'] == patient_name:
-                if password:
-                    p_data['password'] = password
-                if magic_token:
-                    p_data['magic_token'] = magic_token
-                break
-        self._save_data()
-        """Get patient by magic token"""
-        for p_data in self.data['patients']:
-            if p_data.get('magic_token') == token:
-                patient = Patient.from_dict(p_data)
-                if patient.is_token_valid():
-                    return patient
-        return None
+        fields = {}
+        if password:
+            fields['password'] = password
+        if magic_token:
+            fields['magic_token'] = magic_token
+        with self._mutating():
+            if fields and self._lookup('name', patient_name):
+                self._commit('update_patient_fields', name=patient_name, fields=fields)
     
     def update_patient(self, patient: Patient):
         """Update existing patient data"""
-        for i, p_data in enumerate(self.data['patients']):
-            if p_data['name'] == patient.name:
-                self.data['patients'][i] = patient.to_dict()
-                self._save_data()
-                break
+        with self._mutating():
+            if self._lookup('name', patient.name):
+                self._commit('update_patient', patient=patient.to_dict())
     
     def delete_patient(self, patient_name: str) -> bool:
         """Delete a patient and all associated data"""
-        # Find and remove the patient
-        initial_count = len(self.data['patients'])
-        self.data['patients'] = [p for p in self.data['patients'] if p['name'] != patient_name]
-        
-        if len(self.data['patients']) == initial_count:
-            return False  # Patient not found
-        
-        # Remove associated alerts
-        self.data['alerts'] = [a for a in self.data['alerts'] if a.get('patient_name') != patient_name]
-        
-        # Remove associated nurse instructions
-        if 'nurse_instructions' in self.data:
-            self.data['nurse_instructions'] = [
-                inst for inst in self.data['nurse_instructions'] 
-                if inst.get('patient_name') != patient_name
-            ]
-        
-        self._save_data()
-        return True
+        with self._mutating():
+            if not self._lookup('name', patient_name):
+                return False  # Patient not found
+            self._commit('delete_patient', name=patient_name)
+            return True
     
     def update_patient_agent_id(self, name: str, agent_id: str):
         """Update patient's agent ID"""
-        for p in self.data['patients']:
-            if p['name'] == name:
-                p['agent_id'] = agent_id
-                break
-        self._save_data()
+        with self._mutating():
+            if self._lookup('name', name):
+                self._commit('update_patient_fields', name=name, fields={'agent_id': agent_id})
+    
+    def update_conversation_state(self, patient_name: str, context_primed: bool = None,
+                                  last_message_id: str = None):
+        """Record whether the agent context is primed and the last seen message id"""
+        fields = {}
+        if context_primed is not None:
+            fields['context_primed'] = context_primed
+        if last_message_id:
+            fields['last_message_id'] = last_message_id
+        with self._mutating():
+            if fields and self._lookup('name', patient_name):
+                # The message id changes every chat turn and is only a cache hint, so it is not fsynced
+                self._commit('update_patient_fields', durable=context_primed is not None,
+                             name=patient_name, fields=fields)
     
     def get_patients_for_login(self) -> List[Dict]:
         """Get simplified patient list for login page"""
+        self._refresh()
         patients = []
         for p_data in self.data['patients']:
             if p_data.get('agent_id'):  # Only include patients with active agents
@@ -238,30 +831,93 @@ class SimpleStorage:
         return patients
     
     def add_alert(self, patient_name: str, message: str, priority: str = 'medium'):
-        """Add an alert for a patient"""
-        alert = {
-            'patient_name': patient_name,
-            'message': message,
-            'priority': priority,
-            'timestamp': datetime.datetime.now().isoformat()
-        }
-        self.data['alerts'].append(alert)
-        self._save_data()
+        """Add an alert for a patient, or fold it into a recent one for the same patient and priority"""
+        timestamp = datetime.datetime.now().isoformat()
+        with self._mutating():
+            recent = self._open_alerts.get((patient_name, priority))
+            if recent and _alert_window_open(recent, timestamp, self.alert_window):
+                self._commit('coalesce_alert', patient_name=patient_name, priority=priority,
+                             message=message, timestamp=timestamp)
+                return
+            alert = {
+                'patient_name': patient_name,
+                'message': message,
+                'priority': priority,
+                'timestamp': timestamp,
+                'first_timestamp': timestamp,
+                'count': 1
+            }
+            self._commit('add_alert', alert=alert)
     
     def get_alerts(self) -> List[Dict]:
         """Get all alerts"""
+        self._refresh()
         return self.data.get('alerts', [])
     
+    def get_alert_seq(self) -> int:
+        """Sequence number that advances on every change to the alerts list"""
+        self._refresh()
+        return self.data.get('alert_seq', 0)
+    
+    def get_alert_updates(self, since: int) -> Dict:
+        """Alerts created or coalesced after ``since``, plus the ids still present"""
+        self._refresh()
+        with self._lock:
+            alerts = self.data.get('alerts', [])
+            return {
+                'seq': self.data.get('alert_seq', 0),
+                'alerts': [dict(a) for a in alerts if a.get('seq', 0) > since],
+                'ids': [a['id'] for a in alerts]
+            }
+    
+    def wait_for_alerts(self, since: int, timeout: float) -> int:
+        """Block until alert_seq passes ``since`` or ``timeout`` runs out; return alert_seq
+        
+        Changes made in this process wake waiters immediately; in shared mode
+        changes from other processes are noticed within ALERT_POLL_INTERVAL.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self._refresh()  # Outside the condition: _refresh takes self._lock
+            with self._alerts_changed:
+                seq = self.data.get('alert_seq', 0)
+                remaining = deadline - time.monotonic()
+                if seq > since or remaining <= 0:
+                    return seq
+                self._alerts_changed.wait(min(remaining, self.ALERT_POLL_INTERVAL) if self.shared else remaining)
+    
     def clear_alerts(self):
         """Clear all alerts"""
-        self.data['alerts'] = []
-        self._save_data()
+        self._commit('clear_alerts')
     
     def remove_alert(self, index: int):
         """Remove a specific alert by index"""
-        if 0 <= index < len(self.data['alerts']):
-            del self.data['alerts'][index]
-            self._save_data()
+        with self._mutating():
+            if 0 <= index < len(self.data['alerts']):
+                self._commit('remove_alert', index=index)
+    
+    def archive_expired(self, archive, alerts_before: str = None,
+                        instructions_before: str = None) -> Dict[str, int]:
+        """Move alerts and nurse instructions older than the cutoffs into ``archive``
+        
+        Cutoffs are ISO timestamps; an alert's age is its latest repeat. The
+        records are written to the archive before they are removed here, so a
+        crash in between leaves a duplicate in the archive rather than a gap.
+        """
+        with self._mutating():
+            expired = {
+                'alerts': [dict(a) for a in self.data.get('alerts', [])
+                           if alerts_before and a.get('timestamp', '') < alerts_before],
+                'nurse_instructions': [dict(i) for i in self.data.get('nurse_instructions', [])
+                                       if instructions_before and i.get('timestamp', '') < instructions_before]
+            }
+            for kind, records in expired.items():
+                if records:
+                    archive.write(kind, records)
+            if any(expired.values()):
+                self._commit('expire_records', alerts_before=alerts_before if expired['alerts'] else None,
+                             instructions_before=instructions_before if expired['nurse_instructions'] else None)
+            return {kind: len(records) for kind, records in expired.items()}
     
     def add_nurse_instruction(self, patient_name: str, instruction: str):
         """Store nurse instructions for patients"""
@@ -270,17 +926,48 @@ class SimpleStorage:
             'instruction': instruction,
             'timestamp': datetime.datetime.now().isoformat()
         }
-        if 'nurse_instructions' not in self.data:
-            self.data['nurse_instructions'] = []
-        self.data['nurse_instructions'].append(nurse_instruction)
-        self._save_data()
+        self._commit('add_nurse_instruction', instruction=nurse_instruction)
     
     def get_nurse_instructions(self, patient_name: str) -> List[Dict]:
         """Get nurse instructions for a specific patient"""
-        if 'nurse_instructions' not in self.data:
-            return []
-        return [inst for inst in self.data['nurse_instructions'] 
-                if inst['patient_name'] == patient_name]
+        self._refresh()
+        return list(self._instructions_by_patient.get(patient_name, []))
+    
+    # ---- Paginated queries ----
+    
+    def query_patients(self, cursor: str = None, limit: int = 50, has_agent: bool = None) -> Dict:
+        """One page of patient records ordered by name, starting after ``cursor`` (a name)"""
+        self._refresh()
+        with self._lock:
+            names = self._sorted_names
+            position = bisect.bisect_right(names, cursor) if cursor is not None else 0
+            items = []
+            while position < len(names) and len(items) < limit:
+                p_data = self._indexes['name'][names[position]]
+                position += 1
+                if has_agent is None or bool(p_data.get('agent_id')) == has_agent:
+                    items.append(dict(p_data))
+            more = position < len(names) and len(items) == limit
+            return {'items': items, 'next_cursor': items[-1]['name'] if more else None}
+    
+    def query_alerts(self, cursor: int = None, limit: int = 50, priority: str = None,
+                     patient_name: str = None, since: str = None, until: str = None) -> Dict:
+        """One page of alerts, newest first, with ids below ``cursor``"""
+        self._refresh()
+        with self._lock:
+            return _page_newest_first(self.data.get('alerts', []), cursor, limit, since, until,
+                                      priority=priority, patient_name=patient_name)
+    
+    def query_nurse_instructions(self, cursor: int = None, limit: int = 50, patient_name: str = None,
+                                 since: str = None, until: str = None) -> Dict:
+        """One page of nurse instructions, newest first, with ids below ``cursor``"""
+        self._refresh()
+        with self._lock:
+            if patient_name is not None:
+                instructions = self._instructions_by_patient.get(patient_name, [])
+            else:
+                instructions = self.data.get('nurse_instructions', [])
+            return _page_newest_first(instructions, cursor, limit, since, until)
     
     def validate_patient_id(self, patient_id: str) -> bool:
         """Validate that patient ID is unique and properly formatted"""
@@ -288,8 +975,7 @@ class SimpleStorage:
             return False
         
         # Check if ID already exists
-        existing_ids = [p.get('patient_id') for p in self.data['patients']]
-        return patient_id not in existing_ids
+        return self._lookup('patient_id', patient_id) is None
     
     def validate_email(self, email: str) -> bool:
         """Validate that email is unique"""
@@ -297,15 +983,56 @@ class SimpleStorage:
             return False
         
         # Check if email already exists
-        existing_emails = [p.get('email') for p in self.data['patients']]
-        return email not in existing_emails
+        return self._lookup('email', email) is None
     
     def get_statistics(self) -> Dict:
-        """Get system statistics"""
-        return {
-            'total_patients': len(self.data['patients']),
-            'active_agents': len([p for p in self.data['patients'] if p.get('agent_id')]),
-            'total_alerts': len(self.data.get('alerts', [])),
-            'high_priority_alerts': len([a for a in self.data.get('alerts', []) if a.get('priority') == 'high']),
-            'total_instructions': len(self.data.get('nurse_instructions', []))
-        }
\ No newline at end of file
+        """Get system statistics from counters kept up to date by every mutation"""
+        self._refresh()
+        with self._lock:
+            return {
+                'total_patients': self._patient_counts['patients'],
+                'active_agents': self._patient_counts['active_agents'],
+                'total_alerts': len(self.data.get('alerts', [])),
+                'high_priority_alerts': self._alert_counts.get('high', 0),
+                'alerts_by_priority': {p: n for p, n in self._alert_counts.items() if n},
+                'total_instructions': len(self.data.get('nurse_instructions', []))
+            }
+    
+    def get_hourly_rollups(self, since: str = None, until: str = None) -> List[Dict]:
+        """Alert (per priority) and instruction counts per hour, oldest first
+        
+        ``since``/``until`` are ISO timestamps; buckets are keyed by their hour
+        (``YYYY-MM-DDTHH``). Coalesced repeats count as separate alerts here.
+        """
+        self._refresh()
+        with self._lock:
+            rollups = self.data.get('hourly_rollups')
+            if rollups is None:
+                rollups = self._backfill_rollups()
+            return [{'hour': hour, 'counts': dict(counts)} for hour, counts in sorted(rollups.items())
+                    if (not since or hour >= since[:13]) and (not until or f"{hour}:00:00" < until)]
+
+def create_storage(data_dir: str):
+    """Build the storage engine configured by the STORAGE_* environment variables
+    
+    STORAGE_ENGINE picks json (default, SimpleStorage) or sqlite (SqliteStorage).
+    """
+    alert_settings = {
+        'alert_window': float(os.getenv('ALERT_COALESCE_WINDOW', '300')),  # Seconds repeats fold into one alert
+        'max_alerts': int(os.getenv('MAX_ALERTS', '500'))
+    }
+    if os.getenv('STORAGE_ENGINE', 'json').lower() == 'sqlite':
+        from .sqlite_storage import SqliteStorage
+        return SqliteStorage(
+            filename=os.path.join(data_dir, 'data.db'),
+            import_json=os.path.join(data_dir, 'data.json'),  # One-time migration of existing data
+            **alert_settings
+        )
+    return SimpleStorage(
+        filename=os.path.join(data_dir, 'data.json'),
+        journal=os.getenv('STORAGE_JOURNAL', 'false').lower() == 'true',
+        compact_threshold=int(os.getenv('STORAGE_COMPACT_THRESHOLD', str(1024 * 1024))),
+        shared=os.getenv('STORAGE_SHARED', 'false').lower() == 'true',  # Multi-process safe
+        flush_interval=float(os.getenv('STORAGE_FLUSH_INTERVAL', '0')),  # Durability window (seconds)
+        **alert_settings
+    )
@@ -0,0 +1,316 @@
+"""
+Email Outbox Module - Durable queue of outgoing emails delivered to Brevo in batches by a background sender
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import sib_api_v3_sdk
+import urllib3
+from sib_api_v3_sdk.rest import ApiException
+
+from .resilience import backoff_delay
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message TEXT NOT NULL,
+    batch_key TEXT NOT NULL,
+    solo INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    message_id TEXT,
+    created_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status_run_after ON outbox (status, run_after);
+CREATE INDEX IF NOT EXISTS idx_outbox_batch_key ON outbox (batch_key, status);
+"""
+
+OUTBOX_STATUSES = ('queued', 'sending', 'sent', 'failed')
+
+
+def _is_retryable(e: Exception) -> bool:
+    """Rate limiting, server errors and network failures are worth another attempt
+
+    A rejected email is not, and neither is anything else: a ValueError from
+    the SDK's models (a missing address, say) fails the same way every time.
+    """
+    if isinstance(e, ApiException):
+        return not e.status or e.status == 429 or e.status >= 500
+    return isinstance(e, (urllib3.exceptions.HTTPError, OSError))
+
+
+class RateLimiter:
+    """Spaces calls out to at most ``rate`` units per second (0 means no cap)"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, units: int = 1):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + units / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class EmailOutbox:
+    """SQLite-backed outbox drained by a background sender
+
+    ``enqueue`` only writes a row, so callers never wait on Brevo. The sender
+    claims queued emails under a lease and sends every one that shares a
+    sender, body and headers in a single API call (one message version per
+    recipient), up to ``batch_size`` recipients and ``rate`` recipients per
+    second. Failures the API may recover from are retried with jittered
+    backoff; after ``max_attempts``, or when Brevo rejects the email, it is
+    kept as failed rather than dropped. A batch Brevo rejects is retried one
+    email at a time so a single bad address cannot sink the others. Delivery
+    is at least once: a sender that dies mid-call leaves its lease to expire
+    and the batch is sent again.
+    """
+
+    def __init__(self, api_instance, filename: str = 'outbox.db', batch_size: int = 50,
+                 rate: float = 10.0, max_attempts: int = 10, base_delay: float = 5.0,
+                 max_delay: float = 600.0, lease_seconds: float = 120.0, poll_interval: float = 1.0,
+                 keep_sent_days: float = 7.0):
+        self.api_instance = api_instance
+        self.filename = filename
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.keep_sent_days = keep_sent_days
+        self.limiter = RateLimiter(rate)
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def start(self):
+        """Start the background sender"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._send_loop, name='email-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stop the sender once its current batch is sent"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, to_email: str, to_name: str, subject: str, html_content: str,
+                sender: Dict, headers: Dict = None) -> int:
+        """Queue one email for delivery and return its outbox id"""
+        message = {
+            'sender': sender,
+            'to': {'email': to_email, 'name': to_name},
+            'subject': subject,
+            'html_content': html_content,
+            'headers': headers
+        }
+        batch_key = hashlib.sha256(
+            json.dumps([sender, html_content, headers], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        now = time.time()
+        email_id = self._connect().execute(
+            "INSERT INTO outbox (message, batch_key, status, created_at, run_after) VALUES (?, ?, 'queued', ?, ?)",
+            (json.dumps(message), batch_key, now, now)
+        ).lastrowid
+        self._wakeup.set()
+        return email_id
+
+    def depth(self) -> int:
+        """Emails waiting to be sent, including any being sent right now"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('queued', 'sending')"
+        ).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Email counts per status, plus the age in seconds of the oldest unsent one"""
+        conn = self._connect()
+        counts = dict.fromkeys(OUTBOX_STATUSES, 0)
+        counts.update(conn.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status').fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM outbox WHERE status IN ('queued', 'sending')"
+        ).fetchone()[0]
+        counts['oldest_unsent_seconds'] = round(time.time() - oldest, 1) if oldest else None
+        return counts
+
+    def failed(self, limit: int = 50) -> List[Dict]:
+        """Emails that will not be retried, newest first"""
+        rows = self._connect().execute(
+            "SELECT id, message, attempts, error, created_at FROM outbox WHERE status = 'failed' "
+            "ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        emails = []
+        for row in rows:
+            message = json.loads(row['message'])
+            emails.append({'id': row['id'], 'to': message['to'], 'subject': message['subject'],
+                           'attempts': row['attempts'], 'error': row['error'], 'created_at': row['created_at']})
+        return emails
+
+    def retry_failed(self) -> int:
+        """Queue every failed email again; return how many"""
+        requeued = self._connect().execute(
+            "UPDATE outbox SET status = 'queued', attempts = 0, solo = 1, run_after = ? WHERE status = 'failed'",
+            (time.time(),)
+        ).rowcount
+        self._wakeup.set()
+        return requeued
+
+    def drain(self, timeout: float = None) -> bool:
+        """Wait until nothing is left to send (or the timeout passes); return whether it emptied"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.depth():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(min(self.poll_interval, 0.1))
+        return True
+
+    def _claim(self) -> List[sqlite3.Row]:
+        """Atomically lease the next runnable email and every queued email it can be batched with"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            first = conn.execute(
+                "SELECT * FROM outbox WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'sending' AND lease_expires < ?) ORDER BY run_after, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            rows = [first] if first else []
+            if first and not first['solo'] and self.batch_size > 1:
+                rows += conn.execute(
+                    "SELECT * FROM outbox WHERE batch_key = ? AND id != ? AND solo = 0 "
+                    "AND status = 'queued' AND run_after <= ? ORDER BY id LIMIT ?",
+                    (first['batch_key'], first['id'], now, self.batch_size - 1)
+                ).fetchall()
+            if rows:
+                conn.execute(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, lease_expires = ? "
+                    "WHERE id IN (%s)" % ','.join('?' * len(rows)),
+                    [now + self.lease_seconds] + [row['id'] for row in rows]
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return rows
+
+    def _build(self, messages: List[Dict]):
+        """One SendSmtpEmail for messages sharing a sender, body and headers"""
+        first = messages[0]
+        email = sib_api_v3_sdk.SendSmtpEmail(
+            sender=sib_api_v3_sdk.SendSmtpEmailSender(**first['sender']),
+            subject=first['subject'],
+            html_content=first['html_content'],
+            headers=first['headers']
+        )
+        if len(messages) == 1:
+            email.to = [sib_api_v3_sdk.SendSmtpEmailTo(**first['to'])]
+        else:
+            email.message_versions = [
+                sib_api_v3_sdk.SendSmtpEmailMessageVersions(
+                    to=[sib_api_v3_sdk.SendSmtpEmailTo1(**message['to'])], subject=message['subject']
+                )
+                for message in messages
+            ]
+        return email
+
+    def send_batch(self) -> int:
+        """Claim and send one batch; return how many emails it held"""
+        rows = self._claim()
+        if not rows:
+            return 0
+        messages = [json.loads(row['message']) for row in rows]
+        self.limiter.acquire(len(rows))
+        try:
+            response = self.api_instance.send_transac_email(self._build(messages))
+        except Exception as e:
+            self._failed(rows, e)
+            return len(rows)
+        message_ids = getattr(response, 'message_ids', None) or [getattr(response, 'message_id', None)] * len(rows)
+        now = time.time()
+        self._connect().executemany(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, message_id = ?, error = NULL WHERE id = ?",
+            [(now, message_id, row['id']) for row, message_id in zip(rows, message_ids)]
+        )
+        return len(rows)
+
+    def _failed(self, rows: List[sqlite3.Row], e: Exception):
+        conn = self._connect()
+        now = time.time()
+        error = ' '.join(str(e).split())  # ApiException messages span several lines
+        retryable = _is_retryable(e)
+        if len(rows) > 1 and not retryable:
+            # One recipient may have poisoned the batch; try each of them on its own
+            conn.execute(
+                "UPDATE outbox SET status = 'queued', solo = 1, run_after = ?, error = ? WHERE id IN (%s)"
+                % ','.join('?' * len(rows)), [now, error] + [row['id'] for row in rows]
+            )
+            return
+        for row in rows:
+            attempts = row['attempts'] + 1
+            if retryable and attempts < self.max_attempts:
+                delay = backoff_delay(attempts - 1, self.base_delay, self.max_delay)
+                conn.execute("UPDATE outbox SET status = 'queued', run_after = ?, error = ? WHERE id = ?",
+                             (now + delay, error, row['id']))
+            else:
+                conn.execute("UPDATE outbox SET status = 'failed', error = ? WHERE id = ?", (error, row['id']))
+                print(f"❌ Email {row['id']} to {json.loads(row['message'])['to']['email']} failed "
+                      f"after {attempts} attempts: {error}")
+        if retryable:
+            print(f"⚠️ Warning: Could not send {len(rows)} emails, will retry: {error}")
+
+    def _prune(self):
+        """Forget emails delivered more than keep_sent_days ago"""
+        if time.time() - self._last_prune < 3600:
+            return
+        self._last_prune = time.time()
+        self._connect().execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+                                (time.time() - self.keep_sent_days * 86400,))
+
+    def _send_loop(self):
+        while not self._stopping.is_set():
+            try:
+                self._prune()
+                sent = self.send_batch()
+            except sqlite3.Error as e:
+                print(f"⚠️ Warning: Could not claim emails: {e}")
+                sent = 0
+            if not sent:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
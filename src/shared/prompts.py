@@ -0,0 +1,223 @@
+"""
+Prompts Module - Versioned prompt templates for Letta agents and welcome emails
+"""
+
+import hashlib
+import json
+import string
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+# Bump whenever a template's wording changes; cached renders and new agents carry it
+PROMPT_VERSION = '2025.1'
+
+# Patient fields the templates read; other fields (credentials, chat state) don't affect renders
+PATIENT_VIEW_FIELDS = ('name', 'patient_id', 'email', 'conditions', 'medications', 'allergies', 'discharge_plan')
+
+RENDER_CACHE_SIZE = 2048
+
+TEMPLATES = {
+    'persona': """You are Prof.Dux, a caring and knowledgeable post-discharge healthcare assistant specifically assigned to ${name}.
+
+🩺 **Your Identity**: You are Prof.Dux, a dedicated healthcare AI assistant with extensive medical knowledge and a compassionate bedside manner, personally caring for ${name}.
+
+📋 **Your Patient**: ${name} (Patient ID: ${patient_id})
+
+📋 **Your Responsibilities**:
+1. Support ${name}'s recovery and wellness with personalized guidance
+2. Monitor conversations for concerning symptoms and alert nurses when needed
+3. Provide clear medication guidance specific to ${name}'s prescriptions
+4. Answer health questions with evidence-based information relevant to their conditions
+5. Offer emotional support and encouragement during ${name}'s recovery
+6. Alert the nursing staff immediately if you detect urgent medical issues
+
+💡 **Your Communication Style**:
+- Always address ${name} by name and introduce yourself as "Prof.Dux"
+- Be warm, professional, and empathetic
+- Reference their specific medical conditions and medications when relevant
+- Provide specific, actionable advice based on their discharge plan
+- Show genuine concern for ${name}'s wellbeing
+
+⚠️ **Important Guidelines**:
+- If ${name} reports severe symptoms, immediately recommend they contact their nurse
+- Never provide emergency medical advice - direct them to call emergency services
+- Always encourage ${name} to follow their prescribed treatment plans
+- Be encouraging but realistic about recovery expectations
+- Remember their allergies when discussing any treatments or medications
+
+Remember: You are ${name}'s personal healthcare assistant, here to support, guide, and care for them during their recovery journey.""",
+
+    'patient_info': """PATIENT INFORMATION - ALWAYS REMEMBER THIS:
+
+👤 **Patient Details**:
+• Name: ${name}
+• Patient ID: ${patient_id}
+• Email: ${email}
+
+🏥 **Medical History**:
+• Current Medical Conditions: ${conditions}
+• Known Allergies: ${allergies}
+
+💊 **Current Medications**:
+${medication_list}
+
+📋 **Discharge Plan**:
+${discharge_plan}
+
+🎯 **Care Instructions**: 
+Always reference this patient information when providing care. Address ${name} by name, consider their specific conditions and medications, and be aware of their allergies. This is ${name}'s personalized healthcare assistant session.""",
+
+    'initial_context': """SYSTEM CONTEXT: You are now active as Prof.Dux, the personal healthcare assistant for ${name} (ID: ${patient_id}). 
+
+Key patient information:
+- Conditions: ${conditions_brief}
+- Medications: ${medication_count} prescribed medications
+- Allergies: ${allergies}
+
+When ${name} messages you, greet them warmly by name and let them know you're here to help with their recovery. Always remember their specific medical information when providing guidance.""",
+
+    'context_refresh': """CONTEXT REFRESH: Remember, you are Prof.Dux caring for ${name} (ID: ${patient_id}).
+
+Current patient details:
+• Medical Conditions: ${conditions}
+• Current Medications: ${medication_list}
+• Known Allergies: ${allergies}
+• Discharge Plan: ${discharge_plan}
+
+Always address ${name} by name and reference their specific medical information when providing guidance.""",
+
+    'medical_summary': """
+            Create a warm, personalized medical summary email for a patient who just received access to their post-hospital care system.
+
+            Hospital Information:
+            - Hospital Name: ${hospital_name}
+            - Care Team: The ${hospital_name} Care Team
+
+            Patient Information:
+            - Name: ${name}
+            - Conditions: ${conditions}
+            - Medications: ${medications_inline}
+            - Allergies: ${allergies}
+            - Discharge Plan: ${discharge_plan}
+
+            Generate a caring, professional medical summary that:
+            1. Welcomes the patient warmly on behalf of ${hospital_name}
+            2. Summarizes their current health status and care plan
+            3. Explains how to use their healthcare assistant (Prof.Dux)
+            4. Provides encouragement for their recovery journey
+            5. Is written in simple, easy-to-understand language
+            6. Signs off as "The ${hospital_name} Care Team"
+
+            Keep it personal but professional, around 100-200 words.
+            """,
+
+    'fallback_summary': """
+        Dear ${name},
+
+        Welcome to your personal post-hospital care system from ${hospital_name}! We're here to support your recovery journey every step of the way.
+
+        Your healthcare team has set up a personalized AI assistant called Prof.Dux to help you with questions about your medications, symptoms, and recovery. Your assistant knows about your medical history and can provide guidance 24/7.
+
+        Your current care plan includes monitoring your health conditions and following your prescribed medication schedule. Prof.Dux will help you stay on track and answer any questions you might have about your recovery.
+
+        Please use the login credentials provided to access your healthcare portal. If you have any concerning symptoms or urgent questions, don't hesitate to reach out to your healthcare team immediately.
+
+        We're committed to supporting your recovery and helping you feel confident about managing your health at home.
+
+        Wishing you a smooth and speedy recovery!
+
+        The ${hospital_name} Care Team
+        """
+}
+
+
+def format_medications(medications: List[Dict]) -> str:
+    """One bullet per medication, as shown in agent memory"""
+    if not medications:
+        return "None prescribed"
+    return '\n'.join([f"  • {med['name']}: {med['dosage']} {med['frequency']}"
+                      for med in medications])
+
+
+def patient_view(patient_data: Dict) -> Dict[str, str]:
+    """Every value a template can use, computed once per patient record"""
+    medications = patient_data.get('medications', [])
+    return {
+        'name': patient_data['name'],
+        'patient_id': patient_data.get('patient_id', 'Not Set'),
+        'email': patient_data.get('email', 'Not provided'),
+        'conditions': ', '.join(patient_data.get('conditions', [])) or 'None listed',
+        'conditions_brief': ', '.join(patient_data.get('conditions', [])) or 'None',
+        'allergies': ', '.join(patient_data.get('allergies', [])) or 'None known',
+        'medication_list': format_medications(medications),
+        'medications_inline': ', '.join([f"{med['name']} ({med['dosage']} {med['frequency']})"
+                                         for med in medications]) or 'None prescribed',
+        'medication_count': str(len(medications)),
+        'discharge_plan': patient_data.get('discharge_plan', 'Standard follow-up care')
+    }
+
+
+def record_hash(patient_data: Dict, **extra) -> str:
+    """Stable hash of the patient fields the templates read, plus any extra values"""
+    fields = {field: patient_data.get(field) for field in PATIENT_VIEW_FIELDS}
+    payload = json.dumps([fields, extra], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CompiledTemplate:
+    """A string.Template parsed once into literal runs and placeholder names
+
+    Rendering joins the pieces instead of re-scanning the template text, and
+    a placeholder missing from the values raises KeyError like
+    Template.substitute does.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        parts: List[Tuple[str, str]] = []
+        literal, position = [], 0
+        for match in string.Template.pattern.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+            if match.group('escaped') is not None:
+                literal.append('$')
+            elif match.group('invalid') is not None:
+                raise ValueError(f"Invalid placeholder in prompt template '{name}' at offset {match.start()}")
+            else:
+                parts.append((''.join(literal), match.group('named') or match.group('braced')))
+                literal = []
+        literal.append(text[position:])
+        self._parts = tuple(parts)
+        self._tail = ''.join(literal)
+        self.fields = frozenset(field for _, field in parts)
+
+    def render(self, values: Dict[str, str]) -> str:
+        return ''.join([literal + values[field] for literal, field in self._parts]) + self._tail
+
+
+COMPILED = {name: CompiledTemplate(name, text) for name, text in TEMPLATES.items()}
+
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def render(template: str, patient_data: Dict, **extra: str) -> str:
+    """Render a named template for a patient, reusing an earlier identical render
+
+    Renders are cached by template, PROMPT_VERSION and a hash of the patient
+    fields the templates read, so refreshing an unchanged patient's context
+    or re-sending their email does no template work.
+    """
+    key = (template, PROMPT_VERSION, record_hash(patient_data, **extra))
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+            return text
+    text = COMPILED[template].render({**patient_view(patient_data), **extra})
+    with _cache_lock:
+        _cache[key] = text
+        while len(_cache) > RENDER_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
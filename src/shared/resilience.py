@@ -0,0 +1,121 @@
+"""
+Resilience Module - Retries with jittered backoff and circuit breaking for calls to remote services
+"""
+
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a failing service until it has had time to recover
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call fails at once with CircuitOpenError for ``reset_timeout``
+    seconds. It then half-opens: ``half_open_calls`` trial calls go through,
+    and the first result either closes the circuit or opens it again.
+    Only failures that say the service is unhealthy should be recorded;
+    an error the service returned on purpose (a 404, say) is a success here.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._trials = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        with self._lock:
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._state = self.HALF_OPEN
+                self._trials = 0
+            if self._state == self.HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._trials += 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                print(f"✅ {self.name} recovered, circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"⚠️ {self.name} failing ({self._failures} in a row), circuit open for "
+                          f"{self.reset_timeout:.0f}s")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff for the given retry (0 for the first retry)"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def call_with_retries(fn: Callable[[], T], *, attempts: int = 3, base_delay: float = 0.5,
+                      max_delay: float = 8.0, is_failure: Callable[[Exception], bool] = None,
+                      is_retryable: Callable[[Exception], bool] = None,
+                      breaker: CircuitBreaker = None) -> T:
+    """Call ``fn`` until it succeeds, it raises a non-retryable error, or attempts run out
+
+    ``is_failure`` decides which errors count against the breaker (by default
+    all of them); ``is_retryable`` decides which are worth another attempt (by
+    default the same ones). An open breaker stops the retries early.
+    """
+    is_failure = is_failure or (lambda e: True)
+    is_retryable = is_retryable or is_failure
+    for attempt in range(max(1, attempts)):
+        if breaker:
+            breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            if breaker and is_failure(e):
+                breaker.record_failure()
+            elif breaker:
+                breaker.record_success()
+            if attempt + 1 >= max(1, attempts) or not is_retryable(e):
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+            continue
+        if breaker:
+            breaker.record_success()
+        return result
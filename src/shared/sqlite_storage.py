@@ -0,0 +1,635 @@
+"""
+SQLite Storage Module - Drop-in replacement for SimpleStorage backed by SQLite
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .models import Patient, ALERT_PRIORITY_RANK
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT UNIQUE,
+    name TEXT NOT NULL UNIQUE,
+    email TEXT UNIQUE,
+    magic_token TEXT,
+    agent_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_patients_magic_token ON patients (magic_token);
+CREATE INDEX IF NOT EXISTS idx_patients_agent_id ON patients (agent_id);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_name TEXT NOT NULL,
+    message TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    first_timestamp TEXT,
+    count INTEGER NOT NULL DEFAULT 1,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_patient_name ON alerts (patient_name);
+CREATE INDEX IF NOT EXISTS idx_alerts_priority ON alerts (priority);
+CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('alert_seq', 0);
+
+CREATE TABLE IF NOT EXISTS nurse_instructions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_name TEXT NOT NULL,
+    instruction TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_instructions_patient_name ON nurse_instructions (patient_name);
+CREATE INDEX IF NOT EXISTS idx_instructions_timestamp ON nurse_instructions (timestamp);
+"""
+
+# Patient fields mirrored into indexed columns next to the JSON record
+PATIENT_COLUMNS = ('patient_id', 'name', 'email', 'magic_token', 'agent_id')
+
+# Columns added after the first release, created on databases that predate them
+ALERT_MIGRATIONS = {
+    'first_timestamp': 'ALTER TABLE alerts ADD COLUMN first_timestamp TEXT',
+    'count': 'ALTER TABLE alerts ADD COLUMN count INTEGER NOT NULL DEFAULT 1',
+    'seq': 'ALTER TABLE alerts ADD COLUMN seq INTEGER NOT NULL DEFAULT 0'
+}
+
+# Statistics counters and hourly rollups, kept current by triggers so reads are O(1).
+# Run after the migrations above since the triggers use the migrated columns.
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hourly_rollups (
+    hour TEXT NOT NULL,
+    series TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hour, series)
+);
+
+INSERT OR IGNORE INTO counters (name, value) SELECT 'patients', COUNT(*) FROM patients;
+INSERT OR IGNORE INTO counters (name, value)
+    SELECT 'active_agents', COUNT(*) FROM patients WHERE agent_id IS NOT NULL AND agent_id != '';
+INSERT OR IGNORE INTO counters (name, value) SELECT 'instructions', COUNT(*) FROM nurse_instructions;
+INSERT OR IGNORE INTO counters (name, value)
+    SELECT 'alerts:' || priority, COUNT(*) FROM alerts GROUP BY priority;
+
+INSERT OR IGNORE INTO hourly_rollups (hour, series, count)
+    SELECT substr(timestamp, 1, 13), 'alerts_' || priority, SUM(count) FROM alerts
+    WHERE timestamp != '' AND NOT EXISTS (SELECT 1 FROM counters WHERE name = 'rollups_seeded')
+    GROUP BY 1, 2;
+INSERT OR IGNORE INTO hourly_rollups (hour, series, count)
+    SELECT substr(timestamp, 1, 13), 'instructions', COUNT(*) FROM nurse_instructions
+    WHERE timestamp != '' AND NOT EXISTS (SELECT 1 FROM counters WHERE name = 'rollups_seeded')
+    GROUP BY 1;
+INSERT OR IGNORE INTO counters (name, value) VALUES ('rollups_seeded', 1);
+
+CREATE TRIGGER IF NOT EXISTS patients_count_insert AFTER INSERT ON patients BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'patients';
+    UPDATE counters SET value = value + 1 WHERE name = 'active_agents' AND COALESCE(NEW.agent_id, '') != '';
+END;
+CREATE TRIGGER IF NOT EXISTS patients_count_delete AFTER DELETE ON patients BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'patients';
+    UPDATE counters SET value = value - 1 WHERE name = 'active_agents' AND COALESCE(OLD.agent_id, '') != '';
+END;
+CREATE TRIGGER IF NOT EXISTS patients_count_agent AFTER UPDATE OF agent_id ON patients BEGIN
+    UPDATE counters SET value = value + (COALESCE(NEW.agent_id, '') != '') - (COALESCE(OLD.agent_id, '') != '')
+    WHERE name = 'active_agents';
+END;
+
+CREATE TRIGGER IF NOT EXISTS alerts_count_insert AFTER INSERT ON alerts BEGIN
+    INSERT INTO counters (name, value) VALUES ('alerts:' || NEW.priority, 1)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1;
+    INSERT INTO hourly_rollups (hour, series, count)
+        VALUES (substr(NEW.timestamp, 1, 13), 'alerts_' || NEW.priority, NEW.count)
+        ON CONFLICT (hour, series) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS alerts_count_coalesce AFTER UPDATE OF count ON alerts
+WHEN NEW.count > OLD.count BEGIN
+    INSERT INTO hourly_rollups (hour, series, count)
+        VALUES (substr(NEW.timestamp, 1, 13), 'alerts_' || NEW.priority, NEW.count - OLD.count)
+        ON CONFLICT (hour, series) DO UPDATE SET count = count + excluded.count;
+END;
+CREATE TRIGGER IF NOT EXISTS alerts_count_delete AFTER DELETE ON alerts BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'alerts:' || OLD.priority;
+END;
+
+CREATE TRIGGER IF NOT EXISTS instructions_count_insert AFTER INSERT ON nurse_instructions BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'instructions';
+    INSERT INTO hourly_rollups (hour, series, count) VALUES (substr(NEW.timestamp, 1, 13), 'instructions', 1)
+        ON CONFLICT (hour, series) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS instructions_count_delete AFTER DELETE ON nurse_instructions BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'instructions';
+END;
+"""
+
+ALERT_FIELDS = 'patient_name, message, priority, timestamp, first_timestamp, count'
+ALERT_RANK_SQL = 'CASE priority ' + ' '.join(
+    f"WHEN '{priority}' THEN {rank}" for priority, rank in ALERT_PRIORITY_RANK.items()
+) + ' ELSE 1 END'
+
+
+class SqliteStorage:
+    """SQLite-backed storage with the same public interface as SimpleStorage
+    
+    Each thread gets its own connection. The database runs in WAL mode so
+    readers in any worker process never block behind a writer. Alerts are
+    coalesced and capped the same way SimpleStorage does it.
+    """
+    
+    # How often alert waiters re-check the database for other processes' changes
+    ALERT_POLL_INTERVAL = 1.0
+    
+    # Hourly rollup buckets kept before the oldest are dropped
+    ROLLUP_RETENTION_HOURS = 24 * 90
+    
+    def __init__(self, filename: str = 'data.db', import_json: Optional[str] = None,
+                 alert_window: float = 300.0, max_alerts: int = 500):
+        self.filename = filename
+        self.alert_window = alert_window
+        self.max_alerts = max_alerts
+        self._local = threading.local()
+        self._alerts_changed = threading.Condition()
+        self._pruned_hour = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(alerts)')}
+            for column, statement in ALERT_MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.executescript(STATS_SCHEMA)
+        if import_json:
+            self._import_json(import_json)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def _import_json(self, json_filename: str):
+        """Seed an empty database from a SimpleStorage JSON file"""
+        conn = self._connect()
+        if conn.execute('SELECT 1 FROM patients LIMIT 1').fetchone():
+            return
+        try:
+            with open(json_filename, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        
+        with conn:
+            for p_data in data.get('patients', []):
+                conn.execute(
+                    'INSERT OR IGNORE INTO patients (patient_id, name, email, magic_token, agent_id, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    self._patient_row(p_data)
+                )
+            conn.executemany(
+                f'INSERT INTO alerts ({ALERT_FIELDS}) VALUES (?, ?, ?, ?, ?, ?)',
+                [(a.get('patient_name'), a.get('message'), a.get('priority', 'medium'), a.get('timestamp', ''),
+                  a.get('first_timestamp'), a.get('count', 1))
+                 for a in data.get('alerts', [])]
+            )
+            conn.executemany(
+                'INSERT INTO nurse_instructions (patient_name, instruction, timestamp) VALUES (?, ?, ?)',
+                [(i.get('patient_name'), i.get('instruction'), i.get('timestamp', ''))
+                 for i in data.get('nurse_instructions', [])]
+            )
+        print(f"✅ Imported {json_filename} into {self.filename}")
+    
+    @staticmethod
+    def _patient_row(p_data: Dict) -> tuple:
+        return tuple(p_data.get(column) for column in PATIENT_COLUMNS) + (json.dumps(p_data),)
+    
+    def _fetch_patient(self, column: str, value) -> Optional[Dict]:
+        """Return the raw patient record where column=value"""
+        if value is None or column not in PATIENT_COLUMNS:
+            return None
+        row = self._connect().execute(
+            f'SELECT data FROM patients WHERE {column} = ?', (value,)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+    
+    def _write_patient(self, conn: sqlite3.Connection, name: str, p_data: Dict):
+        conn.execute(
+            'UPDATE patients SET patient_id = ?, name = ?, email = ?, magic_token = ?, agent_id = ?, data = ? '
+            'WHERE name = ?',
+            self._patient_row(p_data) + (name,)
+        )
+    
+    def _update_patient_fields(self, name: str, fields: Dict):
+        conn = self._connect()
+        with conn:
+            row = conn.execute('SELECT data FROM patients WHERE name = ?', (name,)).fetchone()
+            if row:
+                p_data = json.loads(row['data'])
+                p_data.update(fields)
+                self._write_patient(conn, name, p_data)
+    
+    def add_patient(self, patient: Patient):
+        """Add a new patient to storage"""
+        # Check if patient ID already exists
+        if self._fetch_patient('patient_id', patient.patient_id):
+            raise ValueError(f"Patient ID '{patient.patient_id}' already exists")
+        
+        # Check if patient name already exists
+        if self._fetch_patient('name', patient.name):
+            raise ValueError(f"Patient name '{patient.name}' already exists")
+        
+        # Check if email already exists
+        if self._fetch_patient('email', patient.email):
+            raise ValueError(f"Email '{patient.email}' already exists")
+        
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO patients (patient_id, name, email, magic_token, agent_id, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    self._patient_row(patient.to_dict())
+                )
+        except sqlite3.IntegrityError as e:
+            # Another worker won the race between our check and the insert
+            raise ValueError(f"Patient '{patient.name}' already exists: {e}")
+    
+    def get_patients(self) -> List[Patient]:
+        """Get all patients"""
+        rows = self._connect().execute('SELECT data FROM patients ORDER BY id').fetchall()
+        return [Patient.from_dict(json.loads(row['data'])) for row in rows]
+    
+    def get_patient_by_name(self, name: str) -> Optional[Patient]:
+        """Get patient by name"""
+        p_data = self._fetch_patient('name', name)
+        return Patient.from_dict(p_data) if p_data else None
+    
+    def get_patient_by_id(self, patient_id: str) -> Optional[Patient]:
+        """Get patient by patient ID"""
+        p_data = self._fetch_patient('patient_id', patient_id)
+        return Patient.from_dict(p_data) if p_data else None
+    
+    def get_patient_by_token(self, token: str) -> Optional[Patient]:
+        """Get patient by magic token"""
+        p_data = self._fetch_patient('magic_token', token)
+        if p_data:
+            patient = Patient.from_dict(p_data)
+            if patient.is_token_valid():
+                return patient
+        return None
+    
+    def authenticate_patient(self, patient_id: str, password: str) -> Optional[Patient]:
+        """Authenticate patient with Patient ID and password"""
+        p_data = self._fetch_patient('patient_id', patient_id)
+        if p_data and p_data.get('password') == password:
+            return Patient.from_dict(p_data)
+        return None
+    
+    def get_patient_credentials(self, patient_name: str) -> Optional[Dict[str, str]]:
+        """Get patient credentials by name"""
+        p_data = self._fetch_patient('name', patient_name)
+        if p_data:
+            return {
+                'patient_id': p_data.get('patient_id'),
+                'password': p_data.get('password'),
+                'magic_token': p_data.get('magic_token')
+            }
+        return None
+    
+    def update_patient_credentials(self, patient_name: str, password: str = None, magic_token: str = None):
+        """Update patient credentials"""
+        fields = {}
+        if password:
+            fields['password'] = password
+        if magic_token:
+            fields['magic_token'] = magic_token
+        if fields:
+            self._update_patient_fields(patient_name, fields)
+    
+    def update_patient(self, patient: Patient):
+        """Update existing patient data"""
+        conn = self._connect()
+        with conn:
+            self._write_patient(conn, patient.name, patient.to_dict())
+    
+    def delete_patient(self, patient_name: str) -> bool:
+        """Delete a patient and all associated data"""
+        conn = self._connect()
+        with conn:
+            deleted = conn.execute('DELETE FROM patients WHERE name = ?', (patient_name,)).rowcount
+            if not deleted:
+                return False  # Patient not found
+            if conn.execute('DELETE FROM alerts WHERE patient_name = ?', (patient_name,)).rowcount:
+                self._next_alert_seq(conn)
+            conn.execute('DELETE FROM nurse_instructions WHERE patient_name = ?', (patient_name,))
+        self._notify_alerts()
+        return True
+    
+    def update_patient_agent_id(self, name: str, agent_id: str):
+        """Update patient's agent ID"""
+        self._update_patient_fields(name, {'agent_id': agent_id})
+    
+    def update_conversation_state(self, patient_name: str, context_primed: bool = None,
+                                  last_message_id: str = None):
+        """Record whether the agent context is primed and the last seen message id"""
+        fields = {}
+        if context_primed is not None:
+            fields['context_primed'] = context_primed
+        if last_message_id:
+            fields['last_message_id'] = last_message_id
+        if fields:
+            self._update_patient_fields(patient_name, fields)
+    
+    def get_patients_for_login(self) -> List[Dict]:
+        """Get simplified patient list for login page"""
+        rows = self._connect().execute(
+            "SELECT name, patient_id FROM patients WHERE agent_id IS NOT NULL AND agent_id != '' ORDER BY id"
+        ).fetchall()
+        return [{'name': row['name'], 'patient_id': row['patient_id'] or 'Unknown'} for row in rows]
+    
+    def add_alert(self, patient_name: str, message: str, priority: str = 'medium'):
+        """Add an alert for a patient, or fold it into a recent one for the same patient and priority"""
+        now = datetime.datetime.now()
+        timestamp = now.isoformat()
+        window_start = (now - datetime.timedelta(seconds=self.alert_window)).isoformat()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # Read and write under one lock across processes
+            recent = conn.execute(
+                'SELECT id FROM alerts WHERE patient_name = ? AND priority = ? '
+                'AND COALESCE(first_timestamp, timestamp) > ? ORDER BY id DESC LIMIT 1',
+                (patient_name, priority, window_start)
+            ).fetchone()
+            seq = self._next_alert_seq(conn)
+            if recent:
+                conn.execute(
+                    'UPDATE alerts SET count = count + 1, message = ?, timestamp = ?, seq = ?, '
+                    'first_timestamp = COALESCE(first_timestamp, timestamp) WHERE id = ?',
+                    (message, timestamp, seq, recent['id'])
+                )
+            else:
+                conn.execute(
+                    f'INSERT INTO alerts ({ALERT_FIELDS}, seq) VALUES (?, ?, ?, ?, ?, 1, ?)',
+                    (patient_name, message, priority, timestamp, timestamp, seq)
+                )
+                if self.max_alerts:
+                    # Over the cap: drop the oldest of the least urgent alerts
+                    conn.execute(
+                        f'DELETE FROM alerts WHERE id IN (SELECT id FROM alerts ORDER BY {ALERT_RANK_SQL} DESC, id '
+                        'LIMIT MAX(0, (SELECT COUNT(*) FROM alerts) - ?))',
+                        (self.max_alerts,)
+                    )
+            self._prune_rollups(conn, timestamp)
+        self._notify_alerts()
+    
+    def get_alerts(self) -> List[Dict]:
+        """Get all alerts"""
+        rows = self._connect().execute(
+            f'SELECT id, {ALERT_FIELDS}, seq FROM alerts ORDER BY id'
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    @staticmethod
+    def _next_alert_seq(conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'alert_seq'")
+        return conn.execute("SELECT value FROM counters WHERE name = 'alert_seq'").fetchone()[0]
+    
+    def _prune_rollups(self, conn: sqlite3.Connection, timestamp: str):
+        """Drop the oldest hourly buckets beyond the retention, once per new hour"""
+        hour = timestamp[:13]
+        if hour == self._pruned_hour:
+            return
+        conn.execute(
+            'DELETE FROM hourly_rollups WHERE hour < (SELECT hour FROM '
+            '(SELECT DISTINCT hour FROM hourly_rollups ORDER BY hour DESC LIMIT 1 OFFSET ?))',
+            (self.ROLLUP_RETENTION_HOURS - 1,)
+        )
+        self._pruned_hour = hour
+    
+    def _notify_alerts(self):
+        with self._alerts_changed:
+            self._alerts_changed.notify_all()
+    
+    def get_alert_seq(self) -> int:
+        """Sequence number that advances on every change to the alerts list"""
+        return self._connect().execute("SELECT value FROM counters WHERE name = 'alert_seq'").fetchone()[0]
+    
+    def get_alert_updates(self, since: int) -> Dict:
+        """Alerts created or coalesced after ``since``, plus the ids still present"""
+        conn = self._connect()
+        with conn:  # One read transaction so seq, changes and ids agree
+            conn.execute('BEGIN')
+            seq = self.get_alert_seq()
+            rows = conn.execute(
+                f'SELECT id, {ALERT_FIELDS}, seq FROM alerts WHERE seq > ? ORDER BY id', (since,)
+            ).fetchall()
+            ids = [row[0] for row in conn.execute('SELECT id FROM alerts ORDER BY id')]
+        return {'seq': seq, 'alerts': [dict(row) for row in rows], 'ids': ids}
+    
+    def wait_for_alerts(self, since: int, timeout: float) -> int:
+        """Block until alert_seq passes ``since`` or ``timeout`` runs out; return alert_seq"""
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.get_alert_seq()
+            remaining = deadline - time.monotonic()
+            if seq > since or remaining <= 0:
+                return seq
+            with self._alerts_changed:
+                self._alerts_changed.wait(min(remaining, self.ALERT_POLL_INTERVAL))
+    
+    def clear_alerts(self):
+        """Clear all alerts"""
+        conn = self._connect()
+        with conn:
+            if conn.execute('DELETE FROM alerts').rowcount:
+                self._next_alert_seq(conn)
+        self._notify_alerts()
+    
+    def remove_alert(self, index: int):
+        """Remove a specific alert by index"""
+        if index < 0:
+            return
+        conn = self._connect()
+        with conn:
+            if conn.execute(
+                'DELETE FROM alerts WHERE id = (SELECT id FROM alerts ORDER BY id LIMIT 1 OFFSET ?)',
+                (index,)
+            ).rowcount:
+                self._next_alert_seq(conn)
+        self._notify_alerts()
+    
+    def archive_expired(self, archive, alerts_before: str = None,
+                        instructions_before: str = None) -> Dict[str, int]:
+        """Move alerts and nurse instructions older than the cutoffs into ``archive``
+        
+        Cutoffs are ISO timestamps; an alert's age is its latest repeat. The
+        records are written to the archive before the transaction deleting
+        them commits, so a crash in between leaves a duplicate, not a gap.
+        """
+        expired = {'alerts': [], 'nurse_instructions': []}
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # No other writer can add or remove rows meanwhile
+            if alerts_before:
+                expired['alerts'] = [dict(row) for row in conn.execute(
+                    f'SELECT id, {ALERT_FIELDS}, seq FROM alerts WHERE timestamp < ? ORDER BY id', (alerts_before,)
+                )]
+            if instructions_before:
+                expired['nurse_instructions'] = [dict(row) for row in conn.execute(
+                    'SELECT id, patient_name, instruction, timestamp FROM nurse_instructions '
+                    'WHERE timestamp < ? ORDER BY id', (instructions_before,)
+                )]
+            for kind, records in expired.items():
+                if records:
+                    archive.write(kind, records)
+            if expired['alerts']:
+                conn.execute('DELETE FROM alerts WHERE timestamp < ?', (alerts_before,))
+                self._next_alert_seq(conn)
+            if expired['nurse_instructions']:
+                conn.execute('DELETE FROM nurse_instructions WHERE timestamp < ?', (instructions_before,))
+        if expired['alerts']:
+            self._notify_alerts()
+        return {kind: len(records) for kind, records in expired.items()}
+    
+    def add_nurse_instruction(self, patient_name: str, instruction: str):
+        """Store nurse instructions for patients"""
+        timestamp = datetime.datetime.now().isoformat()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO nurse_instructions (patient_name, instruction, timestamp) VALUES (?, ?, ?)',
+                (patient_name, instruction, timestamp)
+            )
+            self._prune_rollups(conn, timestamp)
+    
+    def get_nurse_instructions(self, patient_name: str) -> List[Dict]:
+        """Get nurse instructions for a specific patient"""
+        rows = self._connect().execute(
+            'SELECT id, patient_name, instruction, timestamp FROM nurse_instructions '
+            'WHERE patient_name = ? ORDER BY id',
+            (patient_name,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    # ---- Paginated queries ----
+    
+    def query_patients(self, cursor: str = None, limit: int = 50, has_agent: bool = None) -> Dict:
+        """One page of patient records ordered by name, starting after ``cursor`` (a name)"""
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append('name > ?')
+            params.append(cursor)
+        if has_agent is not None:
+            clauses.append("agent_id IS NOT NULL AND agent_id != ''" if has_agent
+                           else "(agent_id IS NULL OR agent_id = '')")
+        rows = self._page_rows('patients', 'data, name', clauses, params, 'name', limit)
+        items = [json.loads(row['data']) for row in rows[:limit]]
+        return {'items': items, 'next_cursor': items[-1]['name'] if len(rows) > limit else None}
+    
+    def query_alerts(self, cursor: int = None, limit: int = 50, priority: str = None,
+                     patient_name: str = None, since: str = None, until: str = None) -> Dict:
+        """One page of alerts, newest first, with ids below ``cursor``"""
+        return self._page_newest_first('alerts', f'id, {ALERT_FIELDS}, seq', cursor, limit, since, until,
+                                       priority=priority, patient_name=patient_name)
+    
+    def query_nurse_instructions(self, cursor: int = None, limit: int = 50, patient_name: str = None,
+                                 since: str = None, until: str = None) -> Dict:
+        """One page of nurse instructions, newest first, with ids below ``cursor``"""
+        return self._page_newest_first('nurse_instructions', 'id, patient_name, instruction, timestamp',
+                                       cursor, limit, since, until, patient_name=patient_name)
+    
+    def _page_newest_first(self, table: str, columns: str, cursor: Optional[int], limit: int,
+                           since: str = None, until: str = None, **equals) -> Dict:
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append('id < ?')
+            params.append(cursor)
+        if since:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        for column, value in equals.items():
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        rows = self._page_rows(table, columns, clauses, params, 'id DESC', limit)
+        items = [dict(row) for row in rows[:limit]]
+        return {'items': items, 'next_cursor': items[-1]['id'] if len(rows) > limit else None}
+    
+    def _page_rows(self, table: str, columns: str, clauses: List[str], params: list, order: str, limit: int):
+        """Fetch one row past the page so callers know whether another page follows"""
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        return self._connect().execute(
+            f'SELECT {columns} FROM {table}{where} ORDER BY {order} LIMIT ?', params + [limit + 1]
+        ).fetchall()
+    
+    def validate_patient_id(self, patient_id: str) -> bool:
+        """Validate that patient ID is unique and properly formatted"""
+        if not patient_id or not patient_id.strip():
+            return False
+        
+        # Check if ID already exists
+        return self._fetch_patient('patient_id', patient_id) is None
+    
+    def validate_email(self, email: str) -> bool:
+        """Validate that email is unique"""
+        if not email or not email.strip():
+            return False
+        
+        # Check if email already exists
+        return self._fetch_patient('email', email) is None
+    
+    def get_statistics(self) -> Dict:
+        """Get system statistics from counters kept up to date by triggers"""
+        counters = dict(self._connect().execute(
+            "SELECT name, value FROM counters WHERE name IN ('patients', 'active_agents', 'instructions') "
+            "OR name LIKE 'alerts:%'"
+        ).fetchall())
+        by_priority = {name.split(':', 1)[1]: value for name, value in counters.items()
+                       if name.startswith('alerts:') and value}
+        return {
+            'total_patients': counters.get('patients', 0),
+            'active_agents': counters.get('active_agents', 0),
+            'total_alerts': sum(by_priority.values()),
+            'high_priority_alerts': by_priority.get('high', 0),
+            'alerts_by_priority': by_priority,
+            'total_instructions': counters.get('instructions', 0)
+        }
+    
+    def get_hourly_rollups(self, since: str = None, until: str = None) -> List[Dict]:
+        """Alert (per priority) and instruction counts per hour, oldest first
+        
+        ``since``/``until`` are ISO timestamps; buckets are keyed by their hour
+        (``YYYY-MM-DDTHH``). Coalesced repeats count as separate alerts here.
+        """
+        clauses, params = [], []
+        if since:
+            clauses.append('hour >= ?')
+            params.append(since[:13])
+        if until:
+            clauses.append("hour || ':00:00' < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        rollups: Dict[str, Dict[str, int]] = {}
+        for row in self._connect().execute(
+            f'SELECT hour, series, count FROM hourly_rollups{where} ORDER BY hour', params
+        ):
+            rollups.setdefault(row['hour'], {})[row['series']] = row['count']
+        return [{'hour': hour, 'counts': counts} for hour, counts in rollups.items()]
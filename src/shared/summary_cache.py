@@ -0,0 +1,113 @@
+"""
+Summary Cache Module - Content-addressed store for generated medical summaries
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_created_at ON summaries (created_at);
+"""
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+def _normalise(value) -> str:
+    """Lowercase with punctuation as spaces and whitespace collapsed ("Follow-up." == "follow up")"""
+    return ' '.join(PUNCTUATION.sub(' ', str(value or '').lower()).split())
+
+
+def summary_key(patient_data: Dict, **context) -> str:
+    """Hash of the patient fields a summary is written from, insensitive to order, case and punctuation
+
+    ``context`` holds whatever else shapes the summary (prompt version,
+    hospital, model) so a change to any of them misses the cache.
+    """
+    medications = patient_data.get('medications', [])
+    payload = {
+        'name': _normalise(patient_data.get('name')),
+        'conditions': sorted(_normalise(c) for c in patient_data.get('conditions', [])),
+        'allergies': sorted(_normalise(a) for a in patient_data.get('allergies', [])),
+        'medications': sorted(_normalise(f"{m.get('name')} {m.get('dosage')} {m.get('frequency')}")
+                              for m in medications),
+        'discharge_plan': _normalise(patient_data.get('discharge_plan')),
+        'context': context
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SummaryCache:
+    """In-memory LRU of summaries, persisted to SQLite so restarts and other workers reuse them
+
+    ``filename=None`` keeps the cache in memory only. The file keeps at most
+    ``max_stored`` summaries, dropping the oldest first.
+    """
+
+    def __init__(self, filename: str = None, max_entries: int = 1024, max_stored: int = 50000):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_stored = max_stored
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        if filename:
+            self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._memory.get(key)
+            if summary is not None:
+                self._memory.move_to_end(key)
+                return summary
+        if not self.filename:
+            return None
+        row = self._connect().execute('SELECT summary FROM summaries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def put(self, key: str, summary: str):
+        self._remember(key, summary)
+        if not self.filename:
+            return
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO summaries (key, summary, created_at) VALUES (?, ?, ?)',
+                     (key, summary, time.time()))
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 500 == 0
+        if prune:
+            conn.execute('DELETE FROM summaries WHERE key IN '
+                         '(SELECT key FROM summaries ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                         (self.max_stored,))
+
+    def _remember(self, key: str, summary: str):
+        with self._lock:
+            self._memory[key] = summary
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
@@ -71,25 +71,13 @@ document.getElementById('createPatientForm').addEventListener('submit', async (e
         const result = await response.json();
         
         if (result.success) {
-            let message = `Patient agent created successfully for ${data.name}!`;
-            
-            // Add warnings if any services failed
-            if (result.warnings) {
-                if (result.warnings.letta_agent) {
-                    message += '\n\n⚠️ Warning: AI agent creation failed - patient can still login but chat may not work.';
-                }
-                if (result.warnings.email_delivery) {
-                    message += '\n\n⚠️ Warning: Email delivery failed - please share credentials manually:';
-                    message += `\nEmail: ${data.email}`;
-                    message += `\nPassword: ${result.password}`;
-                    message += `\nMagic Token: ${result.magic_token}`;
-                }
-            } else {
-                message += `\n\nCredentials and medical summary have been sent to ${data.email}`;
-            }
-            
-            alert(message);
-            location.reload();
+            // Agent setup and email delivery continue in the background
+            e.target.reset();
+            trackOnboardingJob(result.job_id, data.name, {
+                email: data.email,
+                password: result.password,
+                magic_token: result.magic_token
+            });
         } else {
             alert('Error: ' + result.error);
         }
@@ -102,6 +90,230 @@ document.getElementById('createPatientForm').addEventListener('submit', async (e
     }
 });
 
+// Onboarding job progress
+const ONBOARDING_STEP_LABELS = {
+    agent: 'AI agent',
+    summary: 'Medical summary',
+    email: 'Credentials email'
+};
+
+function renderOnboardingJob(job, patientName, credentials) {
+    let row = document.getElementById(`job-${job.id}`);
+    if (!row) {
+        row = document.createElement('div');
+        row.id = `job-${job.id}`;
+        document.getElementById('onboardingJobs').prepend(row);
+    }
+    
+    const finished = job.status === 'succeeded' || job.status === 'failed';
+    row.className = `onboarding-job job-${job.status}`;
+    
+    const title = document.createElement('strong');
+    title.textContent = finished
+        ? `${patientName}: onboarding ${job.status === 'succeeded' ? 'complete' : 'finished with problems'}`
+        : `${patientName}: onboarding in progress...`;
+    
+    const steps = document.createElement('div');
+    steps.className = 'onboarding-steps';
+    job.steps.forEach(step => {
+        const badge = document.createElement('span');
+        badge.className = `onboarding-step step-${step.status}`;
+        badge.textContent = `${ONBOARDING_STEP_LABELS[step.name] || step.name}: ${step.status}`;
+        if (step.error) badge.title = step.error;
+        steps.appendChild(badge);
+    });
+    
+    row.replaceChildren(title, steps);
+    
+    const failedSteps = job.steps.filter(step => step.status === 'failed').map(step => step.name);
+    let note = '';
+    if (failedSteps.includes('agent')) {
+        note += '⚠️ Warning: AI agent creation failed - patient can still login but chat may not work.\n';
+    }
+    if (failedSteps.includes('email')) {
+        note += '⚠️ Warning: Email delivery failed - please share credentials manually';
+        if (credentials) {
+            note += `:\nEmail: ${credentials.email}\nPassword: ${credentials.password}\nMagic Token: ${credentials.magic_token}`;
+        }
+    }
+    if (note) {
+        const noteDiv = document.createElement('div');
+        noteDiv.className = 'onboarding-note';
+        noteDiv.textContent = note;
+        row.appendChild(noteDiv);
+    }
+    
+    return finished;
+}
+
+async function trackOnboardingJob(jobId, patientName, credentials) {
+    while (true) {
+        try {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const job = await response.json();
+            if (job.error && !job.steps) {
+                console.error('Error polling onboarding job:', job.error);
+                return;
+            }
+            if (renderOnboardingJob(job, patientName, credentials)) {
+                if (job.status === 'succeeded') {
+                    await showPatientCard(patientName);
+                }
+                return;
+            }
+        } catch (error) {
+            console.error('Error polling onboarding job:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
+async function resumeOnboardingJobs() {
+    try {
+        const response = await fetch('/api/jobs?active=1');
+        const result = await response.json();
+        (result.jobs || []).filter(job => job.kind === 'onboard_patient').forEach(job => {
+            trackOnboardingJob(job.id, job.payload.patient_name, null);
+        });
+    } catch (error) {
+        console.error('Error loading onboarding jobs:', error);
+    }
+}
+
+// Patient cards
+function findPatientCard(patientName) {
+    return Array.from(document.querySelectorAll('.patient-card'))
+        .find(card => card.dataset.patientName === patientName);
+}
+
+function updatePatientCount(delta) {
+    const counter = document.getElementById('patientCount');
+    counter.textContent = Math.max(0, parseInt(counter.textContent, 10) + delta);
+    const empty = document.querySelector('#patientsList .no-patients');
+    empty.hidden = document.querySelector('#patientsList .patient-card') !== null;
+}
+
+function insertPatientCard(card) {
+    const existing = findPatientCard(card.dataset.patientName);
+    if (existing) {
+        existing.replaceWith(card);
+        return false;
+    }
+    const list = document.getElementById('patientsList');
+    list.insertBefore(card, list.querySelector('.no-patients'));
+    return true;
+}
+
+let loadingPatients = false;
+
+async function loadMorePatients() {
+    const more = document.getElementById('patientsMore');
+    const cursor = more.dataset.nextCursor;
+    if (!cursor || loadingPatients) return;
+    loadingPatients = true;
+    try {
+        const response = await fetch(`/nurse/patient_cards?cursor=${encodeURIComponent(cursor)}`);
+        if (!response.ok) return;
+        const template = document.createElement('template');
+        template.innerHTML = await response.text();
+        // Cards added live (e.g. after onboarding) may already be on the page
+        Array.from(template.content.children).forEach(card => insertPatientCard(card));
+        more.dataset.nextCursor = response.headers.get('X-Next-Cursor') || '';
+        more.hidden = !more.dataset.nextCursor;
+    } catch (error) {
+        console.error('Error loading patients:', error);
+    } finally {
+        loadingPatients = false;
+    }
+}
+
+function watchPatientsEnd() {
+    const more = document.getElementById('patientsMore');
+    if (!more || !window.IntersectionObserver) return;
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadMorePatients();
+    }, { rootMargin: '400px' }).observe(more);
+}
+
+async function showPatientCard(patientName) {
+    if (!patientName) return;
+    try {
+        const response = await fetch(`/nurse/patient_card?name=${encodeURIComponent(patientName)}`);
+        if (!response.ok) return;
+        const template = document.createElement('template');
+        template.innerHTML = (await response.text()).trim();
+        if (insertPatientCard(template.content.firstElementChild)) {
+            updatePatientCount(1);
+        }
+    } catch (error) {
+        console.error('Error loading patient card:', error);
+    }
+}
+
+function removePatientCard(patientName) {
+    const card = findPatientCard(patientName);
+    if (card) card.remove();
+    updatePatientCount(-1);
+}
+
+// Live alert feed
+function renderAlert(alert) {
+    const div = document.createElement('div');
+    div.className = `alert alert-${alert.priority}`;
+    div.dataset.alertId = alert.id;
+    
+    const name = document.createElement('strong');
+    name.textContent = `${alert.patient_name}:`;
+    div.append(name, ` ${alert.message} `);
+    
+    if (alert.count > 1) {
+        const count = document.createElement('span');
+        count.className = 'alert-count';
+        count.textContent = `×${alert.count}`;
+        count.title = `Repeated since ${(alert.first_timestamp || '').slice(0, 19)}`;
+        div.appendChild(count);
+    }
+    
+    const time = document.createElement('span');
+    time.className = 'alert-time';
+    time.textContent = (alert.timestamp || '').slice(0, 19);
+    div.appendChild(time);
+    return div;
+}
+
+function applyAlertUpdates(updates) {
+    const container = document.getElementById('alerts');
+    const empty = container.querySelector('.no-alerts');
+    const present = new Set(updates.ids.map(String));
+    
+    container.querySelectorAll('.alert').forEach(div => {
+        if (!present.has(div.dataset.alertId)) div.remove();
+    });
+    
+    updates.alerts.forEach(alert => {
+        const div = renderAlert(alert);
+        div.classList.add('alert-new');
+        const existing = container.querySelector(`.alert[data-alert-id="${alert.id}"]`);
+        if (existing) {
+            existing.replaceWith(div);
+        } else {
+            container.insertBefore(div, empty);
+        }
+    });
+    
+    empty.hidden = container.querySelector('.alert') !== null;
+    container.dataset.alertSeq = updates.seq;
+}
+
+function connectAlertFeed() {
+    const container = document.getElementById('alerts');
+    if (!container || !window.EventSource) return;
+    const source = new EventSource(`/api/alerts/stream?since=${container.dataset.alertSeq || 0}`);
+    source.addEventListener('alerts', event => {
+        applyAlertUpdates(JSON.parse(event.data));
+    });
+}
+
 async function sendInstruction(patientName) {
     const textarea = document.querySelector(`[data-patient="${patientName}"]`);
     const instruction = textarea.value.trim();
@@ -160,7 +372,7 @@ async function deletePatient() {
         
         if (result.success) {
             alert(`Patient ${patientToDelete} deleted successfully!`);
-            location.reload();
+            removePatientCard(patientToDelete);
         } else {
             alert('Error: ' + result.error);
         }
@@ -234,6 +446,10 @@ function hideValidationError(input) {
 
 // Add event listeners for validation
 document.addEventListener('DOMContentLoaded', function() {
+    resumeOnboardingJobs();
+    connectAlertFeed();
+    watchPatientsEnd();
+    
     const patientIdInput = document.querySelector('input[name="patient_id"]');
     if (patientIdInput) {
         patientIdInput.addEventListener('input', function() {
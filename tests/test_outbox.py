@@ -0,0 +1,172 @@
+"""
+Outbox tests - the email outbox delivering to the fake Brevo transport
+"""
+
+import time
+
+import pytest
+
+from shared.fake_brevo import FakeTransactionalEmailsApi
+from shared.outbox import EmailOutbox, RateLimiter
+
+SENDER = {'name': 'Care Team', 'email': 'care@example.com'}
+
+
+@pytest.fixture
+def brevo():
+    return FakeTransactionalEmailsApi()
+
+
+@pytest.fixture
+def outbox(brevo, tmp_path):
+    outbox = EmailOutbox(brevo, filename=str(tmp_path / 'outbox.db'), rate=0, base_delay=0, max_delay=0,
+                         max_attempts=3, poll_interval=0.05)
+    yield outbox
+    outbox.stop(timeout=5)
+
+
+def enqueue(outbox, n, body='<p>Welcome</p>'):
+    return [outbox.enqueue(f"patient{i}@example.com", f"Patient {i}", f"Welcome {i}", body, SENDER)
+            for i in range(n)]
+
+
+def statuses(outbox):
+    return {row['id']: row['status'] for row in outbox._connect().execute('SELECT id, status FROM outbox')}
+
+
+def test_enqueue_only_queues(outbox, brevo):
+    ids = enqueue(outbox, 2)
+
+    assert outbox.depth() == 2
+    assert outbox.stats()['queued'] == 2
+    assert set(statuses(outbox).values()) == {'queued'}
+    assert brevo.calls == 0
+    assert len(set(ids)) == 2
+
+
+def test_emails_with_the_same_body_go_in_one_call(outbox, brevo):
+    enqueue(outbox, 3)
+    enqueue(outbox, 1, body='<p>Something else</p>')
+
+    assert outbox.send_batch() == 3
+    assert outbox.send_batch() == 1
+    assert outbox.send_batch() == 0
+    assert brevo.calls == 2
+    batch = brevo.sent[:3]
+    assert [email['email'] for email in batch] == [f"patient{i}@example.com" for i in range(3)]
+    assert [email['subject'] for email in batch] == ['Welcome 0', 'Welcome 1', 'Welcome 2']
+    assert len({email['message_id'] for email in batch}) == 3
+    assert outbox.stats()['sent'] == 4
+    assert outbox.depth() == 0
+
+
+def test_batch_size_caps_recipients_per_call(brevo, tmp_path):
+    outbox = EmailOutbox(brevo, filename=str(tmp_path / 'outbox.db'), batch_size=2, rate=0)
+    enqueue(outbox, 5)
+
+    assert [outbox.send_batch() for _ in range(4)] == [2, 2, 1, 0]
+    assert brevo.calls == 3
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retryable_error_is_sent_on_a_later_attempt(outbox, brevo, status):
+    [email_id] = enqueue(outbox, 1)
+    brevo.fail_next(status)
+
+    outbox.send_batch()
+    row = outbox._connect().execute('SELECT * FROM outbox WHERE id = ?', (email_id,)).fetchone()
+    assert row['status'] == 'queued'
+    assert row['attempts'] == 1
+    assert str(status) in row['error']
+
+    outbox.send_batch()
+    row = outbox._connect().execute('SELECT * FROM outbox WHERE id = ?', (email_id,)).fetchone()
+    assert row['status'] == 'sent'
+    assert row['attempts'] == 2
+    assert row['error'] is None
+    assert [email['email'] for email in brevo.sent] == ['patient0@example.com']
+
+
+def test_retry_waits_for_backoff(brevo, tmp_path):
+    outbox = EmailOutbox(brevo, filename=str(tmp_path / 'outbox.db'), rate=0, base_delay=60, max_delay=60)
+    enqueue(outbox, 1)
+    brevo.fail_next(503)
+
+    outbox.send_batch()
+    assert outbox.send_batch() == 0  # Not due yet
+    assert outbox.depth() == 1
+
+
+def test_rejected_email_is_kept_as_failed(outbox, brevo):
+    [email_id] = enqueue(outbox, 1)
+    brevo.fail_next(400)
+
+    outbox.send_batch()
+    assert statuses(outbox) == {email_id: 'failed'}
+    assert outbox.send_batch() == 0
+    [failed] = outbox.failed()
+    assert failed['id'] == email_id
+    assert failed['to']['email'] == 'patient0@example.com'
+    assert failed['attempts'] == 1
+    assert brevo.sent == []
+
+
+def test_email_fails_after_max_attempts(outbox, brevo):
+    [email_id] = enqueue(outbox, 1)
+    brevo.fail_next(503, times=3)
+
+    for _ in range(3):
+        outbox.send_batch()
+    assert statuses(outbox) == {email_id: 'failed'}
+    assert outbox.failed()[0]['attempts'] == 3
+    assert brevo.calls == 3
+
+
+def test_rejected_batch_is_retried_one_email_at_a_time(outbox, brevo):
+    ids = enqueue(outbox, 3)
+    brevo.fail_next(400)  # The batch call
+    brevo.fail_next(400)  # The first email on its own
+
+    outbox.send_batch()
+    assert set(statuses(outbox).values()) == {'queued'}
+
+    while outbox.send_batch():
+        pass
+    assert statuses(outbox) == {ids[0]: 'failed', ids[1]: 'sent', ids[2]: 'sent'}
+    assert brevo.calls == 4
+
+
+def test_retry_failed_queues_failed_emails_again(outbox, brevo):
+    [email_id] = enqueue(outbox, 1)
+    brevo.fail_next(400)
+    outbox.send_batch()
+
+    assert outbox.retry_failed() == 1
+    outbox.send_batch()
+    assert statuses(outbox) == {email_id: 'sent'}
+
+
+def test_background_sender_drains_the_queue(outbox, brevo):
+    outbox.start()
+    enqueue(outbox, 4)
+    brevo.fail_next(503)
+
+    assert outbox.drain(timeout=5)
+    assert outbox.stats()['sent'] == 4
+    assert len(brevo.sent) == 4
+
+
+def test_rate_limiter_spaces_out_recipients():
+    limiter = RateLimiter(rate=100)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(5)
+    # The first call goes at once; the next two wait 5 / 100 seconds each
+    assert time.monotonic() - started >= 0.09
+
+
+def test_rate_limiter_without_a_cap_never_waits():
+    limiter = RateLimiter(rate=0)
+    started = time.monotonic()
+    limiter.acquire(1000)
+    assert time.monotonic() - started < 0.05